@@ -0,0 +1,15 @@
+
+"""
+Benchmarks for supyrdupyr.
+
+The suite builds a synthetic headless world and measures entity events,
+IO fires and world ticks, writing JSON results that can be compared:
+
+    python -m benchmarks.run -o before.json
+    python -m benchmarks.run -o after.json
+    python -m benchmarks.run --compare before.json after.json
+
+Microbenchmarks can also be run directly, for example:
+
+    python -m benchmarks.messenger
+"""
@@ -0,0 +1,100 @@
+
+"""
+Timing, statistics and result files shared by the benchmarks.
+
+Results are JSON files holding the parameters of the run and, for every
+benchmark, the mean, median and p99 latency in seconds and the throughput.
+compareResults() flags benchmarks whose throughput dropped or whose p99
+latency grew by more than a threshold.
+"""
+
+import json
+import math
+import platform
+import time
+from timeit import default_timer
+
+def percentile(sortedSamples, fraction):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    index = min(len(sortedSamples) - 1, max(0, int(math.ceil(fraction * len(sortedSamples))) - 1))
+    return sortedSamples[index]
+
+def summarize(samples, opsPerSample=1):
+    """
+    Summarize per-call timings. opsPerSample is how many operations one
+    call stands for, e.g. the number of IO fires per fireOutput.
+    """
+    samples = sorted(samples)
+    total = sum(samples)
+    return dict(
+        count        = len(samples),
+        mean         = total / len(samples),
+        median       = percentile(samples, 0.5),
+        p99          = percentile(samples, 0.99),
+        opsPerSecond = len(samples) * opsPerSample / total if total else float("inf"),
+    )
+
+def measure(func, count, opsPerSample=1, warmup=10):
+    """
+    Call func() count times, timing each call.
+    """
+    for _ in xrange(warmup):
+        func()
+    timer = default_timer
+    samples = []
+    append = samples.append
+    for _ in xrange(count):
+        start = timer()
+        func()
+        append(timer() - start)
+    return summarize(samples, opsPerSample)
+
+class Results(object):
+
+    """
+    A set of benchmark results, and the parameters they were measured with.
+    """
+
+    def __init__(self, params=None, results=None, meta=None):
+        self.params  = dict(params or {})
+        self.results = dict(results or {})
+        self.meta    = meta or dict(time=time.time(), python=platform.python_version(), machine=platform.machine())
+
+    def add(self, name, stats):
+        self.results[name] = stats
+
+    def save(self, filename):
+        with open(filename, "w") as f:
+            json.dump(dict(meta=self.meta, params=self.params, results=self.results), f, indent=2, sort_keys=True)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename) as f:
+            data = json.load(f)
+        return cls(data["params"], data["results"], data["meta"])
+
+    def report(self):
+        lines = ["%-28s %14s %12s %12s %12s" % ("benchmark", "ops/s", "mean (us)", "median (us)", "p99 (us)")]
+        for name, stats in sorted(self.results.iteritems()):
+            lines.append("%-28s %14.0f %12.2f %12.2f %12.2f" % (name, stats["opsPerSecond"],
+                         stats["mean"] * 1e6, stats["median"] * 1e6, stats["p99"] * 1e6))
+        return "\n".join(lines)
+
+def compareResults(old, new, threshold=0.1):
+    """
+    Compare two Results. Returns a list of (name, oldStats, newStats, reasons)
+    for every benchmark in both that regressed by more than threshold.
+    """
+    regressions = []
+    for name in sorted(set(old.results) & set(new.results)):
+        before, after = old.results[name], new.results[name]
+        reasons = []
+        if after["opsPerSecond"] < before["opsPerSecond"] * (1 - threshold):
+            reasons.append("throughput %.0f -> %.0f ops/s" % (before["opsPerSecond"], after["opsPerSecond"]))
+        if after["p99"] > before["p99"] * (1 + threshold):
+            reasons.append("p99 %.2f -> %.2f us" % (before["p99"] * 1e6, after["p99"] * 1e6))
+        if reasons:
+            regressions.append((name, before, after, reasons))
+    return regressions
@@ -0,0 +1,63 @@
+
+"""
+Messenger.send throughput at 1, 10 and 100 listeners.
+
+    python -m benchmarks.messenger [--seconds 0.5]
+"""
+
+from optparse import OptionParser
+from timeit import default_timer
+
+from supyrdupyr.messenger import Messenger
+
+LISTENER_COUNTS = (1, 10, 100)
+
+class BenchApp(object):
+    debugLogging = False
+
+class LegacyMessenger(Messenger):
+
+    """
+    The pre-compiled-dispatch send, kept here as the baseline to compare against.
+    """
+
+    def send(self, eventName, args=[], kwargs={}):
+        for _, __, function, args_, kwargs_ in self.registry.get(eventName, []):
+            function(*(args + args_), **dict(kwargs, **kwargs_))
+
+def listener(*args, **kwargs):
+    pass
+
+def sendsPerSecond(messenger, seconds, eventName="bench", args=[None, None]):
+    send = messenger.send
+    batch, sent = 1000, 0
+    start = default_timer()
+    end = start + seconds
+    now = start
+    while now < end:
+        for _ in xrange(batch):
+            send(eventName, args)
+        sent += batch
+        now = default_timer()
+    return sent / (now - start)
+
+def makeMessenger(cls, listeners, extraArgs):
+    messenger = cls(BenchApp())
+    for _ in xrange(listeners):
+        messenger.accept("bench", listener, extraArgs)
+    return messenger
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-s", "--seconds", dest="seconds", type="float", default=0.5, help="time to spend on each measurement")
+    options, args = parser.parse_args()
+
+    print "%-10s %-12s %14s %14s %8s" % ("listeners", "extra args", "legacy/s", "compiled/s", "speedup")
+    for extraArgs in ([], ["extra"]):
+        for listeners in LISTENER_COUNTS:
+            legacy = sendsPerSecond(makeMessenger(LegacyMessenger, listeners, extraArgs), options.seconds)
+            compiled = sendsPerSecond(makeMessenger(Messenger, listeners, extraArgs), options.seconds)
+            print "%-10d %-12s %14.0f %14.0f %7.2fx" % (listeners, bool(extraArgs), legacy, compiled, compiled / legacy)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Replay an input recording headlessly as a benchmark workload.
+
+    python -m benchmarks.replay session.sdir --app exploratorium.headless:HeadlessExploratorium
+                                [--budget 0.0167] [-o results.json]
+
+Run it from the directory the app reads its config from. Record a session by
+setting recordInput on the app class to a file name. The replay reports
+frame-time statistics in the usual result format, and exits with status 1
+when the world does not end in the recorded state, or when the p99 frame
+time is over --budget seconds.
+"""
+
+import sys
+from optparse import OptionParser
+
+from benchmarks.harness import Results, summarize
+from supyrdupyr.replay import InputLog, replay, worldDigest
+
+def loadApp(spec):
+    moduleName, _, className = spec.partition(":")
+    __import__(moduleName)
+    return getattr(sys.modules[moduleName], className)
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--app", dest="app", default="exploratorium.headless:HeadlessExploratorium",
+                      help="headless application class, as module:Class")
+    parser.add_option("--budget", dest="budget", type="float", help="p99 frame time budget, in seconds")
+    parser.add_option("-o", "--output", dest="output", help="write the results to this JSON file")
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error("give one input recording")
+
+    log, frames = InputLog.load(args[0])
+    app = loadApp(options.app)()
+    app.setup()
+    if log.tickRate:
+        app.world.tickRate = log.tickRate
+
+    times = replay(app, frames)
+    results = Results(dict(recording=args[0], app=options.app, frames=len(frames)))
+    results.add("replay frames", summarize(times))
+    print results.report()
+    if options.output:
+        results.save(options.output)
+
+    status = 0
+    if log.digest is None:
+        print "The recording has no end state to compare with."
+    elif worldDigest(app.world) != log.digest:
+        print "MISMATCH: the world did not end in the recorded state."
+        status = 1
+    p99 = results.results["replay frames"]["p99"]
+    if options.budget is not None and p99 > options.budget:
+        print "OVER BUDGET: p99 frame time %.2f ms > %.2f ms" % (p99 * 1e3, options.budget * 1e3)
+        status = 1
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+
+"""
+Run the benchmark suite against a synthetic headless world.
+
+    python -m benchmarks.run [--entities N] [--tags N] [--bindings N] [--pairs N] [-o results.json]
+    python -m benchmarks.run --compare old.json new.json [--threshold 0.1]
+
+Comparing exits with status 1 when any benchmark regressed.
+"""
+
+import sys
+from optparse import OptionParser
+
+from benchmarks.harness import Results, measure, compareResults
+
+def runSuite(params, count):
+    from benchmarks.synthetic import SyntheticApplication
+
+    app = SyntheticApplication(**params)
+    app.setup()
+    world = app.world
+    rand = world.random
+    entities = world.logicEntities
+    results = Results(params)
+
+    def sendEvent():
+        a, b = rand.choice(entities), rand.choice(entities)
+        a.sendEntityEvent("bench", b)
+    results.add("entity events", measure(sendEvent, count))
+
+    def fireOutput():
+        rand.choice(entities).fireOutput("OnUser1")
+    results.add("io fires", measure(fireOutput, count, opsPerSample=max(1, params["bindings"])))
+
+    # Let the boxes come to rest on the ground first.
+    for _ in xrange(60):
+        world.updateWorld(world.tickLength)
+    results.add("world ticks", measure(lambda: world.updateWorld(world.tickLength), max(1, count // 100)))
+
+    return results
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--entities", dest="entities", type="int", default=1000, help="number of logic entities")
+    parser.add_option("--tags", dest="tags", type="int", default=5, help="tags per entity")
+    parser.add_option("--tag-pool", dest="tagPool", type="int", default=20, help="number of distinct tags")
+    parser.add_option("--bindings", dest="bindings", type="int", default=2, help="IO bindings per entity")
+    parser.add_option("--pairs", dest="pairs", type="int", default=100, help="number of colliding pairs")
+    parser.add_option("--count", dest="count", type="int", default=10000, help="samples per benchmark")
+    parser.add_option("-o", "--output", dest="output", help="write the results to this JSON file")
+    parser.add_option("--compare", dest="compare", action="store_true", default=False, help="compare two result files")
+    parser.add_option("--threshold", dest="threshold", type="float", default=0.1, help="relative change counted as a regression")
+    options, args = parser.parse_args()
+
+    if options.compare:
+        if len(args) != 2:
+            parser.error("--compare takes two result files")
+        old, new = Results.load(args[0]), Results.load(args[1])
+        regressions = compareResults(old, new, options.threshold)
+        for name, before, after, reasons in regressions:
+            print "REGRESSION %s: %s" % (name, "; ".join(reasons))
+        if not regressions:
+            print "No regressions over %d%%." % (options.threshold * 100,)
+        return 1 if regressions else 0
+
+    params = dict(entities=options.entities, tags=options.tags, tagPool=options.tagPool,
+                  bindings=options.bindings, pairs=options.pairs)
+    results = runSuite(params, options.count)
+    print results.report()
+    if options.output:
+        results.save(options.output)
+
+if __name__ == "__main__":
+    sys.exit(main())
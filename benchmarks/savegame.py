@@ -0,0 +1,67 @@
+
+"""
+Save and load time for large worlds.
+
+    python -m benchmarks.savegame [--entities 10000] [--repeat 5] [-o results.json]
+
+The entity states are synthetic, shaped like a level of physics props,
+timers and logic entities with a couple of IO bindings each.
+"""
+
+import os
+import random
+import tempfile
+from optparse import OptionParser
+
+from benchmarks.harness import Results, measure
+from supyrdupyr import savegame
+from supyrdupyr.savegame import EntityState, SaveGame
+
+def makeStates(count, seed=0):
+    rand = random.Random(seed)
+    tags = ["tag%d" % i for i in xrange(20)]
+    states = []
+    for i in xrange(count):
+        kind = i % 3
+        state = EntityState("supyrdupyr.entities.base.PhysicsEntity", "Entity%d" % i,
+                            ["all", "*", "physics"] + rand.sample(tags, 3), enabled=rand.random() > 0.1)
+        if kind == 0:
+            state.transform = tuple(rand.uniform(-500, 500) for _ in xrange(3)) + (0.0, 0.0, 0.0, 1.0)
+            state.velocity = tuple(rand.uniform(-5, 5) for _ in xrange(6))
+        elif kind == 1:
+            state.className = "supyrdupyr.entities.logic.TimerEntity"
+            state.data = dict(interval=rand.uniform(0.5, 5), timeElapsed=rand.uniform(0, 100),
+                              lastTimeElapsed=rand.uniform(0, 100), highLow="High")
+        state.bindings = [("OnUser1", "Entity%d" % rand.randrange(count), "Enable", 0.0, -1) for _ in xrange(2)]
+        states.append(state)
+    return states
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--entities", dest="entities", type="int", default=10000, help="number of entities")
+    parser.add_option("--repeat", dest="repeat", type="int", default=5, help="samples per benchmark")
+    parser.add_option("-o", "--output", dest="output", help="write the results to this JSON file")
+    options, args = parser.parse_args()
+
+    sg = SaveGame(123.0, makeStates(options.entities))
+    fd, filename = tempfile.mkstemp(suffix=".sav")
+    os.close(fd)
+    try:
+        results = Results(dict(entities=options.entities))
+        results.add("save", measure(lambda: savegame.save(sg, filename), options.repeat, options.entities, warmup=1))
+        results.add("load", measure(lambda: savegame.load(filename), options.repeat, options.entities, warmup=1))
+        results.add("load streaming", measure(lambda: sum(1 for _ in savegame.iterEntityStates(filename)),
+                                              options.repeat, options.entities, warmup=1))
+        size = os.path.getsize(filename)
+        assert savegame.load(filename).entities == sg.entities
+    finally:
+        os.remove(filename)
+
+    print results.report()
+    print "%d entities, %d bytes (%.1f bytes/entity)" % (options.entities, size, float(size) / options.entities)
+    if options.output:
+        results.meta["bytes"] = size
+        results.save(options.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+
+"""
+Synthetic headless worlds for the benchmarks.
+
+A SyntheticWorld has a number of logic entities carrying tags from a shared
+pool, IO bindings from each entity to the next ones, entity event listeners
+on every tag, and boxes resting on a static ground so each box makes one
+colliding pair with it.
+"""
+
+import os.path
+import random
+
+from ogre.physics import bullet
+
+from supyrdupyr.headless import HeadlessApplication
+from supyrdupyr.world import World
+from supyrdupyr.entities import LogicEntity, PhysicsEntity, StaticEntity
+
+MODELS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "exploratorium", "models")
+BOX_MESH    = "testhero.mesh"
+
+class BenchBox(PhysicsEntity):
+    def __init__(self, world, name, position):
+        shape = bullet.btBoxShape(bullet.btVector3(0.5, 0.5, 0.5))
+        super(BenchBox, self).__init__(world, name, position, BOX_MESH, "box", mass=1, physShape=shape)
+
+class BenchGround(StaticEntity):
+    def __init__(self, world, size):
+        shape = bullet.btBoxShape(bullet.btVector3(size, 1, size))
+        super(BenchGround, self).__init__(world, "Ground", (0, -1, 0), BOX_MESH, "terrain", physShape=shape)
+
+def listener(*args):
+    pass
+
+class SyntheticWorld(World):
+
+    def __init__(self, app, entities=1000, tags=5, tagPool=20, bindings=2, pairs=100, seed=0):
+        self.numEntities, self.numTags, self.tagPool = entities, tags, tagPool
+        self.numBindings, self.numPairs = bindings, pairs
+        self.random = random.Random(seed)
+        super(SyntheticWorld, self).__init__(app)
+
+    def setupWorld(self):
+        rand = self.random
+        pool = ["tag%d" % i for i in xrange(self.tagPool)]
+
+        self.logicEntities = [LogicEntity(self, "Logic%d" % i, ' '.join(rand.sample(pool, self.numTags)))
+                              for i in xrange(self.numEntities)]
+
+        count = len(self.logicEntities)
+        for i, entity in enumerate(self.logicEntities):
+            for offset in xrange(1, self.numBindings + 1):
+                entity.bindOutput("OnUser1", self.logicEntities[(i + offset) % count], "FireUser1")
+
+        for tag in pool:
+            self.app.messenger.accept("bench: [%s] [*]" % (tag,), listener)
+
+        if self.numPairs:
+            side = int(self.numPairs ** 0.5) + 1
+            self.ground = BenchGround(self, side * 2)
+            self.boxes = [BenchBox(self, "Box%d" % i, ((i % side) * 2 - side, 0.5, (i // side) * 2 - side))
+                          for i in xrange(self.numPairs)]
+
+class SyntheticApplication(HeadlessApplication):
+
+    """
+    A headless application that builds a SyntheticWorld with the given parameters.
+    """
+
+    def __init__(self, **worldParams):
+        super(SyntheticApplication, self).__init__()
+        self.worldParams = worldParams
+
+    def setupResources(self):
+        self.resourceLocations = [("Models", "FileSystem", MODELS_PATH)]
+        self.resourcePaths = [MODELS_PATH]
+        self.shapeCache = self.createShapeCache()
+
+    def createScene(self):
+        pass
+
+    def createWorld(self):
+        self.world = SyntheticWorld(self, **self.worldParams)
@@ -0,0 +1,84 @@
+"""
+Per-call cost of the supyrdupyr.util math helpers, their out-parameter
+versions and the NumPy batch versions in supyrdupyr.vecmath.
+
+    python -m benchmarks.vecmath [--transforms 1000] [--count 10000] [-o results.json]
+
+The batch benchmarks process --transforms random transforms per call, and
+report throughput per transform so they line up with the per-call helpers.
+"""
+
+import random
+from array import array
+from optparse import OptionParser
+
+import numpy
+from ogre.physics import bullet
+
+from benchmarks.harness import Results, measure
+from supyrdupyr import util, vecmath
+from supyrdupyr.transforms import STRIDE
+
+def makeTransforms(count, seed=0):
+    rand = random.Random(seed)
+    transforms = []
+    for _ in xrange(count):
+        axis = bullet.btVector3(rand.uniform(-1, 1), rand.uniform(-1, 1), rand.uniform(-1, 1))
+        axis.normalize()
+        rotation = bullet.btQuaternion(axis, rand.uniform(0, 6.28))
+        origin = bullet.btVector3(*(rand.uniform(-100, 100) for _ in xrange(3)))
+        transforms.append(bullet.btTransform(rotation, origin))
+    return transforms
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--transforms", dest="transforms", type="int", default=1000, help="transforms per batch")
+    parser.add_option("--count", dest="count", type="int", default=10000, help="samples per benchmark")
+    parser.add_option("-o", "--output", dest="output", help="write the results to this JSON file")
+    options, args = parser.parse_args()
+    count, numTransforms = options.count, options.transforms
+
+    transforms = makeTransforms(numTransforms)
+    transform = transforms[0]
+    vec, quat = bullet.btVector3(1, 2, 3), bullet.btQuaternion(0, 0, 0, 1)
+    out, quatOut = bullet.btVector3(), bullet.btQuaternion(0, 0, 0, 1)
+    axes = [bullet.btVector3(), bullet.btVector3(), bullet.btVector3()]
+    results = Results(dict(transforms=numTransforms))
+
+    results.add("multiplyVec3", measure(lambda: util.multiplyVec3(vec, 0.9), count))
+    results.add("multiplyVec3Into", measure(lambda: util.multiplyVec3Into(vec, 0.9, out), count))
+    results.add("multiplyQuat", measure(lambda: util.multiplyQuat(quat, 0.9), count))
+    results.add("multiplyQuatInto", measure(lambda: util.multiplyQuatInto(quat, 0.9, quatOut), count))
+    results.add("getBasisAxes", measure(lambda: list(util.getBasisAxes(transform)), count))
+    results.add("getBasisAxesInto", measure(lambda: util.getBasisAxesInto(transform, axes), count))
+
+    values = array('d')
+    for t in transforms:
+        origin, rotation = t.getOrigin(), t.getRotation()
+        values.extend((origin.x(), origin.y(), origin.z(), rotation.x(), rotation.y(), rotation.z(), rotation.w()))
+    batch = vecmath.transformArray(values)
+    quats = vecmath.quaternions(batch)
+    batchAxes = numpy.empty((numTransforms, 3, 3))
+    velocities = numpy.random.RandomState(0).uniform(-5, 5, (numTransforms, 3))
+    scaled = numpy.empty_like(velocities)
+    batchCount = max(1, count // numTransforms)
+
+    def basisAxesLoop():
+        for t in transforms:
+            util.getBasisAxesInto(t, axes)
+    results.add("getBasisAxesInto x N", measure(basisAxesLoop, batchCount, numTransforms))
+    results.add("vecmath.basisAxes", measure(lambda: vecmath.basisAxes(quats, batchAxes), batchCount, numTransforms))
+    results.add("vecmath.scaleVectors", measure(lambda: vecmath.scaleVectors(velocities, 0.9, scaled), batchCount, numTransforms))
+
+    # Check the batch axes against the per-transform helper.
+    for i in (0, numTransforms - 1):
+        expected = [(v.x(), v.y(), v.z()) for v in util.getBasisAxes(transforms[i])]
+        assert numpy.allclose(batchAxes[i], expected, atol=1e-5), (batchAxes[i], expected)
+    assert batch.shape == (numTransforms, STRIDE)
+
+    print results.report()
+    if options.output:
+        results.save(options.output)
+
+if __name__ == "__main__":
+    main()
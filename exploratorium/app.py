@@ -13,11 +13,13 @@ from exploratorium.hero import Hero
 class Exploratorium(BaseApplication):
 
     debugLogging = True
+    startupResourceGroups = ("Materials", "Textures")
     
     def createWorld(self):
         self.camera.setNearClipDistance(0.1)
         self.world = World(self)
         self.hero = Hero(self.world)
+        self.world.setFocus(self.hero)
 
 if __name__ in ("__supyrdupyr__", "__main__"):
     app = Exploratorium()
@@ -0,0 +1,27 @@
+
+"""
+Run the exploratorium world without a window, as fast as it simulates.
+
+    cd exploratorium && python headless.py [ticks]
+"""
+
+import sys
+
+if __name__ == "__main__":
+    sys.path.append("..")
+
+from supyrdupyr.headless import HeadlessApplication
+from exploratorium.world import World
+from exploratorium.hero import Hero
+
+class HeadlessExploratorium(HeadlessApplication):
+
+    def createWorld(self):
+        self.world = World(self)
+        self.hero = Hero(self.world, captureCamera=False)
+        self.world.setFocus(self.hero)
+
+if __name__ in ("__supyrdupyr__", "__main__"):
+    app = HeadlessExploratorium()
+    frames, seconds = app.go(int(sys.argv[1]) if len(sys.argv) > 1 else 600)
+    print "%d ticks in %.3fs (%.0f ticks/s)" % (frames, seconds, frames / seconds)
@@ -3,7 +3,7 @@ import ogre.renderer.OGRE as ogre
 from ogre.physics import bullet
 
 from supyrdupyr.entities import PhysicsEntity
-from supyrdupyr.util import clamp, multiplyVec3, multiplyQuat, dotMat3x3, getBasisAxes, matStr, vecStr
+from supyrdupyr.util import clamp, multiplyVec3Into, getBasisAxesInto, matStr, vecStr
 from math import radians
 
 class Hero(PhysicsEntity):
@@ -14,7 +14,10 @@ class Hero(PhysicsEntity):
     MAX_FAST_SPEED = 10000
     MAX_LOOK       = 1000.0
     MOVE_FRICTION  = 0.9
-    MOVE_KEYS = dict(w=(0, -SPEED, 0), s=(0, SPEED, 0), a=(SPEED, 0, 0), d=(-SPEED, 0, 0), q=(0, 0, -SPEED), e=(0, 0, SPEED))
+    MOVE_ACTIONS = dict(forward=(0, -SPEED, 0), backward=(0, SPEED, 0), left=(SPEED, 0, 0), right=(-SPEED, 0, 0),
+                        turnLeft=(0, 0, -SPEED), turnRight=(0, 0, SPEED))
+    ACTION_KEYS = dict(w="forward", s="backward", a="left", d="right", q="turnLeft", e="turnRight",
+                       space="jump", lshift="sprint", rshift="sprint")
     MASS = 10
 
     hasGhostObject = True
@@ -28,6 +31,9 @@ class Hero(PhysicsEntity):
         self.controller.setFallSpeed(2)
         self.world.physWorld.addAction(self.controller)
         self.walkDirection = bullet.btVector3(0, 0, 0)
+        # Scratch vectors for the per-frame math, so it allocates nothing.
+        self.axes = [bullet.btVector3(0, 0, 0) for _ in xrange(3)]
+        self.scratch = bullet.btVector3(0, 0, 0)
         
         self.captureCamera = captureCamera
         
@@ -37,7 +43,6 @@ class Hero(PhysicsEntity):
         self.setupInput()
         
         self.canJump = False
-        self.tasks = []
         self.maxSpeed        = self.MAX_SLOW_SPEED
         self.maxSpeedTarget  = self.MAX_SLOW_SPEED
 
@@ -51,21 +56,19 @@ class Hero(PhysicsEntity):
         return "testhero.mesh"
     
     def setupInput(self):
-        for key, value in self.MOVE_KEYS.iteritems():
-            self.app.messenger.accept(key, self.addTask, [self.move, value])
-            self.app.messenger.accept(key+"-up", self.removeTask, [self.move, value])
-        
-        self.app.messenger.accept("space", self.jump)
-        
-        self.app.messenger.accept("shift", self.setMaxSpeed, [self.MAX_FAST_SPEED])
-        self.app.messenger.accept("shift-up", self.setMaxSpeed, [self.MAX_SLOW_SPEED])
+        self.actions = actions = self.app.actions
+        for key, action in self.ACTION_KEYS.iteritems():
+            actions.bindKey(key, action)
+        # Poll the action bits rather than names every tick.
+        self.moveBits = [(actions.bit(action), value) for action, value in self.MOVE_ACTIONS.iteritems()]
+        self.jumpBit, self.sprintBit = actions.bit("jump"), actions.bit("sprint")
 
     def move(self, dt, x, y, r):
         wt = self.physBody.getWorldTransform()
-        forwardDir, upDir, strafeDir = getBasisAxes(wt)
+        forwardDir, upDir, strafeDir = getBasisAxesInto(wt, self.axes)
         
-        self.walkDirection += multiplyVec3(forwardDir, x)
-        self.walkDirection += multiplyVec3(strafeDir, y)
+        self.walkDirection += multiplyVec3Into(forwardDir, x, self.scratch)
+        self.walkDirection += multiplyVec3Into(strafeDir, y, self.scratch)
         
         rot = bullet.btQuaternion(bullet.btVector3(0, 1, 0), radians(r))
         orn = wt.getBasis()
@@ -94,23 +97,21 @@ class Hero(PhysicsEntity):
     def collidedWithTerrain(self, _, other):
         pass
     
-    def setMaxSpeed(self, speed):
-        self.maxSpeedTarget = speed
-
-    def jump(self, _, __):
+    def jump(self):
         if self.canJump:
             self.walkDirection += bullet.btVector3(0, self.JUMP_FORCE, 0)
             self.canJump = False
 
-    def mouseMoved(self, input, evt):
-        ms = input.mouseInput.getMouseState()
+    def mouseMoved(self, input, motion):
+        if not motion.x:
+            return
         wt = self.physBody.getWorldTransform()
-        rot = bullet.btQuaternion(bullet.btVector3(0, 1, 0), radians(ms.X.rel))
+        rot = bullet.btQuaternion(bullet.btVector3(0, 1, 0), radians(motion.x))
         orn = wt.getBasis()
         orn *= bullet.btMatrix3x3(rot)
         wt.setBasis(orn)
         self.physBody.setWorldTransform(wt)
-        self.cameraNode.roll(-radians(ms.X.rel))
+        self.cameraNode.roll(-radians(motion.x))
         
         # self.yAccum = clamp(self.yAccum - ms.Y.rel, 0, self.MAX_LOOK)
         # degree = 90 - self.yAccum / self.MAX_LOOK * 90
@@ -119,34 +120,28 @@ class Hero(PhysicsEntity):
         # self.app.camera.lookAt(self.sceneNode.getPosition())
     
     def simulate(self, dt):
+        actions = self.actions
+        held = actions.state
+        self.maxSpeedTarget = self.MAX_FAST_SPEED if held & self.sprintBit else self.MAX_SLOW_SPEED
         self.maxSpeed += (self.maxSpeedTarget - self.maxSpeed) * 0.2
-        self.walkDirection = multiplyVec3(self.walkDirection, self.MOVE_FRICTION)
+        multiplyVec3Into(self.walkDirection, self.MOVE_FRICTION, self.walkDirection)
         
-        for func, args in self.tasks:
-            func(dt, *args)
+        if actions.pressed & self.jumpBit:
+            self.jump()
+        for bit, value in self.moveBits:
+            if held & bit:
+                self.move(dt, *value)
             
         wlen = self.walkDirection.length()
         if wlen > self.maxSpeed:
-            self.walkDirection = multiplyVec3(self.walkDirection, self.maxSpeed / wlen)
-        
-        self.controller.setWalkDirection(multiplyVec3(self.walkDirection, dt))
+            multiplyVec3Into(self.walkDirection, self.maxSpeed / wlen, self.walkDirection)
         
-        wt = self.physBody.getWorldTransform()
-        origin, rotation = wt.getOrigin(), wt.getRotation()
-        self.sceneNode.setPosition(origin.x(), origin.y(), origin.z())
-        oren = ogre.Quaternion(rotation.w(), rotation.x(), rotation.y(), rotation.z())
-        self.sceneNode.setOrientation(oren)
+        self.world.markDirty(self)
+        self.controller.setWalkDirection(multiplyVec3Into(self.walkDirection, dt, self.scratch))
         #self.cameraNode.setOrientation(oren*-1)
         
         super(Hero, self).simulate(dt)
 
-    def addTask(self, _, __, func, args):
-        self.tasks.append((func, args))
-
-    def removeTask(self, _, __, func, args):
-        if (func, args) in self.tasks:
-            self.tasks.remove((func, args))
-        
     @property
     def location(self):
         return self.cell
@@ -4,5 +4,7 @@ from exploratorium.levels.devterrain import DevTerrain
 
 class World(sdWorld):
 
+    resourceGroups = ("Models",)
+
     def setupWorld(self):
         self.terrain = DevTerrain(self)
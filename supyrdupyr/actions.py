@@ -0,0 +1,166 @@
+"""
+Named input actions, polled instead of sent as events.
+
+An ActionMap binds keys and mouse buttons to actions such as "forward" or
+"jump". Each action gets one bit, and each keycode and mouse button a
+precomputed mask of the actions it drives, so an input event is a table
+lookup and a few integer operations. Entities poll the state:
+
+    state     actions held right now.
+    pressed   actions that went down since the last tick.
+    released  actions that went up since the last tick.
+
+Input events accumulate the pressed and released edges, and the world calls
+update() at the start of every tick to publish them, so each edge is seen by
+exactly one tick even when a frame runs several ticks or none. A key pressed
+and released within one frame still shows as pressed.
+
+Hot paths can look up an action's bit once with bit() and test it against
+state, pressed or released directly.
+"""
+
+KEYCODES   = 256
+BUTTON_IDS = 8
+
+def inputNames(enum, prefixLength=3, replace={}):
+    """
+    Map the integer values of an OIS enum such as OIS.KeyCode to event
+    names, "KC_LSHIFT" becoming "lshift".
+    """
+    names = {}
+    for code, value in enum.values.iteritems():
+        name = value.name[prefixLength:].lower()
+        names[int(code)] = replace.get(name, name)
+    return names
+
+class ActionMap(object):
+
+    def __init__(self, keyNames={}, buttonNames={}):
+        """
+        keyNames and buttonNames map keycodes and mouse button ids to the
+        names bindKey() and bindButton() accept, as built by inputNames().
+        """
+        self.keyCodes = dict((name, code) for code, name in keyNames.iteritems())
+        self.buttonCodes = dict((name, code) for code, name in buttonNames.iteritems())
+        self.bits = {}
+        self.keyMasks = [0] * KEYCODES
+        self.buttonMasks = [0] * BUTTON_IDS
+        self.heldKeys, self.heldButtons = set(), set()
+        # Actions held through press() rather than a key or button.
+        self.forced = 0
+        self.state, self.pressed, self.released = 0, 0, 0
+        self.pendingPressed, self.pendingReleased = 0, 0
+
+    def bit(self, action):
+        """
+        The bit of action, allocating one for a new action.
+        """
+        bit = self.bits.get(action)
+        if bit is None:
+            bit = self.bits[action] = 1 << len(self.bits)
+        return bit
+
+    def resolve(self, action):
+        return action if isinstance(action, (int, long)) else self.bit(action)
+
+    def bindKey(self, key, action):
+        """
+        Make key, a keycode or key name, drive action.
+        """
+        if not isinstance(key, (int, long)):
+            if key not in self.keyCodes:
+                raise ValueError("Unknown key %r" % (key,))
+            key = self.keyCodes[key]
+        self.keyMasks[key] |= self.bit(action)
+
+    def bindButton(self, button, action):
+        """
+        Make button, a mouse button id or name, drive action.
+        """
+        if not isinstance(button, (int, long)):
+            if button not in self.buttonCodes:
+                raise ValueError("Unknown mouse button %r" % (button,))
+            button = self.buttonCodes[button]
+        self.buttonMasks[button] |= self.bit(action)
+
+    def unbind(self, action):
+        bit = self.bits.get(action)
+        if bit is not None:
+            self.keyMasks = [mask & ~bit for mask in self.keyMasks]
+            self.buttonMasks = [mask & ~bit for mask in self.buttonMasks]
+            self.refresh()
+
+    def refresh(self):
+        """
+        Recompute the held actions from the held keys and buttons.
+        """
+        state = self.forced
+        keyMasks, buttonMasks = self.keyMasks, self.buttonMasks
+        for code in self.heldKeys:
+            state |= keyMasks[code]
+        for button in self.heldButtons:
+            state |= buttonMasks[button]
+        old, self.state = self.state, state
+        self.pendingPressed |= state & ~old
+        self.pendingReleased |= old & ~state
+
+    def keyDown(self, code):
+        self.heldKeys.add(code)
+        mask = self.keyMasks[code]
+        if mask:
+            self.pendingPressed |= mask & ~self.state
+            self.state |= mask
+
+    def keyUp(self, code):
+        self.heldKeys.discard(code)
+        if self.keyMasks[code]:
+            self.refresh()
+
+    def buttonDown(self, button):
+        self.heldButtons.add(button)
+        mask = self.buttonMasks[button]
+        if mask:
+            self.pendingPressed |= mask & ~self.state
+            self.state |= mask
+
+    def buttonUp(self, button):
+        self.heldButtons.discard(button)
+        if self.buttonMasks[button]:
+            self.refresh()
+
+    def press(self, action):
+        """
+        Hold action down without a key, for scripted input.
+        """
+        self.forced |= self.resolve(action)
+        self.refresh()
+
+    def release(self, action):
+        self.forced &= ~self.resolve(action)
+        self.refresh()
+
+    def releaseAll(self):
+        """
+        Let go of everything, such as when the window loses focus.
+        """
+        self.heldKeys.clear()
+        self.heldButtons.clear()
+        self.forced = 0
+        self.refresh()
+
+    def update(self):
+        """
+        Publish the edges since the last update. Called by the world at the
+        start of every tick.
+        """
+        self.pressed, self.released = self.pendingPressed, self.pendingReleased
+        self.pendingPressed = self.pendingReleased = 0
+
+    def isDown(self, action):
+        return bool(self.state & self.resolve(action))
+
+    def wasPressed(self, action):
+        return bool(self.pressed & self.resolve(action))
+
+    def wasReleased(self, action):
+        return bool(self.released & self.resolve(action))
@@ -3,9 +3,17 @@ import sys
 import os
 
 import ogre.physics.bullet
+from ogre.physics import OgreBulletC
 from ogre.io import OIS
 import ogre.renderer.OGRE as ogre
+from supyrdupyr.actions import ActionMap, inputNames
+from supyrdupyr.inputqueue import InputQueue, KEY_DOWN, KEY_UP, BUTTON_DOWN, BUTTON_UP, dispatchInput
 from supyrdupyr.messenger import Messenger
+from supyrdupyr.profiler import FrameProfiler
+from supyrdupyr.replay import InputRecorder
+from supyrdupyr.shapecache import ShapeCache, findMeshFile
+from supyrdupyr.resources import ResourceLoader, ResourceProgressListener
+from supyrdupyr.tasks import TaskManager, PRIORITY_HIGH
 
 class BaseApplication(object):
 
@@ -20,13 +28,23 @@ class BaseApplication(object):
     debugLogging         = False
     useSettingsDialog    = True
     activatePsyco        = False
+    profileFrames        = False
+    profilerCapacity     = 300
+    # File to record every frame's input to, for replaying with supyrdupyr.replay.
+    recordInput          = None
+    shapeCacheDir        = os.path.join("cache", "shapes")
+    # Resource groups initialised at startup, or None for all of them.
+    # Worlds require the rest through World.resourceGroups.
+    startupResourceGroups = None
     globals              = None
-    # globals              = ['app', 'messenger', 'sceneManager', 'renderWindow', 'root', 'camera']
+    # globals              = ['app', 'messenger', 'taskMgr', 'sceneManager', 'renderWindow', 'root', 'camera']
 
     def __init__(self):
         self.frameListener, self.root, self.camera = None, None, None
         self.renderWindow, self.viewport, self.sceneManager = None, None, None
-        self.messenger = None
+        self.messenger, self.actions, self.taskMgr, self.profiler = None, None, None, None
+        self.resourceLocations, self.resourcePaths = [], []
+        self.resources, self.resourceListener, self.shapeCache = None, None, None
     
     def getConfigFilePath(self, filename):
         """
@@ -61,6 +79,7 @@ class BaseApplication(object):
                 pass
         
         self.root.startRendering()
+        self.stopRecording()
         
     def setup(self):
         """
@@ -73,6 +92,8 @@ class BaseApplication(object):
         self.configure()
 
         self.messenger = self.createMessenger()
+        self.actions = self.createActionMap()
+        self.taskMgr = self.createTaskManager()
 
         self.createSceneManagers()
         self.createCameras()
@@ -88,6 +109,7 @@ class BaseApplication(object):
         self.createFrameListeners()
 
         self.createMessengerListeners()
+        self.createProfiler()
 
         if self.globals:
             self.setupGlobals()
@@ -116,6 +138,17 @@ class BaseApplication(object):
             sectionItems = section.getNext()
             for item in sectionItems:
                 ogre.ResourceGroupManager.getSingleton().addResourceLocation(item.value, item.key, sectionKey)
+                self.resourceLocations.append((sectionKey, item.key, item.value))
+                if item.key == "FileSystem":
+                    self.resourcePaths.append(item.value)
+
+        self.shapeCache = self.createShapeCache()
+
+    def createShapeCache(self):
+        """
+        Create the collision shape cache shared by every PhysicsEntity.
+        """
+        return ShapeCache(self, self.shapeCacheDir)
 
     def configure(self):
         """
@@ -138,6 +171,20 @@ class BaseApplication(object):
         """
         return Messenger(self)
 
+    def createActionMap(self):
+        """
+        Create the ActionMap that input events drive, with OIS's key and
+        mouse button names.
+        """
+        return ActionMap(inputNames(OIS.KeyCode, replace=MessengerFrameListener.KEY_REPLACE_MAP),
+                         inputNames(OIS.MouseButtonID))
+
+    def createTaskManager(self):
+        """
+        Create the TaskManager that runs per-frame tasks after the world is updated.
+        """
+        return TaskManager()
+
     def createSceneManagers(self):
         """
         Create our sceneManager(s).
@@ -169,16 +216,48 @@ class BaseApplication(object):
 
     def createResourceListener(self):
         """
-        Create our resource listener (optional).
+        Create our resource listener, which reports loading progress
+        through the messenger.
         """
-        pass
+        self.resourceListener = ResourceProgressListener(self)
+        ogre.ResourceGroupManager.getSingleton().addResourceGroupListener(self.resourceListener)
+
+    def createResourceLoader(self):
+        """
+        Should return a suitable ResourceLoader instance.
+        """
+        return ResourceLoader(self, self.resourceLocations)
 
     def loadResources(self):
         """
-        Load our resources.
+        Initialise the startup resource groups. The rest are initialised on
+        demand by the worlds that need them.
         """
-        ogre.ResourceGroupManager.getSingleton().initialiseAllResourceGroups()
+        self.resources = self.createResourceLoader()
+        if self.startupResourceGroups is None:
+            self.resources.initialiseAll()
+        else:
+            self.resources.pin(self.startupResourceGroups)
     
+    def createTrimeshShape(self, entity, scale=(1, 1, 1)):
+        """
+        Get a static triangle mesh collision shape for an entity's mesh,
+        shared with every other entity using the same mesh and scale.
+        """
+        return self.shapeCache.getTrimeshShape(entity, scale)
+
+    def findMeshFile(self, meshName):
+        """
+        Find the OgreXML version of a mesh in the FileSystem resource locations.
+        """
+        return findMeshFile(self.resourcePaths, meshName)
+
+    def convertMeshToShape(self, entity):
+        """
+        Build a static triangle mesh collision shape from an entity's loaded mesh.
+        """
+        return OgreBulletC.StaticMeshToShapeConverter(entity).createTrimesh().getBulletShape()
+
     def createScene(self):
         """
         Create our default scene.
@@ -198,7 +277,40 @@ class BaseApplication(object):
         """
         self.frameListener = MessengerFrameListener(self, self.renderWindow, self.camera, self.sceneManager)
         self.root.addFrameListener(self.frameListener)
+        if self.recordInput:
+            self.frameListener.recorder = InputRecorder(open(self.recordInput, "wb"), self.world.tickRate)
+        self.createTasks()
         
+    def createTasks(self):
+        """
+        Add our default tasks. The world's frame listener runs them.
+        """
+        self.taskMgr.add(self.pollResources, "pollResources", PRIORITY_HIGH)
+
+    def pollResources(self, task):
+        """
+        Finish the resource groups the background loader has read.
+        """
+        self.resources.poll()
+        return task.cont
+
+    def stopRecording(self):
+        """
+        Finish the input recording, if there is one, with the world's end state.
+        """
+        recorder = getattr(self.frameListener, "recorder", None)
+        if recorder is not None:
+            recorder.close(self.world)
+            self.frameListener.recorder = None
+
+    def createProfiler(self):
+        """
+        Create the frame profiler, and start it if profileFrames is set.
+        """
+        self.profiler = FrameProfiler(self, self.profilerCapacity)
+        if self.profileFrames:
+            self.profiler.enable()
+
     def createMessengerListeners(self):
         """
         And create our messenger listeners.
@@ -227,41 +339,54 @@ class MessengerFrameListener(ogre.FrameListener, ogre.WindowEventListener, OIS.M
 
         self.inputManager = None
         self.keyboardInput, self.mouseInput, self.joyInput = None, None, None
+        self.inputQueue = InputQueue()
+        # An InputRecorder writing every frame's input, if recording.
+        self.recorder = None
+
+        # Event names by keycode and button id, worked out once.
+        keyNames = inputNames(OIS.KeyCode, replace=self.KEY_REPLACE_MAP)
+        self.keyEvents = keyNames
+        self.keyUpEvents = dict((code, name + "-up") for code, name in keyNames.iteritems())
+        self.buttonEvents = dict((code, "mouse-" + name) for code, name in inputNames(OIS.MouseButtonID).iteritems())
+        self.buttonUpEvents = dict((code, name + "-up") for code, name in self.buttonEvents.iteritems())
 
         self.setupInput()
     
     def mouseMoved(self, evt):
         """
-        Emits a "mouse-moved" event when the mouse is pressed.
-        This also happens on mouse scroll, using the "Z" component of the mouse state.
+        Queues mouse motion, which is folded into one "mouse-moved" event per
+        frame. This also happens on mouse scroll, using the "Z" component of
+        the mouse state.
         """
-        self.app.messenger.send("mouse-moved", [self, evt])
+        self.inputQueue.addMotion(evt.get_state())
     
     def mousePressed(self, evt, id):
-        """
-        Emits "mouse-left", "mouse-right", etc.
-        """
-        self.app.messenger.send("mouse-" + id.name[3:].lower(), [self, evt])
+        button = int(id)
+        self.inputQueue.pushButton(BUTTON_DOWN, button, self.buttonEvents[button], evt)
     
     def mouseReleased(self, evt, id):
-        """
-        Emits "mouse-left-up", "mouse-right-up", etc.
-        """
-        self.app.messenger.send("mouse-" + id.name[3:].lower() + "-up", [self, evt])
+        button = int(id)
+        self.inputQueue.pushButton(BUTTON_UP, button, self.buttonUpEvents[button], evt)
 
     def keyPressed(self, evt):
-        """
-        Emits key events when a key is pressed.
-        """
-        key = evt.key.name[3:].lower()
-        self.app.messenger.send(self.KEY_REPLACE_MAP.get(key, key), [self, evt])
+        code = int(evt.key)
+        self.inputQueue.pushKey(KEY_DOWN, code, self.keyEvents[code], evt)
 
     def keyReleased(self, evt):
+        code = int(evt.key)
+        self.inputQueue.pushKey(KEY_UP, code, self.keyUpEvents[code], evt)
+
+    def dispatchInput(self):
         """
-        Emits key events when a key is released.
+        Update the app's actions from the queued input and emit its events:
+        "mouse-moved" with a MouseMotion, "mouse-left", "mouse-left-up", etc.
+        for mouse buttons, and the key name, or the key name with "-up", for
+        keys. The events are written to the recorder first, if there is one.
         """
-        key = evt.key.name[3:].lower()
-        self.app.messenger.send(self.KEY_REPLACE_MAP.get(key, key) + "-up", [self, evt])
+        events = self.inputQueue.drain()
+        if self.recorder is not None:
+            self.recorder.writeFrame(self.app.world.frameTime, events)
+        dispatchInput(events, self.app.actions, self.app.messenger, self)
         
     def frameRenderingQueued(self, evt):
         """
@@ -275,6 +400,7 @@ class MessengerFrameListener(ogre.FrameListener, ogre.WindowEventListener, OIS.M
         self.mouseInput.capture()
         if self.joyInput:
             self.joyInput.capture()
+        self.dispatchInput()
 
         return True
 
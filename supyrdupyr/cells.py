@@ -0,0 +1,246 @@
+"""
+Streaming partition of a world into square cells on the ground (x, z) plane.
+
+Entities with a position are placed in the cell they stand in, on the first
+tick after they are created, and moved between cells as their bodies move.
+The focus entity, normally the hero, drives streaming:
+
+    active    cells within activeRadius of the focus's cell. Their entities
+              are simulated, their bodies are in the physics world and their
+              scene nodes are attached.
+    frozen    cells within frozenRadius. Their entities keep their state but
+              are not simulated, have no bodies in the physics world and are
+              not rendered. Their resource groups are not initialised, unless
+              the world or an active cell uses them too, but their files are
+              read ahead on the resource loader's background thread, so they
+              are quick to initialise when the focus gets there.
+    unloaded  cells further out. They are frozen, and their resource groups
+              are neither initialised nor read ahead.
+
+Groups that a cell stops needing are released by ResourceLoader.activate().
+
+Streaming only runs when the focus crosses into another cell. Entities
+without a position, entities whose class sets streamed to False, and the
+focus itself are never frozen.
+"""
+
+import itertools
+from math import floor
+
+ACTIVE, FROZEN = "active", "frozen"
+
+def entityPosition(entity):
+    """
+    An entity's position as an (x, y, z) tuple, or None if it has none.
+    """
+    body = getattr(entity, "physBody", None)
+    if body is not None:
+        origin = body.getWorldTransform().getOrigin()
+        return origin.x(), origin.y(), origin.z()
+    node = getattr(entity, "sceneNode", None)
+    if node is not None:
+        position = node.getPosition()
+        return position.x, position.y, position.z
+    return None
+
+def neighbourhood(key, radius):
+    """
+    The keys of the cells within radius cells of key, including key.
+    """
+    x, z = key
+    return [(x + dx, z + dz) for dx in xrange(-radius, radius + 1) for dz in xrange(-radius, radius + 1)]
+
+class Cell(object):
+
+    """
+    One cell of the grid: its entities, the simulated ones among them, a
+    scene node their scene nodes hang from, and its resource groups.
+    """
+
+    def __init__(self, grid, key):
+        self.grid, self.key = grid, key
+        self.entities = {}
+        self.simulated = {}
+        self.state = FROZEN
+        self.resourceGroups = tuple(grid.world.cellResourceGroups.get(key, ()))
+        self.sceneNode = grid.world.worldNode.createChildSceneNode("Cell %d:%d" % key)
+        grid.world.worldNode.removeChild(self.sceneNode)
+
+    @property
+    def active(self):
+        return self.state == ACTIVE
+
+    def addEntity(self, entity, simulates, frozen=False):
+        """
+        Put entity in this cell, freezing or thawing it to match. frozen is
+        whether it is frozen now, as it is when it comes from a frozen cell.
+        """
+        self.entities[entity.name] = entity
+        if simulates:
+            self.simulated[entity.name] = entity
+        node = getattr(entity, "sceneNode", None)
+        if node is not None:
+            node.getParent().removeChild(node)
+            self.sceneNode.addChild(node)
+        if self.active:
+            if frozen:
+                entity.thaw()
+        elif not frozen:
+            entity.freeze()
+
+    def removeEntity(self, entity):
+        """
+        Take entity out of this cell, moving its scene node back under the
+        world's. An entity of a frozen cell stays frozen, so a killed one
+        doesn't go back into the physics world.
+        """
+        del self.entities[entity.name]
+        self.simulated.pop(entity.name, None)
+        node = getattr(entity, "sceneNode", None)
+        if node is not None:
+            self.sceneNode.removeChild(node)
+            self.grid.world.worldNode.addChild(node)
+
+    def activate(self):
+        if not self.active:
+            self.state = ACTIVE
+            self.grid.world.worldNode.addChild(self.sceneNode)
+            for entity in self.entities.itervalues():
+                entity.thaw()
+            self.grid.activeCells.add(self)
+
+    def freeze(self):
+        if self.active:
+            self.state = FROZEN
+            self.grid.world.worldNode.removeChild(self.sceneNode)
+            for entity in self.entities.itervalues():
+                entity.freeze()
+            self.grid.activeCells.discard(self)
+
+class CellGrid(object):
+
+    """
+    The cells of a world, created as entities are placed in them.
+    """
+
+    def __init__(self, world, cellSize, activeRadius=1, frozenRadius=2):
+        self.world, self.cellSize = world, float(cellSize)
+        self.activeRadius, self.frozenRadius = activeRadius, max(activeRadius, frozenRadius)
+        self.cells = {}
+        self.activeCells = set()
+        self.cellOf = {}
+        self.pending = []
+        self.focus, self.focusKey = None, None
+
+    def cellKey(self, position):
+        x, _, z = position
+        return int(floor(x / self.cellSize)), int(floor(z / self.cellSize))
+
+    def getCell(self, key):
+        cell = self.cells.get(key)
+        if cell is None:
+            cell = self.cells[key] = Cell(self, key)
+            if self.focusKey is None or max(abs(key[0] - self.focusKey[0]), abs(key[1] - self.focusKey[1])) <= self.activeRadius:
+                cell.activate()
+        return cell
+
+    def simulatingEntities(self):
+        return itertools.chain.from_iterable(cell.simulated.itervalues() for cell in list(self.activeCells))
+
+    def addEntity(self, entity):
+        """
+        Place entity in its cell on the next update().
+        """
+        self.pending.append(entity)
+
+    def removeEntity(self, entity):
+        cell = self.cellOf.pop(entity.name, None)
+        if cell is not None:
+            cell.removeEntity(entity)
+
+    def place(self, entity, cell):
+        """
+        Move entity into cell, taking over its entry in the world's simulated entities.
+        """
+        old = self.cellOf.get(entity.name)
+        if old is cell:
+            return
+        world = self.world
+        if old is not None:
+            simulates, frozen = entity.name in old.simulated, not old.active
+            old.removeEntity(entity)
+        else:
+            simulates = world.simulatedEntities.pop(entity.name, None) is not None
+            frozen = False
+        self.cellOf[entity.name] = cell
+        cell.addEntity(entity, simulates, frozen)
+
+    def placePending(self):
+        pending, self.pending = self.pending, []
+        for entity in pending:
+            if entity is self.focus or not entity.streamed or self.world.entities.get(entity.name) is not entity:
+                continue
+            position = entityPosition(entity)
+            if position is not None:
+                self.place(entity, self.getCell(self.cellKey(position)))
+
+    def moved(self, entity):
+        """
+        Move entity to another cell if its body left its cell.
+        """
+        cell = self.cellOf.get(entity.name)
+        if cell is not None:
+            key = self.cellKey(entityPosition(entity))
+            if key != cell.key:
+                self.place(entity, self.getCell(key))
+
+    def setFocus(self, entity):
+        """
+        Stream cells around entity, which is never frozen itself.
+        """
+        if self.focus is not None and self.focus.streamed:
+            self.pending.append(self.focus)
+        self.focus, self.focusKey = entity, None
+        cell = self.cellOf.pop(entity.name, None)
+        if cell is not None:
+            simulates = entity.name in cell.simulated
+            cell.removeEntity(entity)
+            if not cell.active:
+                entity.thaw()
+            if simulates:
+                self.world.simulatedEntities[entity.name] = entity
+
+    def update(self):
+        """
+        Place new entities and stream cells if the focus changed cell.
+        Called by the world at the start of every tick.
+        """
+        if self.pending:
+            self.placePending()
+        if self.focus is None:
+            return
+        position = entityPosition(self.focus)
+        if position is not None:
+            key = self.cellKey(position)
+            if key != self.focusKey:
+                self.stream(key)
+
+    def stream(self, key):
+        self.focusKey = key
+        active = set(neighbourhood(key, self.activeRadius))
+        nearby = set(neighbourhood(key, self.frozenRadius)) - active
+
+        for cell in list(self.activeCells):
+            if cell.key not in active:
+                cell.freeze()
+        for cellKey in active:
+            cell = self.cells.get(cellKey)
+            if cell is not None:
+                cell.activate()
+
+        resources, cells = self.world.app.resources, self.cells
+        activeGroups = set(group for cellKey in active if cellKey in cells for group in cells[cellKey].resourceGroups)
+        nearbyGroups = set(group for cellKey in nearby if cellKey in cells for group in cells[cellKey].resourceGroups)
+        worldGroups = set(self.world.resourceGroups)
+        resources.activate(worldGroups | activeGroups)
+        resources.prefetch(nearbyGroups - activeGroups - worldGroups)
@@ -4,41 +4,22 @@ Base entities.
 """
 
 from ogre.renderer import OGRE as ogre
-from ogre.physics import bullet, OgreBulletC
+from ogre.physics import bullet
+from supyrdupyr.tags import tagBit, tagMask, splitTags, collisionGroup, collisionMask
+from supyrdupyr.savegame import EntityState
+from supyrdupyr.scripts import Script
+from supyrdupyr.transforms import readTransform
 import itertools
 
-TAG_REGISTRY            = dict()
-
-def getTagBits(tags):
-    """
-    Get the collision and category bits for our tags.
-    """
-    bits = 0
-    notBits = False
-    if not tags:
-        return 0xFF
-    
-    if all(tag[0] == "!" for tag in tags):
-        tags = [tag[1:] for tag in tags]
-        notBits = True
-        
-    for tag in tags:
-        if tag not in ("all", "*"):
-            TAG_REGISTRY.setdefault(tag, len(TAG_REGISTRY))
-            index = TAG_REGISTRY[tag]
-            bits |= 1 << index
-    
-    if notBits:
-        bits = ~bits
-    
-    return bits
-
-
 class BaseEntity(object):
     """
     A base entity. Has name, tags, world, apps and custom data. That's it.
     The name must be unique for each entity.
     """
+
+    # Whether the world's cell grid may freeze this entity with its cell.
+    streamed = True
+
     def __init__(self, world, name, tags=""):
         self.tags   = "all * " + tags
         self.name = name
@@ -55,10 +36,34 @@ class BaseEntity(object):
     
     @tags.setter
     def tags(self, value):
-        if isinstance(value, basestring):
-            self._tags = value.split()
-        else:
-            self._tags = list(value)
+        oldTags = getattr(self, "_tags", ())
+        world = getattr(self, "world", None)
+        if world is not None:
+            world.markDirty(self)
+        self._tags = splitTags(value)
+        self.tagMask = tagMask(self._tags)
+        self.tagsChanged()
+        if world is not None:
+            world.retagEntity(self, oldTags)
+
+    def tagsChanged(self):
+        """
+        Called after the tags change, to update anything derived from them.
+        """
+        pass
+
+    def hasTag(self, tag):
+        """
+        Check whether this entity has a tag, with one bitwise AND.
+        """
+        bit = tagBit(tag)
+        return self.tagMask & bit == bit
+
+    def hasTags(self, mask):
+        """
+        Check whether this entity has every tag in a tagMask().
+        """
+        return self.tagMask & mask == mask
     
     @property
     def app(self):
@@ -68,6 +73,50 @@ class BaseEntity(object):
         return self.world.app
     
     def simulate(self, dt):
+        """
+        Run once per world tick. Entities that don't override this are
+        left out of the world's simulate loop entirely.
+        """
+        pass
+
+    def freeze(self):
+        """
+        Called when this entity's cell is frozen, to release what it holds
+        in the running world.
+        """
+        pass
+
+    def thaw(self):
+        """
+        Called when this entity's cell becomes active again.
+        """
+        pass
+
+    @classmethod
+    def fromSaveState(cls, world, state):
+        """
+        Create an entity that a save game holds but the level doesn't, such
+        as one spawned while playing. applySaveState() restores the rest.
+        """
+        return cls(world, state.name)
+
+    def getSaveState(self):
+        """
+        Get the EntityState that a save game records for this entity.
+        """
+        cls = self.__class__
+        return EntityState("%s.%s" % (cls.__module__, cls.__name__), self.name, self.tags)
+
+    def applySaveState(self, state):
+        """
+        Restore this entity from a saved EntityState.
+        """
+        self.tags = state.tags
+
+    def applySaveBindings(self, bindings):
+        """
+        Restore saved IO bindings, once every entity of the save exists.
+        """
         pass
 
     def sendEntityEvent(self, eventtype, *entities, **kwargs):
@@ -78,7 +127,7 @@ class BaseEntity(object):
 
             hero.sendEntityEvent("collided", ground)
 
-        will send:
+        will call the listeners of:
 
             collided: 'heroName' 'groundName'
             collided: [*] 'groundName'
@@ -89,18 +138,58 @@ class BaseEntity(object):
         with the variables "hero" and "ground" being arguments.
         [] brackets represent a tag. '' quotes represent a name in the world.
         heroName and groundName represent the names of the hero and ground entities.
+
+        The patterns are matched through the messenger's entity event index,
+        so no event string is built for each combination of names and tags.
         """
         withTags = kwargs.get('withTags', True)
         permute  = kwargs.get('permute', False)
         loop = itertools.permutations(entities) if permute else [entities]
         for ents in loop:
-            args = ((["'%s'" % ent.name] + (["[%s]" % tag for tag in ent.tags] if withTags else [])) for ent in ([self] + list(ents)))
-            for eventargs in itertools.product(*args):
-                self.app.messenger.send("%s: %s" % (eventtype, ' '.join(eventargs)), [self] + list(ents))
+            self.app.messenger.sendEntityEvent(eventtype, (self,) + tuple(ents), withTags)
+
+def inputArgs(value):
+    """
+    The argument list an output value stands for.
+    """
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+def ignoreInput(entity, value):
+    pass
+
+def compileInputHandler(handler):
+    """
+    Turn an inputHandlers entry into a function(entity, value). A string
+    fires that output with the value, an (outputName, args) pair fires that
+    output with args instead, and a (function, args) pair appends args to
+    the value's arguments.
+    """
+    if isinstance(handler, basestring):
+        outputName = handler
+        def fireAlias(entity, value):
+            entity.fireOutput(outputName, value)
+        return fireAlias
+    if isinstance(handler, tuple):
+        function, args = handler
+        if isinstance(function, basestring):
+            def fireWithArgs(entity, value):
+                entity.fireOutput(function, args)
+            return fireWithArgs
+        args = list(args)
+        def callWithArgs(entity, value):
+            function(entity, inputArgs(value) + args)
+        return callWithArgs
+    return handler
 
 class InputOutputMeta(type):
     """
     Metaclass to implement the input/outputSpec and inputHandlers documentation and inheritance.
+    It also compiles inputHandlers into inputDispatch, mapping every input in
+    inputSpec straight to a function(entity, value).
     """
     def __new__(cls, names, bases, dct):
         def formatSpec(spec):
@@ -123,6 +212,10 @@ class InputOutputMeta(type):
         D["outputSpec"].update(dct.get("outputSpec", {}))
         D["inputSpec"].update(dct.get("inputSpec", {}))
         D["inputHandlers"].update(dct.get("inputHandlers", {}))
+
+        handlers = D["inputHandlers"]
+        D["inputDispatch"] = dict((name, compileInputHandler(handlers.get(name, ignoreInput)))
+                                  for name in D["inputSpec"])
         
         D.setdefault("__doc__", "")
         D["__doc__"] += \
@@ -143,6 +236,21 @@ class InputOutputMeta(type):
 #     types, doc = spec
 #     return all(isinstance(VALUE, TYPE) for VALUE, TYPE in zip(value, types))
 
+class OutputBinding(object):
+
+    """
+    One output binding: the target entity and input, resolved once to a
+    trigger(value) callable, the delay in seconds, and how many more times
+    it fires (-1 for forever).
+    """
+
+    __slots__ = ("target", "inputName", "trigger", "delay", "timesToFire")
+
+    def __init__(self, target, inputName, delay=0, timesToFire=-1):
+        self.target, self.inputName = target, inputName
+        self.trigger = target.inputTrigger(inputName)
+        self.delay, self.timesToFire = delay, timesToFire
+
 class LogicEntity(BaseEntity):
     
     """
@@ -151,6 +259,8 @@ class LogicEntity(BaseEntity):
     """
 
     __metaclass__ = InputOutputMeta
+
+    _enabled = True
     
     # Inputs/Outputs/Triggers
     
@@ -158,9 +268,10 @@ class LogicEntity(BaseEntity):
         super(LogicEntity, self).__init__(world, name, tags)
         
         self.isNotKilled = True # FIXME: remove from world
-        self.enabled = True
         
         self._outputBindings = {}
+        self._outputPlans = {}
+        self.scripts = set()
         
         self.setupEventHandlers()
         self.setupIO()
@@ -170,11 +281,42 @@ class LogicEntity(BaseEntity):
         self.isNotKilled = False
         self.world.killEntity(self)
 
+    def runScript(self, generator):
+        """
+        Start a script, a generator that yields what it waits for; see
+        supyrdupyr.scripts. It runs until its first wait straight away.
+        """
+        script = Script(self, generator)
+        self.scripts.add(script)
+        script.resume()
+        return script
+
+    def stopScripts(self):
+        for script in list(self.scripts):
+            script.stop()
+
+    @property
+    def enabled(self):
+        """
+        Whether this entity fires its outputs. Compiled output plans leave out
+        disabled targets, so changing it recompiles the plans that reach it.
+        """
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, value):
+        value = bool(value)
+        if value != self._enabled:
+            self.world.markDirty(self)
+            self._enabled = value
+            self.world.ioGraph.entityChanged(self)
+
     def enable(self, value):
         """
         Enable this entity.
         """
         self.enabled = True
+        self.enabledChanged()
 
     def disable(self, value):
         """
@@ -182,13 +324,42 @@ class LogicEntity(BaseEntity):
         This will prevent it from firing outputs, but it can still simulate and trigger inputs.
         """
         self.enabled = False
+        self.enabledChanged()
 
     def toggle(self, value):
         """
         Toggle this entity between enabled and disabled states.
         """
         self.enabled = not self.enabled
+        self.enabledChanged()
     
+    def enabledChanged(self):
+        """
+        Called after the Enable, Disable or Toggle inputs change self.enabled.
+        """
+        pass
+
+    def getSaveState(self):
+        state = super(LogicEntity, self).getSaveState()
+        state.enabled, state.killed = self.enabled, not self.isNotKilled
+        state.bindings = [(outputName, binding.target.name, binding.inputName, binding.delay, binding.timesToFire)
+                          for outputName, bindings in self._outputBindings.iteritems()
+                          for binding in bindings]
+        return state
+
+    def applySaveState(self, state):
+        super(LogicEntity, self).applySaveState(state)
+        # Set together, so the plans reaching this entity recompile once.
+        self._enabled, self.isNotKilled = bool(state.enabled), not state.killed
+        self.world.ioGraph.entityChanged(self)
+
+    def applySaveBindings(self, bindings):
+        self.world.ioGraph.clearBindings(self)
+        for outputName, targetName, inputName, delay, timesToFire in bindings:
+            target = self.world.entities.get(targetName)
+            if target is not None:
+                self.bindOutput(outputName, target, inputName, delay, timesToFire)
+
     def setupEventHandlers(self):
         """
         Override this method when setting up event handlers for the messenger.
@@ -201,46 +372,50 @@ class LogicEntity(BaseEntity):
         """
         pass
     
-    def bindOutput(self, outputName, inputObj, inputName):
+    def bindOutput(self, outputName, inputObj, inputName, delay=0, timesToFire=-1):
         """
         Bind outputName on this object to inputName on inputObj.
+        With a delay, the input is triggered that many seconds after the output
+        fires, through the world's scheduler. timesToFire limits how many times
+        the binding fires before it is removed; -1 means forever.
+        Raises ValueError if the binding would make a loop of outputs firing
+        each other straight away.
         """
         assert outputName in self.outputSpec
-        self._outputBindings.setdefault(outputName, [])
-        self._outputBindings[outputName].append((inputObj, inputName))
+        self.world.markDirty(self)
+        self.world.ioGraph.addBinding(self, outputName, OutputBinding(inputObj, inputName, delay, timesToFire))
     
     def fireOutput(self, outputName, value=None):
         """
         Fire the given output outputName with the specified value.
         """
-        if self.isNotKilled and self.enabled:
-            for inputObj, inputName in self._outputBindings.get(outputName, []):
-                inputObj.triggerInput(inputName, value)
+        if self.isNotKilled and self._enabled:
+            for trigger in self._outputPlans.get(outputName, ()):
+                trigger(value)
 
     def _fireOutput_event(self, outputName, value=None, *_, **__):
         """
         An event-friendly version of fireOutput.
         """
-        self.fireOutput(value, outputName)
+        self.fireOutput(outputName, value)
     
-    def triggerInput(self, inputName, value):
+    def triggerInput(self, inputName, value=None):
         """
         Trigger the given input.
         """
         if self.isNotKilled:
-            assert inputName in self.inputSpec
+            self.inputDispatch[inputName](self, value)
 
-            if inputName in self.inputHandlers:
-                handler = self.inputHandlers[inputName]
-                args = []
-            
-                if isinstance(handler, tuple):
-                    handler, args = handler
-                    
-                if callable(handler):
-                    handler(self, value + args)
-                elif isinstance(handler, str):
-                    self.fireOutput(handler, args)
+    def inputTrigger(self, inputName):
+        """
+        Get a trigger(value) callable for the given input, with its handler
+        already looked up, for output bindings to call directly.
+        """
+        handler = self.inputDispatch[inputName]
+        def trigger(value):
+            if self.isNotKilled:
+                handler(self, value)
+        return trigger
     
     inputHandlers = {
         "Kill": kill,
@@ -253,6 +428,7 @@ class LogicEntity(BaseEntity):
         "Kill": (None, "Remove this entity from the game."),
         "Enable": (None, "Enable this entity."),
         "Disable": (None, "Disable this entity."),
+        "Toggle": (None, "Toggle this entity between enabled and disabled."),
         "FireUser1": (None, "User-defined input for all your other tasks."),
         "FireUser2": (None, "User-defined input for all your other tasks."),
         "FireUser3": (None, "User-defined input for all your other tasks."),
@@ -272,6 +448,11 @@ class VisibleEntity(LogicEntity):
     """
     A visible entity that renders itself using the given model.
     """
+
+    # Save games don't hold the model, so restoring one needs the level to
+    # have created the entity already.
+    fromSaveState = None
+
     def __init__(self, world, name, position, model, tags=""):
         super(VisibleEntity, self).__init__(world, name, tags)
         
@@ -290,7 +471,8 @@ class VisibleEntity(LogicEntity):
                 try:
                     self.entity = self.app.sceneManager.createEntity(self.name, value + suffix)
                     loaded = True
-                except ogre.OgreException, e:
+                    break
+                except (ogre.OgreException, IOError), e:
                     continue
             if not loaded:
                 raise e
@@ -306,21 +488,30 @@ class VisibleEntity(LogicEntity):
 
     
 class PhysicsEntityMotionState(bullet.btMotionState):
-    def __init__(self, entity, initialTransform):
+
+    """
+    Holds a body's transform for Bullet, like btDefaultMotionState, and
+    hands each new transform to the world's TransformBuffer, which flags
+    the body as moved. See supyrdupyr.transforms.
+    """
+
+    flagsMoves = True
+
+    def __init__(self, initialTransform):
         bullet.btMotionState.__init__(self)
-        self.entity    = entity
         self.transform = initialTransform
-    
+        self.buffer, self.slot = None, None
+
     def getWorldTransform(self, worldTrans):
         worldTrans.setOrigin  (self.transform.getOrigin())
         worldTrans.setRotation(self.transform.getRotation())
-        
+
     def setWorldTransform(self, worldTrans):
         origin, rotation = worldTrans.getOrigin(), worldTrans.getRotation()
         self.transform.setOrigin(origin)
         self.transform.setRotation(rotation)
-        self.entity.sceneNode.setPosition(origin.x(), origin.y(), origin.z())
-        self.entity.sceneNode.setOrientation(ogre.Quaternion(rotation.w(), rotation.x(), rotation.y(), rotation.z()))
+        if self.buffer is not None:
+            self.buffer.bodyMoved(self.slot, origin, rotation)
 
 class PhysicsEntity(VisibleEntity):
     
@@ -329,13 +520,15 @@ class PhysicsEntity(VisibleEntity):
     
     MotionState = PhysicsEntityMotionState
     physFlags   = 0
+    shapeScale  = (1, 1, 1)
 
     hasGhostObject = False
     
     def __init__(self, world, name, position, model, tags="", mass=0, collisionModel=None, collisionTags=None, physShape=None):
         super(PhysicsEntity, self).__init__(world, name, position, model, "physics " + tags)
         
-        self.collisionTags  = collisionTags
+        self.collisionTags  = splitTags(collisionTags)
+        self.collisionMask  = collisionMask(self.collisionTags)
         self.createCollisionModel(collisionModel)
         self.createShape(physShape)
         self.createBody(mass, position)
@@ -349,9 +542,8 @@ class PhysicsEntity(VisibleEntity):
             body = bullet.btPairCachingGhostObject()
             body.setCollisionShape(self.physShape)
             body.setWorldTransform(transform)
-            self.world.physWorld.addCollisionObject(body, getTagBits(self.tags), getTagBits(self.collisionTags))
         else:
-            self.motionState = self.MotionState(self, transform)
+            self.motionState = self.MotionState(transform)
             self.physMass = mass
 
             localInertia = bullet.btVector3(0, 0, 0)
@@ -359,13 +551,67 @@ class PhysicsEntity(VisibleEntity):
         
             construct = bullet.btRigidBody.btRigidBodyConstructionInfo(mass, self.motionState, self.physShape, localInertia)
             body = bullet.btRigidBody(construct)
-            
-            self.world.physWorld.addRigidBody(body, getTagBits(self.tags), getTagBits(self.collisionTags))
         
         body.setCollisionFlags(body.getCollisionFlags() | self.physFlags)
         body.setUserData(self)
         self.physBody = body
+        self.addBody()
+        if self.isMoving:
+            self.world.transforms.add(self)
+
+    @property
+    def isMoving(self):
+        """
+        Whether this entity's body can move, so its transform is synced to its scene node.
+        """
+        return bool(self.hasGhostObject or self.physMass or self.physFlags & bullet.btCollisionObject.CF_KINEMATIC_OBJECT)
+
+    def addBody(self):
+        if self.hasGhostObject:
+            self.world.physWorld.addCollisionObject(self.physBody, self.collisionGroup, self.collisionMask)
+        else:
+            self.world.physWorld.addRigidBody(self.physBody, self.collisionGroup, self.collisionMask)
+
+    def freeze(self):
+        self.world.physWorld.removeCollisionObject(self.physBody)
+        self.world.transforms.remove(self)
+
+    def thaw(self):
+        self.addBody()
+        if self.isMoving:
+            self.world.transforms.add(self)
     
+    def tagsChanged(self):
+        self.collisionGroup = collisionGroup(self._tags)
+        body = getattr(self, "physBody", None)
+        # Frozen bodies are out of the physics world, and get the group when they're added back.
+        handle = body.getBroadphaseHandle() if body is not None else None
+        if handle is not None:
+            handle.m_collisionFilterGroup = self.collisionGroup
+
+    def getSaveState(self):
+        state = super(PhysicsEntity, self).getSaveState()
+        state.transform = readTransform(self.physBody)
+        if isinstance(self.physBody, bullet.btRigidBody):
+            linear, angular = self.physBody.getLinearVelocity(), self.physBody.getAngularVelocity()
+            state.velocity = (linear.x(), linear.y(), linear.z(), angular.x(), angular.y(), angular.z())
+        return state
+
+    def applySaveState(self, state):
+        super(PhysicsEntity, self).applySaveState(state)
+        if state.transform is not None:
+            x, y, z, qx, qy, qz, qw = state.transform
+            transform = bullet.btTransform(bullet.btQuaternion(qx, qy, qz, qw), bullet.btVector3(x, y, z))
+            self.physBody.setWorldTransform(transform)
+            if not self.hasGhostObject:
+                self.motionState.setWorldTransform(transform)
+            self.world.transforms.teleport(self)
+        if state.velocity is not None and isinstance(self.physBody, bullet.btRigidBody):
+            lx, ly, lz, ax, ay, az = state.velocity
+            self.physBody.setLinearVelocity(bullet.btVector3(lx, ly, lz))
+            self.physBody.setAngularVelocity(bullet.btVector3(ax, ay, az))
+            self.physBody.activate()
+
     def createCollisionModel(self, value):
         if value is None:
             self.collisionEntity = self.entity
@@ -378,14 +624,16 @@ class PhysicsEntity(VisibleEntity):
             
     def createShape(self, value):
         if value is None:
-            converter = OgreBulletC.StaticMeshToShapeConverter(self.collisionEntity)
-            self.physShape = converter.createTrimesh().getBulletShape()
+            self.physShape = self.app.createTrimeshShape(self.collisionEntity, self.shapeScale)
         else:
             self.physShape = value
 
 # Define outside because it references itself.
 PhysicsEntity.outputSpec = {
-    "OnCollide": ([PhysicsEntity], "Fired when this object collides with another one."),
+    "OnCollide": ([PhysicsEntity], "Fired with OnCollideStart, under the name it had before contacts were tracked."),
+    "OnCollideStart": ([PhysicsEntity], "Fired when this object starts touching another one."),
+    "OnCollidePersist": ([PhysicsEntity], "Fired every World.contactPersistInterval seconds while this object keeps touching another one."),
+    "OnCollideEnd": ([PhysicsEntity], "Fired when this object stops touching another one."),
 }
 
 class StaticEntity(PhysicsEntity):
@@ -395,7 +643,7 @@ class TriggerEntity(PhysicsEntity):
     physFlags = bullet.btCollisionObject.CF_NO_CONTACT_RESPONSE
     
     def setupIO(self):
-        self.bindOutput("OnCollide", self, "Trigger")
+        self.bindOutput("OnCollideStart", self, "Trigger")
         
     inputHandlers = {
         "Trigger": "OnTrigger",
@@ -2,32 +2,118 @@
 from supyrdupyr.entities.base import LogicEntity
 
 class TimerEntity(LogicEntity):
+
+    """
+    Fires OnTimer every interval seconds while enabled. Between deadlines the
+    timer waits in the world's scheduler rather than being simulated, so an
+    idle or disabled timer costs nothing per tick. Each deadline is an exact
+    multiple of the interval from the last reset, so late ticks don't make
+    the period drift.
+    """
+
     def __init__(self, world, name, interval, tags=""):
+        self.timerCall = None
         super(TimerEntity, self).__init__(world, name, "logic timer " + tags)
         self.enabled = False
         self.interval = interval
-        self.timeElapsed = 0
-        self.lastTimeElapsed = 0
+        self.startTime = None
+        self.pausedElapsed = 0
+        self.nextFire = interval
+        self.fireCount = 0
         self.highLow = "High"
 
-    def simulate(self, dt):
+    @property
+    def timeElapsed(self):
+        """
+        Seconds the timer has been running since it was last reset.
+        """
+        if self.startTime is None:
+            return self.pausedElapsed
+        return self.world.time - self.startTime
+
+    def start(self):
+        """
+        Start counting and schedule the next deadline.
+        """
+        if self.startTime is None:
+            self.world.markDirty(self)
+            self.startTime = self.world.time - self.pausedElapsed
+        self.scheduleNextFire()
+
+    def stop(self):
+        """
+        Stop counting and drop the scheduled deadline.
+        """
+        if self.startTime is not None:
+            self.world.markDirty(self)
+            self.pausedElapsed = self.timeElapsed
+            self.startTime = None
+        if self.timerCall is not None:
+            self.world.scheduler.cancel(self.timerCall)
+            self.timerCall = None
+
+    def scheduleNextFire(self):
+        if self.timerCall is not None:
+            self.world.scheduler.cancel(self.timerCall)
+            self.timerCall = None
+        if self.interval > 0:
+            self.timerCall = self.world.scheduler.scheduleAt(self.startTime + self.nextFire, self.timerElapsed)
+
+    def timerElapsed(self):
+        """
+        Called by the scheduler when a deadline arrives.
+        """
+        self.timerCall = None
+        if not self.isNotKilled:
+            return
+        self.world.markDirty(self)
+        self.nextFire += self.interval
+        self.scheduleNextFire()
+        self.fireTimer()
+
+    def enabledChanged(self):
         if self.enabled:
-            self.timeElapsed += dt
-            if (self.timeElapsed - self.lastTimeElapsed) % self.interval > 0:
-                self.lastTimeElapsed = self.timeElapsed
-                self.fireTimer()
+            self.start()
+        else:
+            self.stop()
+
+    @classmethod
+    def fromSaveState(cls, world, state):
+        return cls(world, state.name, state.data["interval"])
+
+    def getSaveState(self):
+        state = super(TimerEntity, self).getSaveState()
+        state.data.update(interval=self.interval, startTime=self.startTime, pausedElapsed=self.pausedElapsed,
+                          nextFire=self.nextFire, fireCount=self.fireCount, highLow=self.highLow)
+        return state
 
-    def reset(self, value):
-        self.timeElapsed = 0
-        self.lastTimeElapsed = 0
+    def applySaveState(self, state):
+        super(TimerEntity, self).applySaveState(state)
+        self.stop()
+        data = state.data
+        self.interval, self.startTime = data["interval"], data["startTime"]
+        self.pausedElapsed, self.nextFire = data["pausedElapsed"], data["nextFire"]
+        self.fireCount, self.highLow = data["fireCount"], str(data["highLow"])
+        if self.startTime is not None:
+            self.scheduleNextFire()
+
+    def reset(self, value=None):
+        running = self.startTime is not None
+        self.world.markDirty(self)
+        self.stop()
+        self.pausedElapsed = 0
+        self.nextFire = self.interval
+        self.fireCount = 0
+        if running:
+            self.start()
 
     def setInterval(self, value):
-        self.reset()
         self.interval = value[0]
+        self.reset()
 
     def toggle(self, value):
         self.reset()
-        super(TimerEntity, self).toggle()
+        super(TimerEntity, self).toggle(value)
 
     def setHigh(self, value):
         self.highLow = "High"
@@ -35,8 +121,9 @@ class TimerEntity(LogicEntity):
     def setLow(self, value):
         self.highLow = "Low"
 
-    def fireTimer(self):
-        args = [int(self.timeElapsed % self.interval), self.timeElapsed]
+    def fireTimer(self, value=None):
+        self.fireCount += 1
+        args = [self.fireCount, self.timeElapsed]
         self.fireOutput("OnTimer", args)
         self.fireOutput("OnTimer" + self.highLow, args)
         
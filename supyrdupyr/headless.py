@@ -0,0 +1,281 @@
+
+"""
+A headless application for servers and batch runs.
+
+HeadlessApplication replaces Ogre's Root, render window, scene manager and
+OIS input with small in-process stand-ins, so a World and its levels can be
+simulated without a GPU or window. Trimesh collision shapes are built from
+the .mesh.xml files found in the resource locations (see supyrdupyr.shapecache).
+"""
+
+from timeit import default_timer
+
+import ogre.renderer.OGRE as ogre
+
+from supyrdupyr.baseapp import BaseApplication
+from supyrdupyr.shapecache import findMeshFile
+from supyrdupyr.resources import ResourceLoader
+
+def readResourceLocations(filename):
+    """
+    Read the locations out of a resources.cfg file, as (group, type, path) tuples.
+    """
+    locations, group = [], "General"
+    for line in open(filename):
+        line = line.strip()
+        if not line or line[0] in "#;":
+            continue
+        if line[0] == "[" and line[-1] == "]":
+            group = line[1:-1]
+        elif "=" in line:
+            type, path = line.split("=", 1)
+            locations.append((group, type.strip(), path.strip()))
+    return locations
+
+def toVector3(args):
+    if len(args) == 1:
+        args = args[0]
+        if isinstance(args, ogre.Vector3):
+            return ogre.Vector3(args)
+    return ogre.Vector3(*args)
+
+class NullMesh(object):
+    def __init__(self, name):
+        self.name = name
+
+    def getName(self):
+        return self.name
+
+class NullEntity(object):
+
+    """
+    Stands in for an ogre.Entity: a name and the mesh file it was created from.
+    """
+
+    def __init__(self, name, meshName, meshPath):
+        self.name, self.meshName, self.meshPath = name, meshName, meshPath
+        self.mesh = NullMesh(meshName)
+        self.parentNode = None
+
+    def getName(self):
+        return self.name
+
+    def getMesh(self):
+        return self.mesh
+
+    def getParentSceneNode(self):
+        return self.parentNode
+
+class NullSceneNode(object):
+
+    """
+    Stands in for an ogre.SceneNode: it keeps its transform, parent, children
+    and attached objects, and renders nothing.
+    """
+
+    def __init__(self, name, parent=None):
+        self.name, self.parent = name, parent
+        self.children, self.objects = [], []
+        self.position, self.orientation = ogre.Vector3(0, 0, 0), ogre.Quaternion(1, 0, 0, 0)
+
+    def getName(self):
+        return self.name
+
+    def getParent(self):
+        return self.parent
+
+    def createChildSceneNode(self, name=None):
+        child = NullSceneNode(name, self)
+        self.children.append(child)
+        return child
+
+    def addChild(self, child):
+        child.parent = self
+        self.children.append(child)
+
+    def removeChild(self, child):
+        self.children.remove(child)
+        child.parent = None
+
+    def attachObject(self, obj):
+        obj.parentNode = self
+        self.objects.append(obj)
+
+    def setPosition(self, *args):
+        self.position = toVector3(args)
+
+    def getPosition(self):
+        return self.position
+
+    def setOrientation(self, *args):
+        self.orientation = args[0] if len(args) == 1 else ogre.Quaternion(*args)
+
+    def getOrientation(self):
+        return self.orientation
+
+    def rotate(self, axis, angle):
+        self.orientation = self.orientation * ogre.Quaternion(ogre.Radian(angle), axis)
+
+    def yaw(self, angle):
+        self.rotate(ogre.Vector3.UNIT_Y, angle)
+
+    def pitch(self, angle):
+        self.rotate(ogre.Vector3.UNIT_X, angle)
+
+    def roll(self, angle):
+        self.rotate(ogre.Vector3.UNIT_Z, angle)
+
+    def showBoundingBox(self, show):
+        pass
+
+class NullSceneManager(object):
+
+    """
+    Stands in for an ogre.SceneManager. Meshes are looked up as .mesh.xml
+    files in the FileSystem resource locations.
+    """
+
+    def __init__(self, name, resourcePaths=()):
+        self.name = name
+        self.resourcePaths = list(resourcePaths)
+        self.rootSceneNode = NullSceneNode(name + "/Root")
+
+    def getRootSceneNode(self):
+        return self.rootSceneNode
+
+    def createEntity(self, name, meshName):
+        meshPath = findMeshFile(self.resourcePaths, meshName)
+        if meshPath is None:
+            raise IOError("Unable to locate %s.xml in the resource locations." % (meshName,))
+        return NullEntity(name, meshName, meshPath)
+
+    def setAmbientLight(self, colour):
+        pass
+
+    def setSkyDome(self, *args):
+        pass
+
+class NullResourceLoader(ResourceLoader):
+
+    """
+    Tracks resource groups without Ogre. Meshes are read straight from
+    the resource locations, so there is nothing to initialise or load,
+    but prefetching still warms the files up in the background.
+    """
+
+    def initialiseGroup(self, groupName):
+        pass
+
+    def loadGroup(self, groupName):
+        pass
+
+    def unloadGroup(self, groupName):
+        pass
+
+    def clearGroup(self, groupName):
+        pass
+
+    def initialiseAll(self):
+        self.initialised.update(self.groups)
+        self.pinned.update(self.groups)
+
+class FrameEvent(object):
+    __slots__ = ("timeSinceLastFrame", "timeSinceLastEvent")
+
+    def __init__(self, dt):
+        self.timeSinceLastFrame = self.timeSinceLastEvent = dt
+
+class NullRoot(object):
+
+    """
+    Stands in for ogre.Root: it holds the frame listeners and drives them
+    from a plain Python loop.
+    """
+
+    def __init__(self):
+        self.frameListeners = []
+
+    def addFrameListener(self, listener):
+        self.frameListeners.append(listener)
+
+    def removeFrameListener(self, listener):
+        self.frameListeners.remove(listener)
+
+    def renderOneFrame(self, dt):
+        """
+        Run one frame of dt seconds. Returns False when a listener asks to stop.
+        """
+        evt = FrameEvent(dt)
+        for method in ("frameStarted", "frameRenderingQueued", "frameEnded"):
+            for listener in list(self.frameListeners):
+                callback = getattr(listener, method, None)
+                if callback is not None and not callback(evt):
+                    return False
+        return True
+
+class HeadlessApplication(BaseApplication):
+
+    """
+    A BaseApplication without Ogre's Root, window, camera or input. go() runs
+    the world at full speed, one simulation tick per frame, until a frame
+    listener returns False or maxFrames frames have run.
+    """
+
+    windowTitle = "SupyrDupyr HeadlessApplication"
+    maxFrames   = None
+
+    def go(self, maxFrames=None):
+        self.setup()
+        return self.run(maxFrames or self.maxFrames)
+
+    def run(self, maxFrames=None):
+        """
+        Drive the frame listeners. Returns (frames, seconds) actually run.
+        """
+        dt = self.world.tickLength if getattr(self, "world", None) else 1.0 / 60
+        frames, start = 0, default_timer()
+        while maxFrames is None or frames < maxFrames:
+            frames += 1
+            if not self.root.renderOneFrame(dt):
+                break
+        return frames, default_timer() - start
+
+    def setup(self):
+        """
+        Set up the game, without rendering or input.
+        """
+        self.root = NullRoot()
+        self.setupResources()
+        self.messenger = self.createMessenger()
+        self.actions = self.createActionMap()
+        self.taskMgr = self.createTaskManager()
+        self.createSceneManagers()
+        self.loadResources()
+        self.createScene()
+        self.createWorld()
+        self.createFrameListeners()
+        self.createMessengerListeners()
+        self.createProfiler()
+
+        if self.globals:
+            self.setupGlobals()
+
+    def setupResources(self):
+        """
+        Read the FileSystem locations out of the resources.cfg file.
+        """
+        self.resourceLocations = readResourceLocations(self.getConfigFilePath("resources"))
+        self.resourcePaths = [path for group, type, path in self.resourceLocations if type == "FileSystem"]
+        self.shapeCache = self.createShapeCache()
+
+    def createSceneManagers(self):
+        self.sceneManager = NullSceneManager("SceneManager", self.resourcePaths)
+
+    def createResourceLoader(self):
+        return NullResourceLoader(self, self.resourceLocations)
+
+    def createFrameListeners(self):
+        self.createTasks()
+
+    def convertMeshToShape(self, entity):
+        raise IOError("Unable to locate %s.xml in the resource locations." % (entity.meshName,))
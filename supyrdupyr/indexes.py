@@ -0,0 +1,148 @@
+"""
+Indexes the world keeps over its entities, so that tag and area queries
+don't scan World.entities.
+
+TagIndex maps each tag to the live entities carrying it, and is updated when
+entities are added, killed or retagged. SpatialGrid is a uniform grid hashed
+by cell, holding each entity's position; a box or radius query only visits
+the cells the query overlaps.
+"""
+
+from math import floor
+
+from supyrdupyr.cells import entityPosition
+
+class TagIndex(object):
+
+    def __init__(self):
+        self.byTag = {}
+
+    def add(self, entity, tags=None):
+        byTag = self.byTag
+        for tag in entity.tags if tags is None else tags:
+            entities = byTag.get(tag)
+            if entities is None:
+                entities = byTag[tag] = set()
+            entities.add(entity)
+
+    def remove(self, entity, tags=None):
+        byTag = self.byTag
+        for tag in entity.tags if tags is None else tags:
+            entities = byTag.get(tag)
+            if entities is not None:
+                entities.discard(entity)
+                if not entities:
+                    del byTag[tag]
+
+    def find(self, tag):
+        """
+        The set of entities with tag. Don't change it; copy it first.
+        """
+        return self.byTag.get(tag, frozenset())
+
+    def findAll(self, tags):
+        """
+        The entities carrying every one of tags, intersecting from the rarest tag.
+        """
+        sets = sorted((self.find(tag) for tag in tags), key=len)
+        if not sets:
+            return set()
+        return sets[0].intersection(*sets[1:])
+
+class SpatialGrid(object):
+
+    """
+    A uniform grid over entity positions. Positions are (x, y, z) tuples.
+
+    Entities are added through pending, and placed on the next flush(), as
+    most entities only get their position after World.addEntity().
+    """
+
+    def __init__(self, cellSize):
+        self.cellSize = float(cellSize)
+        self.buckets = {}
+        self.positions = {}
+        self.keys = {}
+        self.pending = []
+
+    def __len__(self):
+        return len(self.positions)
+
+    def keyOf(self, position):
+        size = self.cellSize
+        x, y, z = position
+        return int(floor(x / size)), int(floor(y / size)), int(floor(z / size))
+
+    def move(self, entity, position):
+        """
+        Insert entity at position, or move it there.
+        """
+        key = self.keyOf(position)
+        self.positions[entity] = position
+        oldKey = self.keys.get(entity)
+        if oldKey == key:
+            return
+        if oldKey is not None:
+            self.discardFromBucket(entity, oldKey)
+        self.keys[entity] = key
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = set()
+        bucket.add(entity)
+
+    def remove(self, entity):
+        if entity in self.pending:
+            self.pending.remove(entity)
+        key = self.keys.pop(entity, None)
+        if key is not None:
+            del self.positions[entity]
+            self.discardFromBucket(entity, key)
+
+    def discardFromBucket(self, entity, key):
+        bucket = self.buckets[key]
+        bucket.discard(entity)
+        if not bucket:
+            del self.buckets[key]
+
+    def flush(self):
+        """
+        Place pending entities.
+        """
+        if self.pending:
+            pending, self.pending = self.pending, []
+            for entity in pending:
+                position = entityPosition(entity)
+                if position is not None:
+                    self.move(entity, position)
+
+    def queryBox(self, lower, upper):
+        """
+        Yield the entities inside the axis-aligned box from lower to upper.
+        """
+        (x0, y0, z0), (x1, y1, z1) = self.keyOf(lower), self.keyOf(upper)
+        lx, ly, lz = lower
+        ux, uy, uz = upper
+        buckets, positions = self.buckets, self.positions
+        if (x1 - x0 + 1) * (y1 - y0 + 1) * (z1 - z0 + 1) > len(buckets):
+            # A box larger than the occupied grid: walk the occupied cells instead.
+            keys = [key for key in buckets
+                    if x0 <= key[0] <= x1 and y0 <= key[1] <= y1 and z0 <= key[2] <= z1]
+        else:
+            keys = [(x, y, z) for x in xrange(x0, x1 + 1) for y in xrange(y0, y1 + 1) for z in xrange(z0, z1 + 1)]
+        for key in keys:
+            for entity in buckets.get(key, ()):
+                x, y, z = positions[entity]
+                if lx <= x <= ux and ly <= y <= uy and lz <= z <= uz:
+                    yield entity
+
+    def queryRadius(self, center, radius):
+        """
+        Yield the entities within radius of center.
+        """
+        cx, cy, cz = center
+        radiusSquared = radius * radius
+        positions = self.positions
+        for entity in self.queryBox((cx - radius, cy - radius, cz - radius), (cx + radius, cy + radius, cz + radius)):
+            x, y, z = positions[entity]
+            if (x - cx) ** 2 + (y - cy) ** 2 + (z - cz) ** 2 <= radiusSquared:
+                yield entity
@@ -0,0 +1,140 @@
+"""
+A queue of the raw input read during one frame's capture().
+
+OIS calls its listeners once per buffered event, and a high polling rate
+mouse makes dozens of motion events a frame. The queue keeps discrete
+events, key and button presses and releases, distinct and in order, but
+folds consecutive motion events into one MouseMotion holding their summed
+relative movement. A frame without clicks therefore dispatches at most one
+motion event; motion on either side of a click stays on its own side.
+
+Each entry is (kind, code, name, event): the keycode or mouse button id, the
+messenger event name, and a KeyInput, ButtonInput or MouseMotion. These hold
+copies of the OIS event's values, taken when it is queued, as OIS may reuse
+or free its event objects once the listener returns. dispatchInput() applies
+entries to an ActionMap and sends their events.
+"""
+
+KEY_DOWN, KEY_UP, BUTTON_DOWN, BUTTON_UP, MOTION = range(5)
+
+MOTION_EVENT = "mouse-moved"
+
+class MouseMotion(object):
+
+    """
+    The relative movement of one or more mouse events, on the X and Y axes
+    and the Z (wheel) axis, and the absolute position after the last one.
+    """
+
+    __slots__ = ("x", "y", "z", "absX", "absY", "absZ", "count")
+
+    def __init__(self):
+        self.x = self.y = self.z = 0
+        self.absX = self.absY = self.absZ = 0
+        self.count = 0
+
+    def add(self, state):
+        """
+        Fold in an OIS MouseState.
+        """
+        self.x += state.X.rel
+        self.y += state.Y.rel
+        self.z += state.Z.rel
+        self.absX, self.absY, self.absZ = state.X.abs, state.Y.abs, state.Z.abs
+        self.count += 1
+
+    def __repr__(self):
+        return "MouseMotion(%d, %d, %d)" % (self.x, self.y, self.z)
+
+class KeyInput(object):
+
+    """
+    A key event: the keycode and the character it typed, if any.
+    """
+
+    __slots__ = ("key", "text")
+
+    def __init__(self, key, text=0):
+        self.key, self.text = key, text
+
+    @property
+    def id(self):
+        return self.key
+
+    def __repr__(self):
+        return "KeyInput(%d, %d)" % (self.key, self.text)
+
+class ButtonInput(object):
+
+    """
+    A mouse button event: the button id, and the mouse's absolute position
+    and held buttons when it happened.
+    """
+
+    __slots__ = ("id", "absX", "absY", "absZ", "buttons")
+
+    def __init__(self, id, absX=0, absY=0, absZ=0, buttons=0):
+        self.id = id
+        self.absX, self.absY, self.absZ = absX, absY, absZ
+        self.buttons = buttons
+
+    def __repr__(self):
+        return "ButtonInput(%d)" % (self.id,)
+
+class InputQueue(object):
+
+    def __init__(self):
+        self.events = []
+        self.motion = None
+
+    def __len__(self):
+        return len(self.events)
+
+    def push(self, kind, code, name, evt):
+        self.events.append((kind, code, name, evt))
+        self.motion = None
+
+    def pushKey(self, kind, code, name, evt):
+        """
+        Queue an OIS KeyEvent.
+        """
+        self.push(kind, code, name, KeyInput(code, evt.text))
+
+    def pushButton(self, kind, code, name, evt):
+        """
+        Queue an OIS MouseEvent for a button press or release.
+        """
+        state = evt.get_state()
+        self.push(kind, code, name, ButtonInput(code, state.X.abs, state.Y.abs, state.Z.abs, state.buttons))
+
+    def addMotion(self, state):
+        motion = self.motion
+        if motion is None:
+            motion = self.motion = MouseMotion()
+            self.events.append((MOTION, 0, MOTION_EVENT, motion))
+        motion.add(state)
+
+    def drain(self):
+        """
+        Return the queued events and empty the queue.
+        """
+        events, self.events = self.events, []
+        self.motion = None
+        return events
+
+def dispatchInput(events, actions, messenger, source):
+    """
+    Apply queued events to actions and send them through messenger, with
+    source and the event as the arguments.
+    """
+    send = messenger.send
+    for kind, code, name, evt in events:
+        if kind == KEY_DOWN:
+            actions.keyDown(code)
+        elif kind == KEY_UP:
+            actions.keyUp(code)
+        elif kind == BUTTON_DOWN:
+            actions.buttonDown(code)
+        elif kind == BUTTON_UP:
+            actions.buttonUp(code)
+        send(name, [source, evt])
@@ -0,0 +1,172 @@
+"""
+The world's graph of output bindings, compiled into flat firing plans.
+
+Every output of a LogicEntity gets a plan: a tuple of trigger(value)
+callables that fireOutput loops over. An immediate binding to a relay input
+(an alias such as "Trigger": "OnTrigger") is fused away by splicing the relay
+output's own plan in its place, so a chain of relays fires its real targets
+directly. A relay entity that is disabled or killed splices in nothing, as
+firing through it would do nothing.
+
+Plans are recompiled when bindings change, when a binding runs out of fires,
+and when an entity is enabled, disabled or killed, along with every plan
+that spliced them in. A binding that would close a loop of immediate relay
+hops is refused with a ValueError, instead of recursing until the stack
+overflows when it first fires. Delayed bindings break a loop, since each
+lap runs on a later tick. Inputs with handler functions are treated as
+sinks, as what they fire can't be known until they run.
+
+Scripts waiting for an output add a waiter, a callable that is compiled
+into the output's plan like a binding's trigger until it is removed.
+"""
+
+def relayOutput(binding):
+    """
+    The output a binding's target input fires straight away, or None.
+    """
+    if binding.delay:
+        return None
+    handler = binding.target.inputHandlers.get(binding.inputName)
+    return handler if isinstance(handler, basestring) else None
+
+def formatNode(node):
+    entity, outputName = node
+    return "%s.%s" % (entity.name, outputName)
+
+class IOGraph(object):
+
+    def __init__(self, world):
+        self.world = world
+        # target entity -> set of (source entity, outputName) bound to it
+        self.incoming = {}
+        # (source entity, outputName) -> waiters called when it fires
+        self.waiters = {}
+
+    def findPath(self, start, goal):
+        """
+        Find a chain of immediate relay hops from the (entity, outputName)
+        start to goal, as a list of nodes, or None.
+        """
+        stack, seen = [(start, [start])], set()
+        while stack:
+            node, path = stack.pop()
+            if node == goal:
+                return path
+            if node in seen:
+                continue
+            seen.add(node)
+            entity, outputName = node
+            for binding in entity._outputBindings.get(outputName, ()):
+                relay = relayOutput(binding)
+                if relay is not None:
+                    nextNode = (binding.target, relay)
+                    stack.append((nextNode, path + [nextNode]))
+        return None
+
+    def addBinding(self, source, outputName, binding):
+        """
+        Add a binding to source's outputName and recompile, or raise
+        ValueError if it would make a loop of immediate relay hops.
+        """
+        relay = relayOutput(binding)
+        if relay is not None:
+            path = self.findPath((binding.target, relay), (source, outputName))
+            if path is not None:
+                raise ValueError("Binding %s to %s.%s makes an output loop: %s" % (
+                    formatNode((source, outputName)), binding.target.name, binding.inputName,
+                    " -> ".join(formatNode(node) for node in [(source, outputName)] + path)))
+
+        source._outputBindings.setdefault(outputName, []).append(binding)
+        self.incoming.setdefault(binding.target, set()).add((source, outputName))
+        self.recompile(source, outputName)
+
+    def removeBinding(self, source, outputName, binding):
+        bindings = source._outputBindings.get(outputName, [])
+        if binding in bindings:
+            bindings.remove(binding)
+            if not any(other.target is binding.target for other in bindings):
+                self.incoming.get(binding.target, set()).discard((source, outputName))
+            self.recompile(source, outputName)
+
+    def clearBindings(self, source):
+        """
+        Remove every binding of source's outputs.
+        """
+        outputs = source._outputBindings
+        source._outputBindings = {}
+        for outputName, bindings in outputs.iteritems():
+            for binding in bindings:
+                self.incoming.get(binding.target, set()).discard((source, outputName))
+            self.recompile(source, outputName)
+
+    def addWaiter(self, source, outputName, waiter):
+        self.waiters.setdefault((source, outputName), []).append(waiter)
+        self.recompile(source, outputName)
+
+    def removeWaiter(self, source, outputName, waiter):
+        waiters = self.waiters.get((source, outputName))
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del self.waiters[(source, outputName)]
+            self.recompile(source, outputName)
+
+    def entityChanged(self, entity):
+        """
+        Recompile the plans that may have spliced in entity's outputs,
+        after it was enabled, disabled or killed.
+        """
+        for source, outputName in list(self.incoming.get(entity, ())):
+            self.recompile(source, outputName)
+
+    def recompile(self, source, outputName):
+        """
+        Rebuild the plan of source's outputName, and of every plan that
+        spliced it in.
+        """
+        pending, done = [(source, outputName)], set()
+        while pending:
+            node = pending.pop()
+            if node in done:
+                continue
+            done.add(node)
+            entity, name = node
+            plan = self.compilePlan(entity, name)
+            if plan:
+                entity._outputPlans[name] = plan
+            else:
+                entity._outputPlans.pop(name, None)
+            pending.extend(self.incoming.get(entity, ()))
+
+    def compilePlan(self, source, outputName):
+        plan = []
+        for binding in source._outputBindings.get(outputName, ()):
+            target = binding.target
+            if binding.delay or binding.timesToFire > 0:
+                plan.append(self.countedTrigger(source, outputName, binding))
+                continue
+            relay = relayOutput(binding)
+            if relay is None:
+                plan.append(binding.trigger)
+            elif target.isNotKilled and target.enabled:
+                plan.extend(self.compilePlan(target, relay))
+        plan.extend(self.waiters.get((source, outputName), ()))
+        return tuple(plan)
+
+    def countedTrigger(self, source, outputName, binding):
+        """
+        A trigger for a delayed or fire-limited binding, which does its
+        bookkeeping and removes the binding once it runs out.
+        """
+        scheduler, trigger = self.world.scheduler, binding.trigger
+        def fire(value):
+            if binding.delay:
+                scheduler.schedule(binding.delay, trigger, value)
+            else:
+                trigger(value)
+            if binding.timesToFire > 0:
+                self.world.markDirty(source)
+                binding.timesToFire -= 1
+                if not binding.timesToFire:
+                    self.removeBinding(source, outputName, binding)
+        return fire
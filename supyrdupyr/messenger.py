@@ -1,23 +1,248 @@
 
+import re
+from bisect import insort
+from itertools import count
 from supyrdupyr.util import methodSignature
+from supyrdupyr.tags import tagBit
+
+_NO_KWARGS = {}
+
+ENTITY_PATTERN_RE = re.compile(r"^([^:]+): ((?:\[[^\]]*\]|'[^']*')(?: (?:\[[^\]]*\]|'[^']*'))*)$")
+ENTITY_SLOT_RE    = re.compile(r"\[([^\]]*)\]|'([^']*)'")
+
+def tagSlot(tag):
+    """
+    A pattern slot matching any entity with the given tag.
+    """
+    return (None, tagBit(tag))
+
+def nameSlot(name):
+    """
+    A pattern slot matching the entity with the given name.
+    """
+    return (name, 0)
+
+def parseEntityPattern(eventName):
+    """
+    Compile a string pattern such as "collided: [hero] 'Ground'" into
+    (eventType, slots), or return None if eventName is not a pattern.
+    [] brackets represent a tag. '' quotes represent a name in the world.
+    """
+    match = ENTITY_PATTERN_RE.match(eventName)
+    if match is None:
+        return None
+    eventType, slotString = match.groups()
+    slots = tuple(tagSlot(tag) if name is None else nameSlot(name)
+                  for tag, name in (m.groups() for m in ENTITY_SLOT_RE.finditer(slotString)))
+    return eventType, slots
+
+def matchSlots(slots, entities, withTags=True):
+    """
+    Check whether a list of entities matches a list of pattern slots.
+    """
+    if len(slots) != len(entities):
+        return False
+    for (name, bit), entity in zip(slots, entities):
+        if name is None:
+            if not withTags or entity.tagMask & bit != bit:
+                return False
+        elif entity.name != name:
+            return False
+    return True
+
+def compileListener(function, extraArgs, extraKwargs):
+    """
+    Compile a listener into a (function, extraArgs) pair. Extra keyword
+    arguments are bound into function here, so a send never merges them.
+    """
+    extraArgs, extraKwargs = tuple(extraArgs), dict(extraKwargs)
+    if extraKwargs:
+        def call(*args, **kwargs):
+            return function(*args, **(dict(kwargs, **extraKwargs) if kwargs else extraKwargs))
+        return call, extraArgs
+    return function, extraArgs
+
+def dispatch(listeners, args, kwargs):
+    """
+    Call a sequence of compiled listeners.
+    """
+    if args.__class__ is not tuple:
+        args = tuple(args)
+    if kwargs:
+        for function, extraArgs in listeners:
+            function(*(args + extraArgs if extraArgs else args), **kwargs)
+    else:
+        for function, extraArgs in listeners:
+            function(*(args + extraArgs if extraArgs else args))
+
+class EntityEventIndex(object):
+
+    """
+    The structured listeners for one entity event type.
+
+    Patterns with a name slot are indexed by (slot index, name) of their first
+    name slot. Patterns made of tags only are indexed by the bit of their
+    first slot, with wildcards under 0, and a send looks up the bits of its
+    first entity's tags, so it costs the same however many tags have
+    listeners.
+    """
+
+    __slots__ = ("byName", "byTag")
+
+    def __init__(self):
+        self.byName = dict()
+        self.byTag  = dict()
+
+    def bucket(self, slots):
+        for index, (name, bit) in enumerate(slots):
+            if name is not None:
+                return self.byName.setdefault((index, name), [])
+        return self.byTag.setdefault(slots[0][1], [])
+
+    def remove(self, function, slots=None):
+        for buckets in (self.byName, self.byTag):
+            for key, entries in buckets.items():
+                entries[:] = [entry for entry in entries
+                              if entry[4] != function or (slots is not None and entry[2] != slots)]
+                if not entries:
+                    del buckets[key]
+
+    def __nonzero__(self):
+        return bool(self.byName or self.byTag)
+
+    def match(self, entities, withTags):
+        matched = []
+        byName = self.byName
+        if byName:
+            for index, entity in enumerate(entities):
+                entries = byName.get((index, entity.name))
+                if entries:
+                    matched.extend(entry for entry in entries if matchSlots(entry[2], entities, withTags))
+        byTag = self.byTag
+        if withTags and byTag:
+            entries = byTag.get(0)
+            if entries:
+                matched.extend(entry for entry in entries if matchSlots(entry[2], entities))
+            # Look up each of the first entity's own tags, lowest bit first.
+            mask = entities[0].tagMask
+            while mask:
+                bit = mask & -mask
+                mask ^= bit
+                entries = byTag.get(bit)
+                if entries:
+                    matched.extend(entry for entry in entries if matchSlots(entry[2], entities))
+        return matched
 
 class Messenger(object):
 
+    """
+    A global event messenger, in the style of Panda3D.
+
+    Listeners are kept in self.registry, sorted by priority and then by order
+    of addition. Every time the listeners of an event change, that event is
+    compiled into a frozen tuple of (function, extraArgs) pairs in
+    self.dispatchTable, with extra keyword arguments already bound into the
+    function, so send() is a single dict lookup and a flat loop of calls.
+
+    Entity events are structured: a listener subscribes with an event type and
+    one tag-or-name slot per entity, and sendEntityEvent() looks the entities
+    up in self.entityIndex. String patterns such as "collided: [hero] [*]"
+    given to accept() are compiled into the structured form.
+    """
+
     def __init__(self, app):
         self.app = app
         self.registry = dict()
+        self.dispatchTable = dict()
+        self.entityIndex = dict()
+        self._order = count()
 
     def accept(self, eventName, function, extraArgs=[], extraKwargs={}, priority=10):
         if self.app.debugLogging:
             print "Accepting %s for event '%s'" % (methodSignature(function, extraArgs, extraKwargs), eventName)
-        self.registry.setdefault(eventName, [])
+        pattern = parseEntityPattern(eventName)
+        if pattern is not None:
+            eventType, slots = pattern
+            return self.acceptEntityEvent(eventType, slots, function, extraArgs, extraKwargs, priority)
         # Sort by priority, then order of addition.
-        self.registry[eventName].append((priority, len(self.registry[eventName]), function, extraArgs, extraKwargs))
-        self.registry[eventName].sort()
-
-    def send(self, eventName, args=[], kwargs={}):
-        functions = self.registry.get(eventName, [])
-        for _, __, function, args_, kwargs_ in functions:
-            #if self.app.debugLogging:
-            #    print "Calling %s for event '%s'" % (methodSignature(function, args + args_, dict(kwargs, **kwargs_)), eventName)
-            function(*(args + args_), **dict(kwargs, **kwargs_))
+        insort(self.registry.setdefault(eventName, []), (priority, next(self._order), function, extraArgs, extraKwargs))
+        self.compileEvent(eventName)
+
+    def acceptEntityEvent(self, eventType, slots, function, extraArgs=[], extraKwargs={}, priority=10):
+        """
+        Accept an entity event. slots is a sequence of tagSlot() and nameSlot()
+        values, one for each entity the event is sent with.
+        """
+        index = self.entityIndex.get(eventType)
+        if index is None:
+            index = self.entityIndex[eventType] = EntityEventIndex()
+        index.bucket(slots).append((priority, next(self._order), tuple(slots),
+                                    compileListener(function, extraArgs, extraKwargs), function))
+
+    def ignore(self, eventName, function):
+        """
+        Remove every listener of eventName that calls function.
+        """
+        pattern = parseEntityPattern(eventName)
+        if pattern is not None:
+            eventType, slots = pattern
+            return self.ignoreEntityEvent(eventType, function, slots)
+        listeners = [entry for entry in self.registry.get(eventName, []) if entry[2] != function]
+        if listeners:
+            self.registry[eventName] = listeners
+        else:
+            self.registry.pop(eventName, None)
+        self.compileEvent(eventName)
+
+    def ignoreEntityEvent(self, eventType, function, slots=None):
+        """
+        Remove every listener of the entity event eventType that calls function,
+        optionally only those subscribed with the given slots.
+        """
+        index = self.entityIndex.get(eventType)
+        if index is not None:
+            index.remove(function, slots and tuple(slots))
+            if not index:
+                del self.entityIndex[eventType]
+
+    def compileEvent(self, eventName):
+        """
+        Rebuild the dispatch tuple for eventName from the registry.
+        """
+        listeners = self.registry.get(eventName)
+        if not listeners:
+            self.dispatchTable.pop(eventName, None)
+            return
+        self.dispatchTable[eventName] = tuple(compileListener(function, args_, kwargs_)
+                                              for _, __, function, args_, kwargs_ in listeners)
+
+    def hasListeners(self, eventName):
+        return eventName in self.dispatchTable
+
+    def send(self, eventName, args=(), kwargs=_NO_KWARGS):
+        listeners = self.dispatchTable.get(eventName)
+        if listeners is not None:
+            if kwargs:
+                dispatch(listeners, args, kwargs)
+                return
+            # dispatch(), inlined for the common case without keywords.
+            for function, extraArgs in listeners:
+                if extraArgs:
+                    if args.__class__ is not tuple:
+                        args = tuple(args)
+                    function(*(args + extraArgs))
+                else:
+                    function(*args)
+
+    def sendEntityEvent(self, eventType, entities, withTags=True):
+        """
+        Send an entity event to every structured listener whose slots match
+        entities. The entities are passed as the arguments.
+        """
+        index = self.entityIndex.get(eventType)
+        if index is None:
+            return
+        matched = index.match(entities, withTags)
+        if matched:
+            matched.sort()
+            dispatch([entry[3] for entry in matched], entities, _NO_KWARGS)
@@ -0,0 +1,188 @@
+
+"""
+Per-frame profiling.
+
+A FrameProfiler records, for every rendered frame, the time spent in each
+world phase, the simulate cost per entity class and the dispatch count and
+time per messenger event, into a bounded ring buffer.
+
+When enabled it wraps the world's phase methods and the messenger's send
+methods with instance attributes; disabling removes them again, so a
+disabled profiler adds no cost at all.
+"""
+
+import json
+from collections import deque
+from timeit import default_timer
+
+WORLD_PHASES = (
+    ("stepPhysics",       "physics"),
+    ("captureTransforms", "transforms"),
+    ("updateContacts",    "contacts"),
+    ("runScheduled",      "scheduler"),
+    ("interpolate",       "interpolate"),
+)
+
+class FrameRecord(object):
+
+    """
+    The timings of one frame. simulate and events map a class or event name
+    to [count, seconds].
+    """
+
+    __slots__ = ("index", "start", "duration", "ticks", "phases", "simulate", "events")
+
+    def __init__(self, index, start):
+        self.index, self.start, self.duration, self.ticks = index, start, 0.0, 0
+        self.phases, self.simulate, self.events = {}, {}, {}
+
+    def asDict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+def addTiming(table, key, seconds):
+    entry = table.get(key)
+    if entry is None:
+        table[key] = [1, seconds]
+    else:
+        entry[0] += 1
+        entry[1] += seconds
+
+class FrameProfiler(object):
+
+    def __init__(self, app, capacity=300):
+        self.app = app
+        self.frames = deque(maxlen=capacity)
+        self.current = None
+        self.enabled = False
+        self._frameCount = 0
+
+    def enable(self):
+        """
+        Start recording frames.
+        """
+        if self.enabled:
+            return
+        self.enabled = True
+        world, messenger, timer = self.app.world, self.app.messenger, default_timer
+
+        def wrapPhase(method, phase):
+            def timed(*args):
+                start = timer()
+                try:
+                    return method(*args)
+                finally:
+                    if self.current is not None:
+                        self.current.phases[phase] = self.current.phases.get(phase, 0.0) + timer() - start
+            return timed
+
+        for methodName, phase in WORLD_PHASES:
+            setattr(world, methodName, wrapPhase(getattr(world, methodName), phase))
+
+        updateWorld, tick = world.updateWorld, world.tick
+        def profiledUpdateWorld(dt):
+            self.startFrame()
+            return updateWorld(dt)
+        def profiledTick(dt):
+            if self.current is not None:
+                self.current.ticks += 1
+            return tick(dt)
+        world.updateWorld, world.tick = profiledUpdateWorld, profiledTick
+
+        def profiledSimulateEntities(dt):
+            record = self.current
+            for entity in world.simulatingEntities():
+                start = timer()
+                entity.simulate(dt)
+                if record is not None:
+                    addTiming(record.simulate, entity.__class__.__name__, timer() - start)
+        world.simulateEntities = wrapPhase(profiledSimulateEntities, "simulate")
+
+        send, sendEntityEvent = messenger.send, messenger.sendEntityEvent
+        def profiledSend(eventName, *args, **kwargs):
+            start = timer()
+            try:
+                return send(eventName, *args, **kwargs)
+            finally:
+                if self.current is not None:
+                    addTiming(self.current.events, eventName, timer() - start)
+        def profiledSendEntityEvent(eventType, *args, **kwargs):
+            start = timer()
+            try:
+                return sendEntityEvent(eventType, *args, **kwargs)
+            finally:
+                if self.current is not None:
+                    addTiming(self.current.events, eventType + ":", timer() - start)
+        messenger.send, messenger.sendEntityEvent = profiledSend, profiledSendEntityEvent
+
+    def disable(self):
+        """
+        Stop recording frames and remove the wrappers.
+        """
+        if not self.enabled:
+            return
+        self.enabled = False
+        self.endFrame()
+        world, messenger = self.app.world, self.app.messenger
+        for methodName in [methodName for methodName, _ in WORLD_PHASES] + ["updateWorld", "tick", "simulateEntities"]:
+            world.__dict__.pop(methodName, None)
+        for methodName in ("send", "sendEntityEvent"):
+            messenger.__dict__.pop(methodName, None)
+
+    def toggle(self):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def startFrame(self):
+        """
+        Close the frame in progress, if any, and open a new one. A frame runs
+        from one world update to the next, so it includes input dispatch.
+        """
+        now = default_timer()
+        self.endFrame(now)
+        self.current = FrameRecord(self._frameCount, now)
+        self._frameCount += 1
+
+    def endFrame(self, now=None):
+        if self.current is not None:
+            self.current.duration = (now or default_timer()) - self.current.start
+            self.frames.append(self.current)
+            self.current = None
+
+    def lastFrame(self):
+        return self.frames[-1] if self.frames else None
+
+    def slowestFrames(self, count=10):
+        return sorted(self.frames, key=lambda frame: frame.duration, reverse=True)[:count]
+
+    def summary(self):
+        """
+        Averages over the frames in the buffer: mean frame time, mean time per
+        phase, and total [count, seconds] per entity class and event.
+        """
+        frames = list(self.frames)
+        phases, simulate, events = {}, {}, {}
+        for frame in frames:
+            for phase, seconds in frame.phases.iteritems():
+                phases[phase] = phases.get(phase, 0.0) + seconds
+            for table, totals in ((frame.simulate, simulate), (frame.events, events)):
+                for key, (count, seconds) in table.iteritems():
+                    entry = totals.setdefault(key, [0, 0.0])
+                    entry[0] += count
+                    entry[1] += seconds
+        numFrames = len(frames) or 1
+        return dict(
+            frames    = len(frames),
+            frameTime = sum(frame.duration for frame in frames) / numFrames,
+            phases    = dict((phase, seconds / numFrames) for phase, seconds in phases.iteritems()),
+            simulate  = simulate,
+            events    = events,
+        )
+
+    def dump(self, filename):
+        """
+        Write the summary and every buffered frame to a JSON file.
+        """
+        with open(filename, "w") as f:
+            json.dump(dict(summary=self.summary(), frames=[frame.asDict() for frame in self.frames]), f, indent=1)
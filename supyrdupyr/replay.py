@@ -0,0 +1,240 @@
+"""
+Input recordings, and replaying them into a headless world.
+
+An InputRecorder writes, for every rendered frame, the dt the world was
+advanced by and the input dispatched after it: key and mouse button events
+with their keycodes and messenger event names, and folded mouse motion.
+Frame times add up to each event's timestamp. When recording stops, the
+recorder also writes a digest of the world's end state, after an event-less
+frame for a last world update whose input was never dispatched, such as
+the frame the window was closed on.
+
+Replaying feeds the same dts to the world and dispatches the same events
+through the ActionMap and messenger, one frame at a time and without a
+window, so a recorded play session becomes a repeatable workload: replay()
+returns every frame's wall-clock time, and comparing worldDigest() with the
+log's digest afterwards tells whether the world ended in the recorded state.
+
+The file uses the save game's record framing:
+
+    header   "SDIR", format version (uint16), world tick rate (double)
+    records  type (byte), payload length (varint), payload
+
+Event names are interned in STRING records like save game strings. A FRAME
+record holds dt (double), the event count (varint) and the events: kind
+(byte), then for motion the relative and absolute X, Y and Z (signed
+varints), otherwise the code (varint) and the name's string id (varint),
+followed for keys by the key's text (varint) and for mouse buttons by the
+absolute X, Y and Z (signed varints) and the held buttons (varint). Format 1
+recordings wrote a text of 0 for buttons instead, and still load, without
+the mouse state. The END record holds the end state digest, if any.
+
+Only input is recorded. Events that the game sends through the messenger
+itself are not, as replaying the input makes them again; the exception is
+events that depend on timing outside the world, such as
+"resource-group-prefetched", which may arrive on a different frame.
+"""
+
+import hashlib
+import struct
+from timeit import default_timer
+
+from supyrdupyr.inputqueue import (KEY_DOWN, KEY_UP, MOTION, MOTION_EVENT, KeyInput, ButtonInput,
+                                   MouseMotion, dispatchInput)
+from supyrdupyr.savegame import (SaveGame, SaveGameError, DOUBLE, encodeVarint, decodeVarint,
+                                 encodeSigned, decodeSigned, readVarint)
+
+MAGIC          = "SDIR"
+FORMAT_VERSION = 2
+HEADER         = struct.Struct("<4sHd")
+
+RECORD_END, RECORD_STRING, RECORD_FRAME = 0, 1, 2
+
+def worldDigest(world):
+    """
+    A digest of a world's saveable state, to tell whether two runs ended the same.
+    """
+    sg = SaveGame.fromWorld(world)
+    sg.entities.sort(key=lambda state: state.name)
+    return hashlib.md5(sg.dumps()).digest()
+
+class RecordedFrame(object):
+    __slots__ = ("time", "dt", "events")
+
+    def __init__(self, time, dt, events):
+        self.time, self.dt, self.events = time, dt, events
+
+class InputRecorder(object):
+
+    def __init__(self, stream, tickRate=0.0):
+        self.stream = stream
+        self.strings = {}
+        self.frames = 0
+        stream.write(HEADER.pack(MAGIC, FORMAT_VERSION, tickRate))
+
+    def writeRecord(self, recordType, payload):
+        write = self.stream.write
+        write(chr(recordType))
+        encodeVarint(len(payload), write)
+        write(payload)
+
+    def stringId(self, value):
+        try:
+            return self.strings[value]
+        except KeyError:
+            self.writeRecord(RECORD_STRING, value)
+            id = self.strings[value] = len(self.strings)
+            return id
+
+    def writeFrame(self, dt, events):
+        parts = []
+        write = parts.append
+        write(DOUBLE.pack(dt))
+        encodeVarint(len(events), write)
+        for kind, code, name, evt in events:
+            write(chr(kind))
+            if kind == MOTION:
+                for value in (evt.x, evt.y, evt.z, evt.absX, evt.absY, evt.absZ):
+                    encodeSigned(value, write)
+            else:
+                encodeVarint(code, write)
+                encodeVarint(self.stringId(name), write)
+                if kind in (KEY_DOWN, KEY_UP):
+                    encodeVarint(evt.text, write)
+                else:
+                    for value in (evt.absX, evt.absY, evt.absZ):
+                        encodeSigned(value, write)
+                    encodeVarint(evt.buttons, write)
+        self.writeRecord(RECORD_FRAME, "".join(parts))
+        self.frames += 1
+
+    def close(self, world=None):
+        """
+        End the recording, with the digest of world's state if given.
+        """
+        if world is not None and world.frameCount > self.frames:
+            self.writeFrame(world.frameTime, [])
+        self.writeRecord(RECORD_END, worldDigest(world) if world is not None else "")
+        self.stream.close()
+
+class InputLog(object):
+
+    """
+    Reads a recording. Iterating over it yields one RecordedFrame at a time;
+    digest holds the recorded end state once the END record has been read.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.strings = []
+        self.digest = None
+        header = stream.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise SaveGameError("Not an input recording.")
+        magic, self.version, self.tickRate = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise SaveGameError("Not an input recording.")
+        if self.version > FORMAT_VERSION:
+            raise SaveGameError("Input recording format %d is newer than this version supports (%d)." % (self.version, FORMAT_VERSION))
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Read a whole recording. Returns (log, frames).
+        """
+        with open(filename, "rb") as stream:
+            log = cls(stream)
+            return log, list(log)
+
+    def __iter__(self):
+        stream, strings = self.stream, self.strings
+        time = 0.0
+        while True:
+            char = stream.read(1)
+            if not char:
+                raise SaveGameError("Unexpected end of input recording.")
+            recordType = ord(char)
+            length = readVarint(stream)
+            payload = stream.read(length)
+            if len(payload) < length:
+                raise SaveGameError("Unexpected end of input recording.")
+            if recordType == RECORD_END:
+                self.digest = payload or None
+                return
+            elif recordType == RECORD_STRING:
+                strings.append(payload)
+            elif recordType == RECORD_FRAME:
+                frame = self.readFrame(payload, time)
+                time += frame.dt
+                yield frame
+
+    def readFrame(self, data, time):
+        strings = self.strings
+        dt, = DOUBLE.unpack_from(data, 0)
+        count, offset = decodeVarint(data, DOUBLE.size)
+        events = []
+        for _ in xrange(count):
+            kind = ord(data[offset])
+            offset += 1
+            if kind == MOTION:
+                motion = MouseMotion()
+                motion.x, offset = decodeSigned(data, offset)
+                motion.y, offset = decodeSigned(data, offset)
+                motion.z, offset = decodeSigned(data, offset)
+                motion.absX, offset = decodeSigned(data, offset)
+                motion.absY, offset = decodeSigned(data, offset)
+                motion.absZ, offset = decodeSigned(data, offset)
+                motion.count = 1
+                events.append((kind, 0, MOTION_EVENT, motion))
+            else:
+                code, offset = decodeVarint(data, offset)
+                nameId, offset = decodeVarint(data, offset)
+                if kind in (KEY_DOWN, KEY_UP):
+                    text, offset = decodeVarint(data, offset)
+                    evt = KeyInput(code, text)
+                elif self.version < 2:
+                    _, offset = decodeVarint(data, offset)
+                    evt = ButtonInput(code)
+                else:
+                    evt = ButtonInput(code)
+                    evt.absX, offset = decodeSigned(data, offset)
+                    evt.absY, offset = decodeSigned(data, offset)
+                    evt.absZ, offset = decodeSigned(data, offset)
+                    evt.buttons, offset = decodeVarint(data, offset)
+                events.append((kind, code, strings[nameId], evt))
+        return RecordedFrame(time, dt, events)
+
+class ReplayFrameListener(object):
+
+    """
+    Dispatches one recorded frame's events per frame, where a
+    MessengerFrameListener would dispatch captured input.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.frame = None
+
+    def frameRenderingQueued(self, evt):
+        if self.frame is not None:
+            dispatchInput(self.frame.events, self.app.actions, self.app.messenger, self)
+        return True
+
+def replay(app, frames):
+    """
+    Run recorded frames through an app that has been set up, such as a
+    HeadlessApplication. Returns the wall-clock seconds of every frame.
+    """
+    listener = ReplayFrameListener(app)
+    app.root.addFrameListener(listener)
+    timer, renderOneFrame = default_timer, app.root.renderOneFrame
+    times = []
+    try:
+        for frame in frames:
+            listener.frame = frame
+            start = timer()
+            renderOneFrame(frame.dt)
+            times.append(timer() - start)
+    finally:
+        app.root.removeFrameListener(listener)
+    return times
@@ -0,0 +1,219 @@
+
+"""
+On-demand and background resource group loading.
+
+Instead of initialising every group in resources.cfg at startup, the
+application initialises its startupResourceGroups, and each World declares
+the groups its level needs (World.resourceGroups) and the ones it will
+probably need next (World.prefetchResourceGroups). Groups are initialised
+when first required, and when a world activates a different set, the groups
+it no longer uses are cleared: their resources are destroyed, and they are
+initialised again if they are required later.
+
+Prefetching reads a group's files on a background thread, so the disk I/O is
+done before Ogre loads them on the main thread. Ogre itself is only ever
+called from the main thread.
+
+Progress is reported through the messenger, on the main thread:
+
+    "resource-group-loading"  [groupName, loaded, total]
+    "resource-group-loaded"   [groupName]
+    "resource-group-prefetched" [groupName, bytesRead]
+"""
+
+import os
+import os.path
+import threading
+import zipfile
+from Queue import Queue, Empty
+
+import ogre.renderer.OGRE as ogre
+
+class ResourcePrefetcher(threading.Thread):
+
+    """
+    A daemon thread that reads the files of queued resource groups.
+    Finished groups are put on the done queue as (groupName, bytesRead).
+    """
+
+    chunkSize = 1 << 20
+
+    def __init__(self):
+        threading.Thread.__init__(self, name="ResourcePrefetcher")
+        self.daemon = True
+        self.pending = Queue()
+        self.done = Queue()
+
+    def run(self):
+        while True:
+            groupName, locations = self.pending.get()
+            bytesRead = 0
+            for type, path in locations:
+                try:
+                    bytesRead += self.readLocation(type, path)
+                except (IOError, OSError, zipfile.BadZipfile):
+                    pass
+            self.done.put((groupName, bytesRead))
+
+    def readLocation(self, type, path):
+        if type == "Zip":
+            archive = zipfile.ZipFile(path)
+            return sum(len(archive.read(name)) for name in archive.namelist())
+        bytesRead = 0
+        for dirpath, dirnames, filenames in os.walk(path):
+            for filename in filenames:
+                with open(os.path.join(dirpath, filename), "rb") as f:
+                    chunk = f.read(self.chunkSize)
+                    while chunk:
+                        bytesRead += len(chunk)
+                        chunk = f.read(self.chunkSize)
+        return bytesRead
+
+class ResourceLoader(object):
+
+    """
+    Tracks which resource groups are initialised and loaded, and drives
+    Ogre's ResourceGroupManager and the background prefetcher.
+    """
+
+    def __init__(self, app, locations):
+        self.app = app
+        self.groups = {}
+        for group, type, path in locations:
+            self.groups.setdefault(group, []).append((type, path))
+        self.initialised = set()
+        self.loaded = set()
+        self.prefetching = set()
+        self.prefetched = set()
+        self.pinned = set()
+        self.prefetcher = None
+
+    def initialiseGroup(self, groupName):
+        ogre.ResourceGroupManager.getSingleton().initialiseResourceGroup(groupName)
+
+    def loadGroup(self, groupName):
+        ogre.ResourceGroupManager.getSingleton().loadResourceGroup(groupName)
+
+    def unloadGroup(self, groupName):
+        ogre.ResourceGroupManager.getSingleton().unloadResourceGroup(groupName)
+
+    def clearGroup(self, groupName):
+        ogre.ResourceGroupManager.getSingleton().clearResourceGroup(groupName)
+
+    def require(self, groupNames, load=False):
+        """
+        Make sure the given groups are initialised, so their scripts are
+        parsed and their resources declared. With load, also load them now
+        instead of on first use.
+        """
+        for groupName in groupNames:
+            if groupName not in self.initialised:
+                self.initialiseGroup(groupName)
+                self.initialised.add(groupName)
+            if load and groupName not in self.loaded:
+                self.loadGroup(groupName)
+                self.loaded.add(groupName)
+
+    def initialiseAll(self):
+        """
+        Initialise every group at once, like Ogre's initialiseAllResourceGroups.
+        """
+        ogre.ResourceGroupManager.getSingleton().initialiseAllResourceGroups()
+        self.initialised.update(self.groups)
+        self.pinned.update(self.groups)
+
+    def pin(self, groupNames):
+        """
+        Require groups that must never be unloaded, such as the startup groups.
+        """
+        self.pinned.update(groupNames)
+        self.require(groupNames)
+
+    def release(self, groupName):
+        """
+        Clear an initialised group, so it takes no memory until it is
+        required again.
+        """
+        self.clearGroup(groupName)
+        self.initialised.discard(groupName)
+        self.loaded.discard(groupName)
+
+    def activate(self, groupNames, load=False):
+        """
+        Require the groups of the active level and release every other
+        initialised group that isn't pinned.
+        """
+        groupNames = set(groupNames)
+        self.require(groupNames, load)
+        for groupName in list(self.initialised - groupNames - self.pinned):
+            self.release(groupName)
+
+    def prefetch(self, groupNames):
+        """
+        Read the files of the given groups on the background thread.
+        """
+        if self.prefetcher is None:
+            self.prefetcher = ResourcePrefetcher()
+            self.prefetcher.start()
+        for groupName in groupNames:
+            if groupName in self.groups and groupName not in self.prefetching | self.prefetched:
+                self.prefetching.add(groupName)
+                self.prefetcher.pending.put((groupName, list(self.groups[groupName])))
+
+    def poll(self):
+        """
+        Report finished prefetches. Called once per frame on the main thread.
+        """
+        if not self.prefetching:
+            return
+        while True:
+            try:
+                groupName, bytesRead = self.prefetcher.done.get_nowait()
+            except Empty:
+                return
+            self.prefetching.discard(groupName)
+            self.prefetched.add(groupName)
+            self.app.messenger.send("resource-group-prefetched", [groupName, bytesRead])
+
+class ResourceProgressListener(ogre.ResourceGroupListener):
+
+    """
+    Turns Ogre's resource group callbacks into messenger events.
+    """
+
+    def __init__(self, app):
+        ogre.ResourceGroupListener.__init__(self)
+        self.app = app
+        self.groupName, self.total, self.count = None, 0, 0
+
+    def resourceGroupScriptingStarted(self, groupName, scriptCount):
+        pass
+
+    def scriptParseStarted(self, *args):
+        pass
+
+    def scriptParseEnded(self, *args):
+        pass
+
+    def resourceGroupScriptingEnded(self, groupName):
+        pass
+
+    def resourceGroupLoadStarted(self, groupName, resourceCount):
+        self.groupName, self.total, self.count = groupName, resourceCount, 0
+        self.app.messenger.send("resource-group-loading", [groupName, 0, resourceCount])
+
+    def resourceLoadStarted(self, resource):
+        pass
+
+    def resourceLoadEnded(self):
+        self.count += 1
+        self.app.messenger.send("resource-group-loading", [self.groupName, self.count, self.total])
+
+    def worldGeometryStageStarted(self, description):
+        pass
+
+    def worldGeometryStageEnded(self):
+        pass
+
+    def resourceGroupLoadEnded(self, groupName):
+        self.app.messenger.send("resource-group-loaded", [groupName])
@@ -1,20 +1,657 @@
 
-try:
-    import cPickle as pickle
-except ImportError:
-    import pickle
+"""
+Save games.
 
+A save game records only simulation state, never Ogre or Bullet objects: for
+every entity its class, name, tags, transform, velocity, enabled/killed
+flags, class-specific data (such as timer state) and IO bindings.
 
-class SaveGame(object):
+The file is a compact, versioned binary stream:
+
+    header   "SDSV", format version (uint16), flags (uint16), world time (double)
+    records  type (byte), payload length (varint), payload
+
+Strings are interned: a STRING record gives the next string id its value
+before any record that uses it, so the stream can be read one record at a
+time. The stream ends with an END record.
+
+Saves can also be incremental. A SaveSlot is a directory holding one full
+base save and the delta saves written after it, which hold only the
+entities that changed; loading merges them in order, and compaction folds the
+deltas back into a new base. A BackgroundSaver captures the dirty entities
+a bounded number per frame, taking an entity early when it is about to
+change, so the save still holds the world as it was when the save started;
+a worker thread encodes and writes them.
+"""
+
+import os
+import os.path
+import re
+import struct
+import sys
+import threading
+from cStringIO import StringIO
+from Queue import Queue
+
+MAGIC          = "SDSV"
+FORMAT_VERSION = 2
+HEADER         = struct.Struct("<4sHHd")
+
+RECORD_END, RECORD_STRING, RECORD_ENTITY = 0, 1, 2
+
+FLAG_ENABLED, FLAG_KILLED, FLAG_TRANSFORM, FLAG_VELOCITY = 1, 2, 4, 8
+
+SAVE_DELTA = 1
+
+TRANSFORM = struct.Struct("<7d")
+VELOCITY  = struct.Struct("<6d")
+DOUBLE    = struct.Struct("<d")
+
+class SaveGameError(Exception):
     pass
 
+class EntityState(object):
+
+    """
+    The saved state of one entity.
+
+    transform is (x, y, z, qx, qy, qz, qw), velocity is (linear xyz, angular
+    xyz), data is a dict of class-specific values and bindings is a list of
+    (outputName, targetName, inputName, delay, timesToFire).
+    """
+
+    __slots__ = ("className", "name", "tags", "enabled", "killed", "transform", "velocity", "data", "bindings")
+
+    def __init__(self, className, name, tags=(), enabled=True, killed=False, transform=None, velocity=None, data=None, bindings=None):
+        self.className, self.name, self.tags = className, name, list(tags)
+        self.enabled, self.killed = enabled, killed
+        self.transform, self.velocity = transform, velocity
+        self.data = data if data is not None else {}
+        self.bindings = bindings if bindings is not None else []
+
+    def __eq__(self, other):
+        return isinstance(other, EntityState) and all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "<EntityState %s %r>" % (self.className, self.name)
+
+def encodeVarint(value, write):
+    while value > 0x7F:
+        write(chr((value & 0x7F) | 0x80))
+        value >>= 7
+    write(chr(value))
+
+def decodeVarint(data, offset):
+    value, shift = 0, 0
+    while True:
+        byte = ord(data[offset])
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+def encodeSigned(value, write):
+    encodeVarint(value << 1 if value >= 0 else ((-value) << 1) - 1, write)
+
+def decodeSigned(data, offset):
+    value, offset = decodeVarint(data, offset)
+    return (value >> 1) ^ -(value & 1), offset
+
+def readVarint(stream):
+    value, shift = 0, 0
+    while True:
+        char = stream.read(1)
+        if not char:
+            raise SaveGameError("Unexpected end of save game.")
+        byte = ord(char)
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value
+        shift += 7
+
+class SaveWriter(object):
+
+    """
+    Writes entity states to a binary stream, one record at a time.
+    """
+
+    def __init__(self, stream, time=0.0, flags=0):
+        self.stream = stream
+        self.strings = {}
+        stream.write(HEADER.pack(MAGIC, FORMAT_VERSION, flags, time))
+
+    def writeRecord(self, recordType, payload):
+        write = self.stream.write
+        write(chr(recordType))
+        encodeVarint(len(payload), write)
+        write(payload)
+
+    def stringId(self, value):
+        """
+        Get the id of a string, writing a STRING record the first time it's seen.
+        """
+        try:
+            return self.strings[value]
+        except KeyError:
+            data = value.encode("utf-8") if isinstance(value, unicode) else value
+            self.writeRecord(RECORD_STRING, data)
+            id = self.strings[value] = len(self.strings)
+            return id
+
+    def writeValue(self, value, write):
+        if value is None:
+            write("N")
+        elif value is True:
+            write("T")
+        elif value is False:
+            write("F")
+        elif isinstance(value, (int, long)):
+            write("I")
+            encodeSigned(value, write)
+        elif isinstance(value, float):
+            write("D")
+            write(DOUBLE.pack(value))
+        elif isinstance(value, basestring):
+            write("S")
+            encodeVarint(self.stringId(value), write)
+        elif isinstance(value, (list, tuple)):
+            write("L" if isinstance(value, list) else "U")
+            encodeVarint(len(value), write)
+            for item in value:
+                self.writeValue(item, write)
+        elif isinstance(value, dict):
+            write("M")
+            encodeVarint(len(value), write)
+            for key, item in value.iteritems():
+                self.writeValue(key, write)
+                self.writeValue(item, write)
+        else:
+            raise SaveGameError("Can't save values of type %s." % (type(value).__name__,))
+
+    def writeEntity(self, state):
+        parts = []
+        write = parts.append
+        flags = ((state.enabled and FLAG_ENABLED) | (state.killed and FLAG_KILLED) |
+                 (state.transform is not None and FLAG_TRANSFORM) | (state.velocity is not None and FLAG_VELOCITY))
+        write(chr(flags))
+        encodeVarint(self.stringId(state.className or ""), write)
+        encodeVarint(self.stringId(state.name), write)
+        encodeVarint(len(state.tags), write)
+        for tag in state.tags:
+            encodeVarint(self.stringId(tag), write)
+        if state.transform is not None:
+            write(TRANSFORM.pack(*state.transform))
+        if state.velocity is not None:
+            write(VELOCITY.pack(*state.velocity))
+        self.writeValue(state.data, write)
+        encodeVarint(len(state.bindings), write)
+        for outputName, targetName, inputName, delay, timesToFire in state.bindings:
+            encodeVarint(self.stringId(outputName), write)
+            encodeVarint(self.stringId(targetName), write)
+            encodeVarint(self.stringId(inputName), write)
+            write(DOUBLE.pack(delay))
+            encodeSigned(timesToFire, write)
+        self.writeRecord(RECORD_ENTITY, "".join(parts))
+
+    def close(self):
+        self.writeRecord(RECORD_END, "")
+
+class SaveReader(object):
+
+    """
+    Reads a binary save stream. Iterating over it yields one EntityState at a
+    time, so large saves never have to be held in memory at once.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.strings = []
+        header = stream.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise SaveGameError("Not a save game.")
+        magic, self.version, self.flags, self.time = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise SaveGameError("Not a save game.")
+        if self.version > FORMAT_VERSION:
+            raise SaveGameError("Save game format %d is newer than this version supports (%d)." % (self.version, FORMAT_VERSION))
+
+    def __iter__(self):
+        stream, strings = self.stream, self.strings
+        while True:
+            char = stream.read(1)
+            if not char:
+                raise SaveGameError("Unexpected end of save game.")
+            recordType = ord(char)
+            length = readVarint(stream)
+            payload = stream.read(length)
+            if len(payload) < length:
+                raise SaveGameError("Unexpected end of save game.")
+            if recordType == RECORD_END:
+                return
+            elif recordType == RECORD_STRING:
+                strings.append(payload.decode("utf-8"))
+            elif recordType == RECORD_ENTITY:
+                yield self.readEntity(payload)
+            # Unknown record types from newer minor revisions are skipped.
+
+    def readValue(self, data, offset):
+        kind = data[offset]
+        offset += 1
+        if kind == "N":
+            return None, offset
+        elif kind == "T":
+            return True, offset
+        elif kind == "F":
+            return False, offset
+        elif kind == "I":
+            return decodeSigned(data, offset)
+        elif kind == "D":
+            return DOUBLE.unpack_from(data, offset)[0], offset + DOUBLE.size
+        elif kind == "S":
+            id, offset = decodeVarint(data, offset)
+            return self.strings[id], offset
+        elif kind in "LU":
+            count, offset = decodeVarint(data, offset)
+            items = []
+            for _ in xrange(count):
+                item, offset = self.readValue(data, offset)
+                items.append(item)
+            return (items if kind == "L" else tuple(items)), offset
+        elif kind == "M":
+            count, offset = decodeVarint(data, offset)
+            items = {}
+            for _ in xrange(count):
+                key, offset = self.readValue(data, offset)
+                items[key], offset = self.readValue(data, offset)
+            return items, offset
+        raise SaveGameError("Unknown value type %r." % (kind,))
+
+    def readEntity(self, data):
+        strings = self.strings
+        flags = ord(data[0])
+        id, offset = decodeVarint(data, 1)
+        className = strings[id] or None
+        id, offset = decodeVarint(data, offset)
+        name = strings[id]
+        count, offset = decodeVarint(data, offset)
+        tags = []
+        for _ in xrange(count):
+            id, offset = decodeVarint(data, offset)
+            tags.append(strings[id])
+        transform = velocity = None
+        if flags & FLAG_TRANSFORM:
+            transform = TRANSFORM.unpack_from(data, offset)
+            offset += TRANSFORM.size
+        if flags & FLAG_VELOCITY:
+            velocity = VELOCITY.unpack_from(data, offset)
+            offset += VELOCITY.size
+        entityData, offset = self.readValue(data, offset)
+        count, offset = decodeVarint(data, offset)
+        bindings = []
+        for _ in xrange(count):
+            outputId, offset = decodeVarint(data, offset)
+            targetId, offset = decodeVarint(data, offset)
+            inputId, offset = decodeVarint(data, offset)
+            delay, timesToFire = 0, -1
+            if self.version >= 2:
+                delay = DOUBLE.unpack_from(data, offset)[0]
+                timesToFire, offset = decodeSigned(data, offset + DOUBLE.size)
+            bindings.append((strings[outputId], strings[targetId], strings[inputId], delay, timesToFire))
+        return EntityState(className, name, tags, bool(flags & FLAG_ENABLED), bool(flags & FLAG_KILLED),
+                           transform, velocity, entityData, bindings)
+
+def resolveClass(className):
+    """
+    Find an entity class from its "module.Class" name.
+    """
+    moduleName, _, name = className.rpartition(".")
+    __import__(moduleName)
+    return getattr(sys.modules[moduleName], name)
+
+def captureWorld(world):
+    """
+    Get the EntityState of every entity in a world, including killed ones.
+    """
+    states = []
+    for name, entity in world.entities.iteritems():
+        if entity is None:
+            states.append(EntityState(None, name, killed=True, enabled=False))
+        else:
+            states.append(entity.getSaveState())
+    return states
+
+def restoreWorld(world, states):
+    """
+    Apply entity states to a world whose level has already been set up.
+    Entities missing from the world are created with their class's
+    fromSaveState(); a SaveGameError is raised for one whose class can't
+    recreate it. Bindings are applied once every entity exists, so states
+    may be a stream.
+    """
+    bindings = []
+    for state in states:
+        entity = world.entities.get(state.name)
+        if state.killed:
+            if entity is not None:
+                entity.isNotKilled = False
+                world.killEntity(entity)
+            continue
+        if entity is None:
+            factory = getattr(resolveClass(state.className), "fromSaveState", None)
+            if factory is None:
+                raise SaveGameError("The level has no entity %r, and %s can't be created from a save game."
+                                    % (state.name, state.className))
+            # Drop the slot of the entity if it was killed since, so it can be added again.
+            world.entities.pop(state.name, None)
+            entity = factory(world, state)
+        entity.applySaveState(state)
+        bindings.append((entity, state.bindings))
+
+    for entity, entityBindings in bindings:
+        entity.applySaveBindings(entityBindings)
+
+class SaveGame(object):
+
+    """
+    A whole save game in memory: the world time and every entity's state.
+    A delta save game only holds the entities that changed since the
+    previous save.
+    """
+
+    def __init__(self, time=0.0, entities=None, delta=False):
+        self.time = time
+        self.entities = entities if entities is not None else []
+        self.delta = delta
+
+    @classmethod
+    def fromWorld(cls, world):
+        return cls(world.time, captureWorld(world))
+
+    def applyTo(self, world):
+        world.time = self.time
+        restoreWorld(world, self.entities)
+
+    def write(self, stream):
+        writer = SaveWriter(stream, self.time, SAVE_DELTA if self.delta else 0)
+        for state in self.entities:
+            writer.writeEntity(state)
+        writer.close()
+
+    def dumps(self):
+        stream = StringIO()
+        self.write(stream)
+        return stream.getvalue()
+
+    @classmethod
+    def read(cls, stream):
+        reader = SaveReader(stream)
+        return cls(reader.time, list(reader), bool(reader.flags & SAVE_DELTA))
+
+    @classmethod
+    def loads(cls, data):
+        return cls.read(StringIO(data))
+
+def mergeStates(saves):
+    """
+    Merge a base save and its deltas, in order, into one list of entity
+    states where the latest state of each entity wins.
+    """
+    merged, order = {}, []
+    for sg in saves:
+        for state in sg.entities:
+            if state.name not in merged:
+                order.append(state.name)
+            merged[state.name] = state
+    return [merged[name] for name in order]
+
 def load(filename):
-    sg = pickle.load(open(filename))
-    assert isinstance(sg, SaveGame)
-    return sg
+    with open(filename, "rb") as f:
+        return SaveGame.read(f)
 
-def new():
-    return SaveGame()
+def new(world=None):
+    return SaveGame.fromWorld(world) if world is not None else SaveGame()
 
 def save(sg, filename):
-    pickle.dump(open(filename))
+    with open(filename, "wb") as f:
+        sg.write(f)
+
+def iterEntityStates(filename):
+    """
+    Stream the entity states out of a save file.
+    """
+    with open(filename, "rb") as f:
+        for state in SaveReader(f):
+            yield state
+
+def writeFileAtomically(filename, sg):
+    with open(filename + ".tmp", "wb") as f:
+        sg.write(f)
+    if os.path.exists(filename):
+        os.remove(filename)
+    os.rename(filename + ".tmp", filename)
+
+class SaveSlot(object):
+
+    """
+    A directory holding a base save, base-<generation>.sav, and the delta
+    saves written after it, delta-<generation>-<n>.sav.
+    """
+
+    FILE_RE = re.compile(r"^(base|delta)-(\d+)(?:-(\d+))?\.sav$")
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.generation, self.deltas = self.scan()
+
+    def scan(self):
+        """
+        Find the newest base generation and its deltas, in order.
+        """
+        if not os.path.isdir(self.directory):
+            return None, []
+        bases, deltas = set(), {}
+        for filename in os.listdir(self.directory):
+            match = self.FILE_RE.match(filename)
+            if match is None:
+                continue
+            kind, generation, number = match.groups()
+            if kind == "base":
+                bases.add(int(generation))
+            else:
+                deltas.setdefault(int(generation), []).append(int(number))
+        if not bases:
+            return None, []
+        generation = max(bases)
+        return generation, sorted(deltas.get(generation, []))
+
+    def basePath(self, generation):
+        return os.path.join(self.directory, "base-%d.sav" % (generation,))
+
+    def deltaPath(self, generation, number):
+        return os.path.join(self.directory, "delta-%d-%d.sav" % (generation, number))
+
+    def hasBase(self):
+        return self.generation is not None
+
+    def writeFull(self, sg):
+        """
+        Write a full save as the next base generation, dropping the old files.
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        oldGeneration, oldDeltas = self.generation, self.deltas
+        generation = 0 if oldGeneration is None else oldGeneration + 1
+        writeFileAtomically(self.basePath(generation), sg)
+        self.generation, self.deltas = generation, []
+        if oldGeneration is not None:
+            os.remove(self.basePath(oldGeneration))
+            for number in oldDeltas:
+                os.remove(self.deltaPath(oldGeneration, number))
+
+    def writeDelta(self, sg):
+        """
+        Write a delta save after the current base and deltas.
+        """
+        if self.generation is None:
+            raise SaveGameError("A delta save needs a base save to apply to.")
+        number = self.deltas[-1] + 1 if self.deltas else 0
+        writeFileAtomically(self.deltaPath(self.generation, number), sg)
+        self.deltas.append(number)
+
+    def load(self):
+        """
+        Load the base save with every delta merged in.
+        """
+        if self.generation is None:
+            raise SaveGameError("There is no save in %s." % (self.directory,))
+        saves = [load(self.basePath(self.generation))]
+        saves.extend(load(self.deltaPath(self.generation, number)) for number in self.deltas)
+        return SaveGame(saves[-1].time, mergeStates(saves))
+
+    def compact(self):
+        """
+        Fold the deltas into a new base save.
+        """
+        if self.deltas:
+            self.writeFull(self.load())
+
+class BackgroundSaver(object):
+
+    """
+    Saves a world into a SaveSlot without stalling the frame.
+
+    Entities call World.markDirty() before their saved state changes. A save
+    starts with the dirty entities pending, and update() captures at most
+    captureBudget of them per frame with getSaveState(). An entity that is
+    still pending when it is about to change is captured right then, so
+    every state is the one it had when the save started; physics bodies are
+    handled by the world around each step, see entitiesStepping() and
+    entitiesWoken(). A worker thread then encodes and writes the states. The
+    first save of a slot is a full one; later saves are deltas, compacted
+    into a new base every compactEvery deltas.
+
+    update() must be called once per frame.
+    """
+
+    def __init__(self, world, slot, interval=None, captureBudget=500, compactEvery=10):
+        self.world, self.slot = world, slot
+        self.interval, self.captureBudget, self.compactEvery = interval, captureBudget, compactEvery
+        self.sinceLastSave = 0.0
+        self.pending, self.captured, self.capturingDelta, self.captureTime = None, None, False, 0.0
+        self.baseQueued = slot.hasBase()
+        self.jobs = Queue()
+        self.errors = []
+        self.worker = threading.Thread(target=self.work, name="BackgroundSaver")
+        self.worker.daemon = True
+        self.worker.start()
+
+    @property
+    def capturing(self):
+        return self.pending is not None
+
+    @property
+    def saving(self):
+        return self.pending is not None or self.jobs.unfinished_tasks > 0
+
+    def quicksave(self):
+        """
+        Start a save of the world as it is now. Returns False if one is
+        already being captured.
+        """
+        if self.pending is not None:
+            return False
+        world = self.world
+        self.capturingDelta = self.baseQueued
+        self.pending = set(world.dirtyEntities if self.capturingDelta else world.entities)
+        world.dirtyEntities.clear()
+        self.captured, self.captureTime = [], world.time
+        self.sinceLastSave = 0.0
+        return True
+
+    def snapshot(self, name):
+        entity = self.world.entities.get(name)
+        if entity is None:
+            return EntityState(None, name, enabled=False, killed=True)
+        return entity.getSaveState()
+
+    def entityChanging(self, name):
+        """
+        Capture a pending entity before its saved state changes.
+        """
+        pending = self.pending
+        if pending is not None and name in pending:
+            pending.remove(name)
+            self.captured.append(self.snapshot(name))
+
+    def entitiesStepping(self, entities):
+        """
+        Capture the pending entities among entities, whose bodies are awake,
+        before a physics step moves them.
+        """
+        pending = self.pending
+        if pending:
+            for entity in entities:
+                if entity.name in pending:
+                    self.entityChanging(entity.name)
+
+    def entitiesWoken(self, entities, transforms):
+        """
+        Capture the pending entities among entities, which a physics step
+        just woke and moved. They were at rest, and their transform from
+        before the step is still in transforms.
+        """
+        pending, captured = self.pending, self.captured
+        if pending:
+            for entity in entities:
+                if entity.name in pending:
+                    pending.remove(entity.name)
+                    state = entity.getSaveState()
+                    state.transform = transforms.previousTransform(entity)
+                    if state.velocity is not None:
+                        state.velocity = (0.0,) * 6
+                    captured.append(state)
+
+    def update(self, dt):
+        if self.interval is not None:
+            self.sinceLastSave += dt
+            if self.sinceLastSave >= self.interval:
+                self.quicksave()
+        if self.pending is not None:
+            self.capture(self.captureBudget)
+
+    def capture(self, budget):
+        pending, captured = self.pending, self.captured
+        for _ in xrange(min(budget, len(pending))):
+            captured.append(self.snapshot(pending.pop()))
+        if not pending:
+            self.jobs.put(SaveGame(self.captureTime, captured, self.capturingDelta))
+            self.baseQueued = True
+            self.pending, self.captured = None, None
+
+    def work(self):
+        while True:
+            sg = self.jobs.get()
+            try:
+                if sg.delta:
+                    self.slot.writeDelta(sg)
+                    if len(self.slot.deltas) >= self.compactEvery:
+                        self.slot.compact()
+                else:
+                    self.slot.writeFull(sg)
+            except Exception, e:
+                self.errors.append(e)
+            finally:
+                self.jobs.task_done()
+
+    def flush(self):
+        """
+        Finish the save being captured, if any, and wait for the worker to
+        write everything out.
+        """
+        if self.pending is not None:
+            self.capture(len(self.pending))
+        self.jobs.join()
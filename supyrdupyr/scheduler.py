@@ -0,0 +1,85 @@
+
+"""
+A central scheduler for timed calls, run by the world once per tick.
+
+Calls are kept in a heap ordered by due time, so scheduling costs O(log n)
+and a tick only touches the calls that are due: thousands of pending calls
+cost nothing until their time comes. Cancelled calls are skipped lazily and
+swept out once they make up half of the heap.
+"""
+
+import heapq
+from itertools import count
+
+class ScheduledCall(object):
+
+    """
+    A handle to a scheduled call, which can be cancelled.
+    """
+
+    __slots__ = ("time", "function", "args", "cancelled")
+
+    def __init__(self, time, function, args):
+        self.time, self.function, self.args = time, function, args
+        self.cancelled = False
+
+class Scheduler(object):
+
+    def __init__(self, time=0.0):
+        self.time = time
+        self.heap = []
+        self.cancelledCount = 0
+        self._order = count()
+
+    def __len__(self):
+        return len(self.heap) - self.cancelledCount
+
+    def scheduleAt(self, time, function, *args):
+        """
+        Call function(*args) on the first run() at or after time.
+        """
+        call = ScheduledCall(time, function, args)
+        heapq.heappush(self.heap, (time, next(self._order), call))
+        return call
+
+    def schedule(self, delay, function, *args):
+        """
+        Call function(*args) delay seconds from now.
+        """
+        return self.scheduleAt(self.time + delay, function, *args)
+
+    def cancel(self, call):
+        if not call.cancelled:
+            call.cancelled = True
+            self.cancelledCount += 1
+            if self.cancelledCount > len(self.heap) // 2:
+                # In place, as run() may be popping from this list right now.
+                self.heap[:] = [entry for entry in self.heap if not entry[2].cancelled]
+                heapq.heapify(self.heap)
+                self.cancelledCount = 0
+
+    def nextTime(self):
+        """
+        The due time of the next pending call, or None.
+        """
+        heap = self.heap
+        while heap and heap[0][2].cancelled:
+            heapq.heappop(heap)
+            self.cancelledCount -= 1
+        return heap[0][0] if heap else None
+
+    def run(self, time):
+        """
+        Advance to time and make every call that is due, in order. Calls
+        scheduled for now or earlier while running are made in this run too.
+        """
+        self.time = time
+        heap, heappop = self.heap, heapq.heappop
+        while heap and heap[0][0] <= time:
+            call = heappop(heap)[2]
+            if call.cancelled:
+                self.cancelledCount -= 1
+                continue
+            # Mark it, so cancelling a call that already ran is a no-op.
+            call.cancelled = True
+            call.function(*call.args)
@@ -0,0 +1,150 @@
+"""
+Entity scripts: gameplay sequences written as generator coroutines.
+
+A script is a generator that yields what it waits for, and is resumed when
+that happens:
+
+    def openDoor(self):
+        self.door.triggerInput("Open")
+        yield 2.0                                   # or wait(2.0)
+        self.fireOutput("OnUser1")
+        value = yield waitOutput(self.button, "OnPressed")
+        hero, door = yield waitEvent("collided: [hero] 'door'")
+
+    entity.runScript(entity.openDoor())
+
+Yielding a number of seconds, or wait(), resumes the script on the first
+tick at or after that time; yielding None or 0 resumes it on the next tick.
+waitOutput() resumes it with the value, when the output fires. waitEvent()
+resumes it with the event's arguments, when the messenger sends the event.
+
+A waiting script has no per-frame cost. Timed waits are calls in the
+world's scheduler. Output waits are compiled into the output's firing plan
+by the IO graph. Event waits are ordinary messenger listeners. Scripts are
+stopped when their entity is killed, and are not saved. A script that kills
+its own entity runs on to its next yield.
+"""
+
+class WaitCondition(object):
+
+    """
+    Something a script can wait for. arm() makes the condition call
+    script.resume(value) once it is met, and returns a handle that
+    disarm() takes to cancel it.
+    """
+
+    def arm(self, script):
+        raise NotImplementedError
+
+    def disarm(self, script, handle):
+        raise NotImplementedError
+
+class WaitTime(WaitCondition):
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def arm(self, script):
+        world = script.entity.world
+        return world.scheduler.schedule(self.seconds if self.seconds > 0 else world.tickLength, script.resume, None)
+
+    def disarm(self, script, handle):
+        script.entity.world.scheduler.cancel(handle)
+
+    def __repr__(self):
+        return "wait(%r)" % (self.seconds,)
+
+class WaitOutput(WaitCondition):
+    def __init__(self, entity, outputName):
+        if outputName not in entity.outputSpec:
+            raise ValueError("%s has no output %r." % (entity.name, outputName))
+        self.entity, self.outputName = entity, outputName
+
+    def arm(self, script):
+        def fired(value):
+            self.disarm(script, fired)
+            script.resume(value)
+        script.entity.world.ioGraph.addWaiter(self.entity, self.outputName, fired)
+        return fired
+
+    def disarm(self, script, handle):
+        script.entity.world.ioGraph.removeWaiter(self.entity, self.outputName, handle)
+
+    def __repr__(self):
+        return "waitOutput(%s, %r)" % (self.entity.name, self.outputName)
+
+class WaitEvent(WaitCondition):
+    def __init__(self, eventName):
+        self.eventName = eventName
+
+    def arm(self, script):
+        def sent(*args):
+            self.disarm(script, sent)
+            script.resume(args)
+        script.entity.app.messenger.accept(self.eventName, sent)
+        return sent
+
+    def disarm(self, script, handle):
+        script.entity.app.messenger.ignore(self.eventName, handle)
+
+    def __repr__(self):
+        return "waitEvent(%r)" % (self.eventName,)
+
+wait        = WaitTime
+waitOutput  = WaitOutput
+waitEvent   = WaitEvent
+
+class Script(object):
+
+    """
+    A running script of an entity.
+    """
+
+    __slots__ = ("entity", "generator", "condition", "handle", "running")
+
+    def __init__(self, entity, generator):
+        self.entity, self.generator = entity, generator
+        self.condition, self.handle = None, None
+        self.running = True
+
+    def resume(self, value=None):
+        """
+        Run the script until it waits again or ends.
+        """
+        self.condition = self.handle = None
+        try:
+            condition = self.generator.send(value)
+        except StopIteration:
+            self.finish()
+            return
+        except Exception:
+            self.finish()
+            raise
+        if not self.running:
+            # Stopped while it ran, such as by killing its own entity, so
+            # it ends at this yield.
+            self.generator.close()
+            return
+        if condition is None or isinstance(condition, (int, long, float)):
+            condition = WaitTime(condition or 0)
+        elif not isinstance(condition, WaitCondition):
+            self.stop()
+            raise TypeError("Scripts must yield a number of seconds or a WaitCondition, not %r." % (condition,))
+        self.condition, self.handle = condition, condition.arm(self)
+
+    def stop(self):
+        """
+        Stop the script where it waits.
+        """
+        if self.condition is not None:
+            self.condition.disarm(self, self.handle)
+            self.condition = self.handle = None
+        if not self.generator.gi_running:
+            self.generator.close()
+        self.finish()
+
+    def finish(self):
+        self.running = False
+        self.entity.scripts.discard(self)
+
+    def __repr__(self):
+        return "<Script of %s waiting for %r>" % (self.entity.name, self.condition)
@@ -0,0 +1,192 @@
+
+"""
+Shared, disk-cached collision shapes for trimesh entities.
+
+A ShapeCache builds one BVH triangle mesh shape per mesh and shares it
+between every entity using that mesh; other scales wrap the shared shape in a
+btScaledBvhTriangleMeshShape, so the BVH itself is never duplicated.
+
+When a mesh has an OgreXML .mesh.xml next to it in the resource locations,
+its triangles and serialized BVH are also written to a cache file named after
+the SHA-1 of the mesh file, so later loads skip parsing and rebuilding.
+Meshes without one go through OgreBullet's converter and are only shared in
+memory.
+"""
+
+import ctypes
+import hashlib
+import os
+import os.path
+import struct
+from array import array
+from xml.etree import cElementTree as ElementTree
+
+from ogre.physics import bullet
+
+CACHE_MAGIC   = "SDTM"
+CACHE_VERSION = 1
+CACHE_HEADER  = struct.Struct("<4sIIII")
+
+def findMeshFile(resourcePaths, meshName):
+    """
+    Find the OgreXML version of a mesh in a list of directories.
+    """
+    for path in resourcePaths:
+        filename = os.path.join(path, meshName + ".xml")
+        if os.path.isfile(filename):
+            return filename
+    return None
+
+def readMeshXml(filename):
+    """
+    Read the vertex positions and triangles of every submesh in an OgreXML
+    .mesh.xml file. Returns (vertices, triangles) as flat arrays of floats
+    (x, y, z per vertex) and ints (three vertex indices per triangle).
+    """
+    mesh = ElementTree.parse(filename).getroot()
+    vertices, triangles = array("f"), array("i")
+
+    def readPositions(geometry):
+        for position in geometry.getiterator("position"):
+            vertices.extend((float(position.get("x")), float(position.get("y")), float(position.get("z"))))
+
+    shared = mesh.find("sharedgeometry")
+    if shared is not None:
+        readPositions(shared)
+
+    for submesh in mesh.getiterator("submesh"):
+        if submesh.get("usesharedvertices", "false") == "true":
+            base = 0
+        else:
+            base = len(vertices) // 3
+            readPositions(submesh.find("geometry"))
+        for face in submesh.getiterator("face"):
+            triangles.extend((base + int(face.get("v1")), base + int(face.get("v2")), base + int(face.get("v3"))))
+
+    return vertices, triangles
+
+def serializeBvh(shape):
+    """
+    Serialize the optimized BVH of a shape, or return None when the bindings
+    can't hand us the raw buffer.
+    """
+    try:
+        bvh = shape.getOptimizedBvh()
+        size = bvh.calculateSerializeBufferSize()
+        buffer = ctypes.create_string_buffer(size)
+        if not bvh.serialize(ctypes.addressof(buffer), size, False):
+            return None
+        return buffer.raw
+    except (AttributeError, TypeError, ctypes.ArgumentError):
+        return None
+
+def createTrimeshShape(vertices, triangles, bvhData=None):
+    """
+    Build a static BVH triangle mesh shape from flat vertex and triangle
+    arrays, using a serialized BVH when one is given. The btTriangleMesh and
+    the BVH buffer are kept on the shape so they live as long as it does.
+    """
+    points = [bullet.btVector3(vertices[i], vertices[i + 1], vertices[i + 2]) for i in xrange(0, len(vertices), 3)]
+    mesh = bullet.btTriangleMesh()
+    for i in xrange(0, len(triangles), 3):
+        mesh.addTriangle(points[triangles[i]], points[triangles[i + 1]], points[triangles[i + 2]])
+
+    shape = None
+    if bvhData:
+        try:
+            buffer = ctypes.create_string_buffer(bvhData, len(bvhData))
+            bvh = bullet.btOptimizedBvh.deSerializeInPlace(ctypes.addressof(buffer), len(bvhData), False)
+            shape = bullet.btBvhTriangleMeshShape(mesh, True, False)
+            shape.setOptimizedBvh(bvh)
+            shape.bvhBuffer = buffer
+        except (AttributeError, TypeError, ctypes.ArgumentError):
+            shape = None
+    if shape is None:
+        shape = bullet.btBvhTriangleMeshShape(mesh, True)
+    shape.triangleMesh = mesh
+    return shape
+
+class ShapeCache(object):
+
+    def __init__(self, app, cacheDir=None):
+        self.app = app
+        self.cacheDir = cacheDir
+        self.shapes = {}
+        self.scaledShapes = {}
+
+    def getTrimeshShape(self, entity, scale=(1, 1, 1)):
+        """
+        Get the shared trimesh shape for an entity's mesh at the given scale.
+        """
+        meshName = entity.getMesh().getName()
+        key = (meshName, tuple(scale))
+        shape = self.scaledShapes.get(key)
+        if shape is None:
+            base = self.shapes.get(meshName)
+            if base is None:
+                base = self.shapes[meshName] = self.buildShape(entity, meshName)
+            if key[1] == (1, 1, 1):
+                shape = base
+            else:
+                shape = bullet.btScaledBvhTriangleMeshShape(base, bullet.btVector3(*scale))
+                shape.baseShape = base
+            self.scaledShapes[key] = shape
+        return shape
+
+    def buildShape(self, entity, meshName):
+        meshPath = self.app.findMeshFile(meshName)
+        if meshPath is None:
+            return self.app.convertMeshToShape(entity)
+
+        digest = hashlib.sha1(open(meshPath, "rb").read()).hexdigest()
+        cached = self.readCacheFile(digest)
+        if cached is not None:
+            return createTrimeshShape(*cached)
+
+        vertices, triangles = readMeshXml(meshPath)
+        shape = createTrimeshShape(vertices, triangles)
+        self.writeCacheFile(digest, vertices, triangles, serializeBvh(shape))
+        return shape
+
+    def getCacheFilePath(self, digest):
+        return os.path.join(self.cacheDir, digest + ".trimesh")
+
+    def readCacheFile(self, digest):
+        """
+        Read (vertices, triangles, bvhData) from the cache, or None if there is
+        no usable cache file.
+        """
+        if self.cacheDir is None:
+            return None
+        try:
+            data = open(self.getCacheFilePath(digest), "rb").read()
+        except IOError:
+            return None
+        if len(data) < CACHE_HEADER.size:
+            return None
+        magic, version, numFloats, numInts, bvhSize = CACHE_HEADER.unpack_from(data)
+        if magic != CACHE_MAGIC or version != CACHE_VERSION:
+            return None
+
+        offset = CACHE_HEADER.size
+        vertices, triangles = array("f"), array("i")
+        vertices.fromstring(data[offset:offset + numFloats * vertices.itemsize])
+        offset += numFloats * vertices.itemsize
+        triangles.fromstring(data[offset:offset + numInts * triangles.itemsize])
+        offset += numInts * triangles.itemsize
+        bvhData = data[offset:offset + bvhSize] or None
+        return vertices, triangles, bvhData
+
+    def writeCacheFile(self, digest, vertices, triangles, bvhData):
+        if self.cacheDir is None:
+            return
+        if not os.path.isdir(self.cacheDir):
+            os.makedirs(self.cacheDir)
+        bvhData = bvhData or ""
+        path = self.getCacheFilePath(digest)
+        with open(path + ".tmp", "wb") as f:
+            f.write(CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, len(vertices), len(triangles), len(bvhData)))
+            f.write(vertices.tostring())
+            f.write(triangles.tostring())
+            f.write(bvhData)
+        os.rename(path + ".tmp", path)
@@ -0,0 +1,114 @@
+
+"""
+Interned entity tags.
+
+Tags come in two kinds:
+
+* Logical tags. Every distinct tag gets its own bit the first time it is
+  seen, so a list of tags can be stored as a single integer mask and tag
+  tests become bitwise ANDs. Python integers are unbounded, so there is no
+  cap on the number of logical tags.
+
+* Collision categories. Bullet's collision filter group and mask are
+  16-bit signed shorts, so only MAX_COLLISION_CATEGORIES tags can take part
+  in collision filtering. A tag becomes a category when it's declared with
+  declareCollisionCategories(), or the first time a collision mask names it;
+  running out of categories raises an error instead of silently overflowing.
+  When a new category is made, the category listeners (normally the worlds)
+  recompute the collision group of the entities that already carry the tag.
+"""
+
+import weakref
+
+TAG_BITS      = dict()
+WILDCARD_TAGS = frozenset(("all", "*"))
+
+# Bit 0 is the group of entities that carry no collision category at all.
+DEFAULT_COLLISION_GROUP  = 1
+MAX_COLLISION_CATEGORIES = 14
+ALL_COLLISION_CATEGORIES = 0x7FFF
+
+COLLISION_CATEGORIES = dict()
+
+# Objects whose collisionCategoryAdded(tag) is called for every new category.
+CATEGORY_LISTENERS = weakref.WeakSet()
+
+def tagBit(tag):
+    """
+    Get the bit for a tag, interning it if needed. Wildcard tags match
+    everything and have no bit of their own.
+    """
+    if tag in WILDCARD_TAGS:
+        return 0
+    try:
+        return TAG_BITS[tag]
+    except KeyError:
+        bit = TAG_BITS[tag] = 1 << len(TAG_BITS)
+        return bit
+
+def tagMask(tags):
+    """
+    Get the combined mask for a sequence of tags.
+    """
+    mask = 0
+    for tag in tags:
+        mask |= tagBit(tag)
+    return mask
+
+def splitTags(tags):
+    if tags is None:
+        return []
+    if isinstance(tags, basestring):
+        return tags.split()
+    return list(tags)
+
+def collisionCategory(tag):
+    """
+    Get the collision filter bit of a category, declaring it if needed.
+    """
+    try:
+        return COLLISION_CATEGORIES[tag]
+    except KeyError:
+        if len(COLLISION_CATEGORIES) >= MAX_COLLISION_CATEGORIES:
+            raise ValueError("Can't make %r a collision category: all %d are taken by %s." %
+                             (tag, MAX_COLLISION_CATEGORIES, ', '.join(sorted(COLLISION_CATEGORIES))))
+        bit = COLLISION_CATEGORIES[tag] = DEFAULT_COLLISION_GROUP << (len(COLLISION_CATEGORIES) + 1)
+        for listener in list(CATEGORY_LISTENERS):
+            listener.collisionCategoryAdded(tag)
+        return bit
+
+def addCategoryListener(listener):
+    CATEGORY_LISTENERS.add(listener)
+
+def declareCollisionCategories(*tags):
+    for tag in tags:
+        collisionCategory(tag)
+
+def collisionGroup(tags):
+    """
+    Get the collision filter group of an entity from its tags: the bits of
+    the tags that are collision categories, or the default group if none are.
+    """
+    group = 0
+    for tag in tags:
+        group |= COLLISION_CATEGORIES.get(tag, 0)
+    return group or DEFAULT_COLLISION_GROUP
+
+def collisionMask(tags):
+    """
+    Get a collision filter mask from collision tags. No tags, or a wildcard,
+    collides with everything. If every tag starts with "!", the mask
+    collides with everything except those categories.
+    """
+    tags = splitTags(tags)
+    if not tags or any(tag in WILDCARD_TAGS for tag in tags):
+        return ALL_COLLISION_CATEGORIES
+    if all(tag[0] == "!" for tag in tags):
+        mask = 0
+        for tag in tags:
+            mask |= collisionCategory(tag[1:])
+        return ALL_COLLISION_CATEGORIES & ~mask
+    mask = 0
+    for tag in tags:
+        mask |= collisionCategory(tag)
+    return mask
@@ -0,0 +1,194 @@
+"""
+A task manager in the style of Panda3D's taskMgr.
+
+A task is a function called with its Task once per frame, once every N
+frames, or after a delay. It returns CONT to keep running, AGAIN to run
+again after its delay, a number of seconds to wait before running again,
+or DONE (or None) to stop. A function that returns a generator becomes a
+coroutine task: the generator is resumed each time the task runs, and what
+it yields decides when that is:
+
+    None or CONT    the next time the task is due, as a plain task would.
+    a number        after that many seconds.
+    DONE            stop, as does returning.
+
+Tasks run in ascending priority order, then in the order they were added,
+after the world has been updated for the frame: the world's frame listener
+steps the app's task manager once updateWorld() returns. Tasks with a priority of
+budgetedPriority or more share a per-frame time budget: once a frame's tasks
+have taken frameBudget seconds, the budgeted tasks still due wait for the
+next frame, which runs them first within their priority. Work that has to
+happen every frame belongs at a priority under budgetedPriority;
+housekeeping belongs above it.
+"""
+
+import itertools
+import types
+from timeit import default_timer
+
+DONE, CONT, AGAIN = "done", "cont", "again"
+
+PRIORITY_CRITICAL = 0
+PRIORITY_HIGH     = 10
+PRIORITY_NORMAL   = 20
+PRIORITY_LOW      = 30
+
+class Task(object):
+
+    """
+    A task added to a TaskManager. time is the seconds since the task was
+    added, dt the seconds since it last ran, and frame the number of times
+    it has run.
+    """
+
+    def __init__(self, manager, function, name, priority, every, delay, extraArgs, order):
+        self.manager, self.function, self.name = manager, function, name
+        self.priority, self.every, self.delay = priority, every, delay
+        self.extraArgs = tuple(extraArgs)
+        self.order = order
+        self.startTime = self.lastTime = manager.time
+        self.wakeTime = manager.time + delay
+        self.nextFrame = manager.frame + 1
+        self.generator = None
+        self.time, self.dt, self.frame = 0.0, 0.0, 0
+        self.removed = False
+
+    # Return values, as on Panda3D's tasks.
+    done, cont, again = DONE, CONT, AGAIN
+
+    def remove(self):
+        self.manager.remove(self)
+
+    def __repr__(self):
+        return "<Task %s priority=%d>" % (self.name, self.priority)
+
+class TaskManager(object):
+
+    budgetedPriority = PRIORITY_NORMAL
+    frameBudget      = 0.004
+
+    def __init__(self):
+        self.time, self.frame = 0.0, 0
+        self.tasks = []
+        self.added = []
+        self.byName = {}
+        self._order = itertools.count()
+        self.needsSort = False
+        # Budgeted tasks that had to wait, in the last frame and in total.
+        self.deferred, self.totalDeferred = 0, 0
+
+    def __len__(self):
+        return len(self.tasks) + len(self.added)
+
+    def add(self, function, name=None, priority=PRIORITY_NORMAL, every=1, delay=0.0, extraArgs=()):
+        """
+        Call function(task, *extraArgs) every frame, or every "every" frames,
+        starting delay seconds from now. Returns the Task.
+        """
+        if name is None:
+            name = getattr(function, "__name__", "task")
+        task = Task(self, function, name, priority, max(1, every), delay, extraArgs, next(self._order))
+        self.added.append(task)
+        self.byName.setdefault(name, []).append(task)
+        return task
+
+    def doMethodLater(self, delay, function, name=None, **kwargs):
+        """
+        Call function(task) once, delay seconds from now, or every delay
+        seconds if it returns AGAIN.
+        """
+        return self.add(function, name, delay=delay, **kwargs)
+
+    def remove(self, task):
+        """
+        Remove a Task, or every task with a name. Returns how many were removed.
+        """
+        if isinstance(task, basestring):
+            return sum(self.remove(t) for t in list(self.byName.get(task, ())))
+        if task.removed:
+            return 0
+        task.removed = True
+        named = self.byName[task.name]
+        named.remove(task)
+        if not named:
+            del self.byName[task.name]
+        if task.generator is not None:
+            task.generator.close()
+        self.needsSort = True
+        return 1
+
+    def getTasksNamed(self, name):
+        return list(self.byName.get(name, ()))
+
+    def hasTaskNamed(self, name):
+        return name in self.byName
+
+    def step(self, dt):
+        """
+        Run the tasks due this frame.
+        """
+        self.time += dt
+        self.frame += 1
+        time, frame = self.time, self.frame
+        if self.added:
+            self.tasks.extend(self.added)
+            self.added = []
+            self.needsSort = True
+        if self.needsSort:
+            self.tasks = [task for task in self.tasks if not task.removed]
+            self.tasks.sort(key=lambda task: (task.priority, task.order))
+            self.needsSort = False
+
+        timer = default_timer
+        deadline = timer() + self.frameBudget
+        budgetedPriority = self.budgetedPriority
+        deferred = 0
+        for task in self.tasks:
+            if task.removed or task.wakeTime > time or task.nextFrame > frame:
+                continue
+            if task.priority >= budgetedPriority:
+                if timer() >= deadline:
+                    deferred += 1
+                    continue
+                # Round robin within a priority, so a task that ran waits
+                # behind the ones that didn't if the budget runs out.
+                task.order = next(self._order)
+                self.needsSort = True
+            self.run(task)
+        self.deferred = deferred
+        self.totalDeferred += deferred
+
+    def run(self, task):
+        time = self.time
+        task.time, task.dt = time - task.startTime, time - task.lastTime
+        task.lastTime = time
+        task.frame += 1
+        task.nextFrame = self.frame + task.every
+
+        if task.generator is None:
+            result = task.function(task, *task.extraArgs)
+            if not isinstance(result, types.GeneratorType):
+                self.reschedule(task, result)
+                return
+            task.generator = result
+        self.reschedule(task, self.resume(task))
+
+    def resume(self, task):
+        """
+        Resume a coroutine task, returning what it yielded, or DONE when it finished.
+        """
+        try:
+            result = task.generator.next()
+        except StopIteration:
+            return DONE
+        return CONT if result is None else result
+
+    def reschedule(self, task, result):
+        if result == CONT:
+            return
+        if result == AGAIN:
+            task.wakeTime = self.time + task.delay
+        elif isinstance(result, (int, long, float)):
+            task.wakeTime = self.time + result
+        else:
+            self.remove(task)
@@ -0,0 +1,205 @@
+"""
+Batched transform sync from Bullet bodies to Ogre scene nodes.
+
+Bullet only calls a body's motion state for bodies that are awake, so rigid
+bodies use a thin motion state (PhysicsEntityMotionState) that writes the
+new transform straight into the world's TransformBuffer and flags the slot
+as moved. A flat array holds seven doubles per body: x, y, z, qx, qy, qz,
+qw. The transforms from the tick before are kept in a second array, and once
+per rendered frame sync() interpolates between the two and sets each moved
+node's position and orientation in one pass, without building Ogre
+vectors or quaternions.
+
+A tick therefore costs one callback and about ten wrapper calls per body
+that moved, and nothing for sleeping ones. Bodies without such a motion
+state, such as ghost objects, can't report their moves and are still asked
+isActive() on every tick. Bodies that never move, such as static ones,
+aren't added at all.
+"""
+
+from array import array
+
+STRIDE = 7
+
+def readTransform(body):
+    """
+    A body's world transform as an (x, y, z, qx, qy, qz, qw) tuple.
+    """
+    transform = body.getWorldTransform()
+    origin, rotation = transform.getOrigin(), transform.getRotation()
+    return origin.x(), origin.y(), origin.z(), rotation.x(), rotation.y(), rotation.z(), rotation.w()
+
+class TransformBuffer(object):
+
+    """
+    The transforms of the bodies that can move, one slot each. Slots are
+    kept contiguous: removing a body moves the last one into its slot.
+
+    A motion state with flagsMoves set reports its body's moves through
+    bodyMoved(), and is told its slot in its buffer and slot attributes.
+    Other bodies are polled in capture().
+    """
+
+    def __init__(self):
+        self.entities, self.bodies, self.nodes, self.states = [], [], [], []
+        self.slots = {}
+        self.current, self.previous = array('d'), array('d')
+        # Slots that moved since the last capture, flagged so each is listed once.
+        self.pending, self.flags = [], bytearray()
+        # Slots whose bodies are polled with isActive().
+        self.polled = []
+        # Slots read in the last tick, and slots to snap on the next sync.
+        self.moved, self.settled = [], []
+
+    def __len__(self):
+        return len(self.entities)
+
+    def __contains__(self, entity):
+        return entity in self.slots
+
+    def add(self, entity):
+        if entity in self.slots:
+            return
+        slot = self.slots[entity] = len(self.entities)
+        state = getattr(entity, "motionState", None)
+        if not getattr(state, "flagsMoves", False):
+            state = None
+            self.polled.append(slot)
+        else:
+            state.buffer, state.slot = self, slot
+        self.entities.append(entity)
+        self.bodies.append(entity.physBody)
+        self.nodes.append(entity.sceneNode)
+        self.states.append(state)
+        self.flags.append(0)
+        values = readTransform(entity.physBody)
+        self.current.extend(values)
+        self.previous.extend(values)
+        self.settled.append(slot)
+
+    def remove(self, entity):
+        slot = self.slots.pop(entity, None)
+        if slot is None:
+            return
+        state = self.states[slot]
+        if state is not None:
+            state.buffer = state.slot = None
+        last = len(self.entities) - 1
+        if slot != last:
+            moving = self.entities[last]
+            self.entities[slot], self.bodies[slot], self.nodes[slot] = moving, self.bodies[last], self.nodes[last]
+            self.states[slot], self.flags[slot] = self.states[last], self.flags[last]
+            if self.states[slot] is not None:
+                self.states[slot].slot = slot
+            self.slots[moving] = slot
+            start, end = slot * STRIDE, last * STRIDE
+            self.current[start:start + STRIDE] = self.current[end:end + STRIDE]
+            self.previous[start:start + STRIDE] = self.previous[end:end + STRIDE]
+        del self.entities[last], self.bodies[last], self.nodes[last], self.states[last], self.flags[last]
+        del self.current[last * STRIDE:], self.previous[last * STRIDE:]
+        renumber = lambda slots: [slot if other == last else other for other in slots if other != slot]
+        self.pending, self.polled = renumber(self.pending), renumber(self.polled)
+        self.moved, self.settled = renumber(self.moved), renumber(self.settled)
+
+    def teleport(self, entity):
+        """
+        Re-read a body that was moved by hand, without interpolating to it.
+        """
+        slot = self.slots.get(entity)
+        if slot is not None:
+            start = slot * STRIDE
+            values = array('d', readTransform(self.bodies[slot]))
+            self.current[start:start + STRIDE] = values
+            self.previous[start:start + STRIDE] = values
+            self.settled.append(slot)
+
+    def bodyMoved(self, slot, origin, rotation):
+        """
+        Store the new transform of the body in slot, keeping the one from
+        the tick before. Called by its motion state.
+        """
+        current = self.current
+        start = slot * STRIDE
+        if not self.flags[slot]:
+            self.flags[slot] = 1
+            self.previous[start:start + STRIDE] = current[start:start + STRIDE]
+            self.pending.append(slot)
+        current[start:start + STRIDE] = array('d', (origin.x(), origin.y(), origin.z(),
+                                                     rotation.x(), rotation.y(), rotation.z(), rotation.w()))
+
+    def capture(self):
+        """
+        Collect the bodies that moved since the last capture, after a
+        physics step, and return their entities. Only the polled bodies are
+        asked whether they are active; see the module docstring.
+        """
+        flags, bodies = self.flags, self.bodies
+        for slot in self.polled:
+            if not flags[slot] and bodies[slot].isActive():
+                transform = bodies[slot].getWorldTransform()
+                self.bodyMoved(slot, transform.getOrigin(), transform.getRotation())
+
+        self.settled.extend(self.moved)
+        moved = self.moved = self.pending
+        self.pending = []
+        for slot in moved:
+            flags[slot] = 0
+        entities = self.entities
+        return [entities[slot] for slot in moved]
+
+    def moving(self):
+        """
+        The entities whose bodies moved in the last capture, which are
+        awake for the next physics step.
+        """
+        entities = self.entities
+        return [entities[slot] for slot in self.moved]
+
+    def previousTransform(self, entity):
+        """
+        The transform the body had before it last moved, as an (x, y, z,
+        qx, qy, qz, qw) tuple. For a body that moved in the last step, that
+        is where the step started from.
+        """
+        start = self.slots[entity] * STRIDE
+        return tuple(self.previous[start:start + STRIDE])
+
+    def position(self, entity):
+        """
+        The position read in the last capture, as an (x, y, z) tuple.
+        """
+        start = self.slots[entity] * STRIDE
+        return tuple(self.current[start:start + 3])
+
+    def sync(self, alpha):
+        """
+        Place the nodes of the bodies that moved in the last tick alpha of
+        the way from their previous transform to their current one, and snap
+        the ones that stopped.
+        """
+        current, previous, nodes = self.current, self.previous, self.nodes
+        if self.settled:
+            moved = set(self.moved)
+            for slot in self.settled:
+                if slot not in moved:
+                    start = slot * STRIDE
+                    x, y, z, qx, qy, qz, qw = current[start:start + STRIDE]
+                    node = nodes[slot]
+                    node.setPosition(x, y, z)
+                    node.setOrientation(qw, qx, qy, qz)
+            self.settled = []
+
+        if alpha >= 1.0:
+            alpha = 1.0
+        beta = 1.0 - alpha
+        for slot in self.moved:
+            start = slot * STRIDE
+            x0, y0, z0, qx0, qy0, qz0, qw0 = previous[start:start + STRIDE]
+            x1, y1, z1, qx1, qy1, qz1, qw1 = current[start:start + STRIDE]
+            # Normalised lerp along the shorter arc.
+            a = -alpha if qx0 * qx1 + qy0 * qy1 + qz0 * qz1 + qw0 * qw1 < 0 else alpha
+            qx, qy, qz, qw = qx0 * beta + qx1 * a, qy0 * beta + qy1 * a, qz0 * beta + qz1 * a, qw0 * beta + qw1 * a
+            norm = (qx * qx + qy * qy + qz * qz + qw * qw) ** 0.5 or 1.0
+            node = nodes[slot]
+            node.setPosition(x0 * beta + x1 * alpha, y0 * beta + y1 * alpha, z0 * beta + z1 * alpha)
+            node.setOrientation(qw / norm, qx / norm, qy / norm, qz / norm)
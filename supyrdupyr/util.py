@@ -1,3 +1,8 @@
+try:
+    from ogre.physics import bullet as bt
+except ImportError:
+    bt = None
+
 
 def diagonal(L, offset=0):
     L = list(L)
@@ -18,22 +23,46 @@ def methodSignature(f, args, kwargs):
     return "%s(%s)" % (f.__name__, argstring)
 
 def multiplyVec3(vec, scalar):
-    from ogre.physics import bullet as bt
     return bt.btVector3(vec.x() * scalar, vec.y() * scalar, vec.z() * scalar)
 
 def multiplyQuat(quat, scalar):
-    from ogre.physics import bullet as bt
     return bt.btQuaternion(quat.x() * scalar, quat.y() * scalar, quat.z() * scalar, quat.w() * scalar)
 
 def dotMat3x3(m, v):
-    from ogre.physics import bullet as bt
     return bt.btVector3(m[0].dot(v), m[1].dot(v), m[2].dot(v))
 
 def getBasisAxes(transform):
     b = transform.getBasis()
-    from ogre.physics import bullet as bt
     return (dotMat3x3(b, bt.btVector3(*v)) for v in ((1, 0, 0), (0, 1, 0), (0, 0, 1)))
 
+# Out-parameter versions of the helpers above, for per-frame code. They write
+# into out, which may be the input itself, and return it, allocating nothing.
+
+def multiplyVec3Into(vec, scalar, out):
+    out.setValue(vec.x() * scalar, vec.y() * scalar, vec.z() * scalar)
+    return out
+
+def multiplyQuatInto(quat, scalar, out):
+    out.setValue(quat.x() * scalar, quat.y() * scalar, quat.z() * scalar, quat.w() * scalar)
+    return out
+
+def dotMat3x3Into(m, v, out):
+    out.setValue(m[0].dot(v), m[1].dot(v), m[2].dot(v))
+    return out
+
+def getBasisAxesInto(transform, out):
+    """
+    Write the basis axes of transform (its basis matrix's columns) into the
+    three vectors of out.
+    """
+    b = transform.getBasis()
+    row0, row1, row2 = b[0], b[1], b[2]
+    forward, up, strafe = out
+    forward.setValue(row0.x(), row1.x(), row2.x())
+    up.setValue(row0.y(), row1.y(), row2.y())
+    strafe.setValue(row0.z(), row1.z(), row2.z())
+    return out
+
 def vecStr(vec):
     return '[%f, %f, %f, %f]' % (vec.x(), vec.y(), vec.z(), vec.w())
 
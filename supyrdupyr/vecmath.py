@@ -0,0 +1,96 @@
+"""
+NumPy versions of the supyrdupyr.util math helpers that work on N
+transforms at once.
+
+Arrays follow the layout of the world's TransformBuffer: positions are N x 3,
+quaternions are N x 4 in (x, y, z, w) order, and a transform row is
+(x, y, z, qx, qy, qz, qw). transformArray() views a TransformBuffer's array
+without copying, so a whole world's bodies can be processed in a few array
+operations instead of a Python call per body. Functions that take an out
+array write into it and return it; otherwise they return a new array.
+"""
+
+import numpy
+
+from supyrdupyr.transforms import STRIDE
+
+def transformArray(values):
+    """
+    View a flat array('d') of transforms, such as TransformBuffer.current,
+    as an N x 7 array. The view shares memory with values, which must not
+    be resized while it is in use.
+    """
+    return numpy.frombuffer(values, dtype=numpy.float64).reshape(-1, STRIDE)
+
+def positions(transforms):
+    return transforms[:, 0:3]
+
+def quaternions(transforms):
+    return transforms[:, 3:7]
+
+def scaleVectors(vectors, scalars, out=None):
+    """
+    Multiply each of N vectors by a scalar, or by its own one of N scalars.
+    """
+    scalars = numpy.asarray(scalars, dtype=numpy.float64)
+    if scalars.ndim == 1:
+        scalars = scalars[:, numpy.newaxis]
+    return numpy.multiply(vectors, scalars, out)
+
+def rotationMatrices(quats, out=None):
+    """
+    The N x 3 x 3 rotation matrices of N unit quaternions.
+    """
+    x, y, z, w = quats[:, 0], quats[:, 1], quats[:, 2], quats[:, 3]
+    if out is None:
+        out = numpy.empty((len(quats), 3, 3))
+    xx, yy, zz = x * x, y * y, z * z
+    xy, xz, yz = x * y, x * z, y * z
+    wx, wy, wz = w * x, w * y, w * z
+    out[:, 0, 0] = 1 - 2 * (yy + zz)
+    out[:, 0, 1] = 2 * (xy - wz)
+    out[:, 0, 2] = 2 * (xz + wy)
+    out[:, 1, 0] = 2 * (xy + wz)
+    out[:, 1, 1] = 1 - 2 * (xx + zz)
+    out[:, 1, 2] = 2 * (yz - wx)
+    out[:, 2, 0] = 2 * (xz - wy)
+    out[:, 2, 1] = 2 * (yz + wx)
+    out[:, 2, 2] = 1 - 2 * (xx + yy)
+    return out
+
+def basisAxes(quats, out=None):
+    """
+    The basis axes of N rotations, like util.getBasisAxes, as an N x 3 x 3
+    array where out[:, i] is the i-th axis of every rotation.
+    """
+    matrices = rotationMatrices(quats)
+    if out is None:
+        return matrices.transpose(0, 2, 1).copy()
+    out[...] = matrices.transpose(0, 2, 1)
+    return out
+
+def rotateVectors(matrices, vectors, out=None):
+    """
+    Multiply each of N vectors by its own 3 x 3 matrix, like util.dotMat3x3.
+    """
+    return numpy.einsum("nij,nj->ni", matrices, vectors, out=out)
+
+def normalizeQuaternions(quats, out=None):
+    norms = numpy.sqrt(numpy.einsum("ni,ni->n", quats, quats))
+    norms[norms == 0] = 1.0
+    return numpy.divide(quats, norms[:, numpy.newaxis], out)
+
+def nlerpQuaternions(previous, current, alpha, out=None):
+    """
+    Normalised lerp of N quaternion pairs, alpha of the way along the
+    shorter arc from previous to current.
+    """
+    signs = numpy.where(numpy.einsum("ni,ni->n", previous, current) < 0, -1.0, 1.0)
+    result = numpy.multiply(previous, 1.0 - alpha, out)
+    result += current * (alpha * signs)[:, numpy.newaxis]
+    return normalizeQuaternions(result, result)
+
+def lerpVectors(previous, current, alpha, out=None):
+    result = numpy.multiply(previous, 1.0 - alpha, out)
+    result += current * alpha
+    return result
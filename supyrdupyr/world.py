@@ -1,10 +1,18 @@
 
 from supyrdupyr.entities import PhysicsEntity
-from supyrdupyr.util import diagonal
 from supyrdupyr import messenger, entities
+from supyrdupyr.savegame import SaveSlot, BackgroundSaver
+from supyrdupyr.scheduler import Scheduler
+from supyrdupyr.iograph import IOGraph
+from supyrdupyr.cells import CellGrid
+from supyrdupyr.indexes import TagIndex, SpatialGrid
+from supyrdupyr.transforms import TransformBuffer
+from supyrdupyr.tags import splitTags, tagMask, addCategoryListener
+from supyrdupyr.tasks import PRIORITY_LOW
 from ogre.physics import bullet
 from ogre.io import OIS
 import ogre.renderer.OGRE as ogre
+import itertools
 
 class WorldFrameListener(ogre.FrameListener):
     def __init__(self, world):
@@ -12,17 +20,60 @@ class WorldFrameListener(ogre.FrameListener):
         ogre.FrameListener.__init__(self)
     
     def frameStarted(self, evt):
+        """
+        Update the world, then run the app's tasks, which Ogre wouldn't
+        order after the update if they had a frame listener of their own.
+        """
         self.world.updateWorld(evt.timeSinceLastFrame)
+        taskMgr = self.world.app.taskMgr
+        if taskMgr is not None:
+            taskMgr.step(evt.timeSinceLastFrame)
         return True
 
 class World(object):
-    
-    # cellSize    = 512
-    # cellMap     = []
+
+    # Side length of the streaming cells, or None to keep the whole level
+    # active. Cells within activeCellRadius of the focus's cell are
+    # simulated, and cells within frozenCellRadius keep their resources
+    # loaded. cellResourceGroups maps cell keys to the groups they use.
+    cellSize           = None
+    activeCellRadius   = 1
+    frozenCellRadius   = 2
+    cellResourceGroups = {}
+
+    # Cell size of the spatial index that answers area queries.
+    spatialCellSize = 16.0
+
+    # Fixed simulation rate, in ticks per second, and how many ticks one
+    # rendered frame may run to catch up before the remaining time is dropped.
+    tickRate        = 60.0
+    maxCatchUpTicks = 5
+
+    # Resource groups this world's level uses, and the ones to read ahead
+    # in the background because the next level will probably use them.
+    resourceGroups         = ()
+    prefetchResourceGroups = ()
+
+    # Seconds between OnCollidePersist outputs for a resting contact,
+    # or None to only report contacts starting and ending.
+    contactPersistInterval = None
     
     def __init__(self, app):
         self.app = app
         self.body = {}
+        self.time = 0.0
+        self.accumulator = 0.0
+        self.interpolationAlpha = 0.0
+        # The dt of the last updateWorld(), and how many there have been,
+        # which input recordings replay.
+        self.frameTime, self.frameCount = 0.0, 0
+        self.contacts = {}
+        self.transforms = TransformBuffer()
+        self.dirtyEntities = set()
+        self.scheduler = Scheduler()
+        self.ioGraph = IOGraph(self)
+        self.saver = None
+        self.focus = None
         
         app.world = self
 
@@ -41,31 +92,182 @@ class World(object):
         self.physWorld = bullet.btDiscreteDynamicsWorld(self.physDispatcher, self.physBroadphase, self.physSolver, self.physCollisionConfiguration)
         self.physWorld.setGravity(bullet.btVector3(0, -10, 0))
 
-        # self.cells = {}
         self.entities = {}
+        self.simulatedEntities = {}
+        self.tagIndex = TagIndex()
+        self.spatialIndex = SpatialGrid(self.spatialCellSize)
+        addCategoryListener(self)
+        self.cells = CellGrid(self, self.cellSize, self.activeCellRadius, self.frozenCellRadius) if self.cellSize else None
 
+        app.resources.activate(self.resourceGroups)
         self.setupWorld()
+        app.resources.prefetch(self.prefetchResourceGroups)
     
+    @property
+    def tickLength(self):
+        return 1.0 / self.tickRate
+
     def updateWorld(self, dt):
-        self.physWorld.stepSimulation(dt)
-        
-        dispatcher = self.physWorld.getDispatcher()
-        manifolds = [dispatcher.getManifoldByIndexInternal(i) for i in xrange(dispatcher.getNumManifolds())]
-        
-        for mnf in manifolds:
+        """
+        Advance the world by one rendered frame of dt seconds. The simulation
+        runs in fixed ticks, and scene nodes are interpolated between the last
+        two ticks by the fraction of a tick left over.
+        """
+        tickLength = self.tickLength
+        self.frameTime = dt
+        self.frameCount += 1
+        self.accumulator += dt
+
+        ticks = 0
+        while self.accumulator >= tickLength:
+            if ticks == self.maxCatchUpTicks:
+                self.accumulator %= tickLength
+                break
+            self.tick(tickLength)
+            self.accumulator -= tickLength
+            ticks += 1
+
+        self.interpolationAlpha = self.accumulator / tickLength
+        self.interpolate(self.interpolationAlpha)
+
+    def tick(self, dt):
+        """
+        Run one fixed simulation step.
+        """
+        # Advance the clocks first, so delays scheduled in any phase of this
+        # tick are measured from it.
+        self.time += dt
+        self.scheduler.time = self.time
+        if self.app.actions is not None:
+            self.app.actions.update()
+        if self.cells is not None:
+            self.cells.update()
+
+        saver, transforms = self.saver, self.transforms
+        if saver is not None and saver.capturing:
+            saver.entitiesStepping(transforms.moving())
+        self.stepPhysics(dt)
+        moved = self.captureTransforms()
+        if saver is not None and saver.capturing:
+            saver.entitiesWoken(moved, transforms)
+        dirty = self.dirtyEntities
+        spatialIndex = self.spatialIndex
+        indexed = spatialIndex.keys
+        for entity in moved:
+            dirty.add(entity.name)
+            if entity in indexed:
+                spatialIndex.move(entity, transforms.position(entity))
+        spatialIndex.flush()
+        if self.cells is not None:
+            for entity in moved:
+                self.cells.moved(entity)
+        self.updateContacts()
+        self.runScheduled()
+        self.simulateEntities(dt)
+
+    def runScheduled(self):
+        """
+        Make the scheduled calls that are due, such as delayed outputs.
+        """
+        self.scheduler.run(self.time)
+
+    def stepPhysics(self, dt):
+        self.physWorld.stepSimulation(dt, 1, dt)
+
+    def captureTransforms(self):
+        """
+        Collect the bodies that moved in the physics step, and return their entities.
+        """
+        return self.transforms.capture()
+
+    def simulatingEntities(self):
+        """
+        The entities to simulate this tick: those that override simulate(),
+        and aren't in a frozen cell.
+        """
+        if self.cells is None:
+            return self.simulatedEntities.itervalues()
+        return itertools.chain(self.simulatedEntities.itervalues(), self.cells.simulatingEntities())
+
+    def simulateEntities(self, dt):
+        for entity in self.simulatingEntities():
+            entity.simulate(dt)
+
+    def interpolate(self, alpha):
+        """
+        Place the scene nodes of bodies that moved in the last tick between
+        their previous and current transforms, and snap the ones that stopped.
+        """
+        self.transforms.sync(alpha)
+
+    def getTouchingPairs(self):
+        """
+        Gather every pair of entities with at least one contact point this
+        frame, in one pass over the dispatcher's manifolds. Each pair is
+        ordered by entity name and the pairs come in manifold order, so
+        contact events fire in the same order on every run. Returns the
+        list of pairs and the set of them.
+        """
+        touching, seen = [], set()
+        dispatcher = self.physDispatcher
+        getManifold = dispatcher.getManifoldByIndexInternal
+        for i in xrange(dispatcher.getNumManifolds()):
+            mnf = getManifold(i)
+            if not mnf.getNumContacts():
+                continue
             ent1 = mnf.getBodyAsObject0().getUserData()
             ent2 = mnf.getBodyAsObject1().getUserData()
-            
-            ent1.sendEntityEvent("collided", ent2)
-            ent1.fireOutput("OnCollide", ent2)
-            ent2.sendEntityEvent("collided", ent1)
-            ent2.fireOutput("OnCollide", ent1)
+            pair = (ent1, ent2) if ent1.name < ent2.name else (ent2, ent1)
+            if pair not in seen:
+                seen.add(pair)
+                touching.append(pair)
+        return touching, seen
 
-        # for cell in self.cells.itervalues():
-        #     cell.simulate()
+    def updateContacts(self):
+        """
+        Compare this frame's touching pairs against the contact table and only
+        report the pairs whose state changed, plus throttled persist events.
+        Ended contacts are reported in order of entity names.
+        """
+        touching, seen = self.getTouchingPairs()
+        contacts = self.contacts
+        interval = self.contactPersistInterval
 
-        for entity in self.entities.itervalues():
-            entity.simulate(dt)
+        for pair in touching:
+            nextPersist = contacts.get(pair, False)
+            if nextPersist is False:
+                contacts[pair] = None if interval is None else self.time + interval
+                self.contactStarted(*pair)
+            elif nextPersist is not None and nextPersist <= self.time:
+                contacts[pair] = self.time + interval
+                self.contactPersisted(*pair)
+
+        if len(contacts) > len(seen):
+            ended = [pair for pair in contacts if pair not in seen]
+            ended.sort(key=lambda pair: (pair[0].name, pair[1].name))
+            for pair in ended:
+                del contacts[pair]
+                self.contactEnded(*pair)
+
+    def contactStarted(self, ent1, ent2):
+        ent1.sendEntityEvent("collided", ent2)
+        ent1.fireOutput("OnCollideStart", ent2)
+        ent1.fireOutput("OnCollide", ent2)
+        ent2.sendEntityEvent("collided", ent1)
+        ent2.fireOutput("OnCollideStart", ent1)
+        ent2.fireOutput("OnCollide", ent1)
+
+    def contactPersisted(self, ent1, ent2):
+        ent1.sendEntityEvent("colliding", ent2)
+        ent1.fireOutput("OnCollidePersist", ent2)
+        ent2.sendEntityEvent("colliding", ent1)
+        ent2.fireOutput("OnCollidePersist", ent1)
+
+    def contactEnded(self, ent1, ent2):
+        ent1.sendEntityEvent("separated", ent2)
+        ent1.fireOutput("OnCollideEnd", ent2)
+        ent2.sendEntityEvent("separated", ent1)
+        ent2.fireOutput("OnCollideEnd", ent1)
 
     def setupWorld(self):
         pass
@@ -73,109 +275,123 @@ class World(object):
     def addEntity(self, entity):
         if entity.name in self.entities:
             raise ValueError("This entity (or one with the same name) already exists in this world.")
+        self.markDirty(entity)
         self.entities[entity.name] = entity
+        if type(entity).simulate.im_func is not entities.BaseEntity.simulate.im_func:
+            self.simulatedEntities[entity.name] = entity
+        if self.cells is not None:
+            self.cells.addEntity(entity)
+        self.tagIndex.add(entity)
+        self.spatialIndex.pending.append(entity)
 
     def killEntity(self, entity):
         if entity.name not in self.entities:
             raise ValueError("This entity does not exist in this world")
+        self.markDirty(entity)
+        if isinstance(entity, entities.LogicEntity):
+            entity.stopScripts()
+        if self.cells is not None:
+            self.cells.removeEntity(entity)
         self.entities[entity.name] = None
+        self.simulatedEntities.pop(entity.name, None)
+        self.tagIndex.remove(entity)
+        self.spatialIndex.remove(entity)
+        self.transforms.remove(entity)
+        self.ioGraph.entityChanged(entity)
         del entity
+
+    def retagEntity(self, entity, oldTags):
+        """
+        Move entity in the tag index after its tags changed from oldTags.
+        """
+        if self.entities.get(entity.name) is entity:
+            self.tagIndex.remove(entity, oldTags)
+            self.tagIndex.add(entity)
+
+    def collisionCategoryAdded(self, tag):
+        """
+        Recompute the collision group of the entities carrying a tag that
+        just became a collision category.
+        """
+        for entity in list(self.tagIndex.find(tag)):
+            entity.tagsChanged()
+
+    def entityMoved(self, entity):
+        """
+        Update the indexes after moving an entity without physics, such as
+        by setting its scene node's position.
+        """
+        self.spatialIndex.pending.append(entity)
+        if self.cells is not None:
+            self.cells.moved(entity)
+
+    def findByTag(self, tag):
+        """
+        The live entities with tag, as a list.
+        """
+        return list(self.tagIndex.find(tag))
+
+    def findByTags(self, tags):
+        """
+        The live entities with every one of tags, given as a string or a sequence.
+        """
+        return list(self.tagIndex.findAll(splitTags(tags)))
+
+    def findInBox(self, lower, upper, tags=None):
+        """
+        The live entities with a position inside the box from lower to
+        upper, optionally only those with every one of tags.
+        """
+        self.spatialIndex.flush()
+        return self.filterTags(self.spatialIndex.queryBox(tuple(lower), tuple(upper)), tags)
+
+    def findInRadius(self, center, radius, tags=None):
+        """
+        The live entities within radius of center, optionally only those
+        with every one of tags.
+        """
+        self.spatialIndex.flush()
+        return self.filterTags(self.spatialIndex.queryRadius(tuple(center), radius), tags)
+
+    def filterTags(self, found, tags):
+        if tags is None:
+            return list(found)
+        mask = tagMask(splitTags(tags))
+        return [entity for entity in found if entity.tagMask & mask == mask]
+
+    def markDirty(self, entity):
+        """
+        Note that an entity's saved state is about to change, so the next
+        delta save includes it. Call it before making the change: a save
+        that is still being captured takes the entity's state first.
+        """
+        if self.saver is not None:
+            self.saver.entityChanging(entity.name)
+        self.dirtyEntities.add(entity.name)
+
+    def enableAutoSave(self, directory, interval=None, **kwargs):
+        """
+        Save this world into the SaveSlot directory in the background, every
+        interval seconds if given, otherwise on quicksave(). Extra keyword
+        arguments go to the BackgroundSaver. Saving runs as a low priority
+        task, so it waits when a frame is over its task budget.
+        """
+        self.saver = BackgroundSaver(self, SaveSlot(directory), interval, **kwargs)
+        if not self.app.taskMgr.hasTaskNamed("autoSave"):
+            self.app.taskMgr.add(self.updateSaver, "autoSave", PRIORITY_LOW)
+        return self.saver
+
+    def updateSaver(self, task):
+        self.saver.update(task.dt)
+        return task.cont
+
+    def quicksave(self):
+        return self.saver.quicksave()
     
-    # def addCell(self, cell):
-    #     self.cells[cell.name] = cell
-    
-    # def getCell(self, name):
-    #     return self.cells[name]
-    
-    # def getCellNeighbours(self, name):
-    #     return self.cells[name].getNeighbours()
-
-    # @property
-    # def root(self):
-    #     return self.cells['root']
-
-    # @classmethod
-    # def makeWorld(cls, app):
-    #     world = cls(app)
-    #     cellMap = []
-    #     for y, row in enumerate(cls.cellMap):
-    #         cellRow = []
-    #         cellMap.append(cellRow)
-    #         for x, cellClass in enumerate(row):
-    #             cell = cellClass(world, "cell %d:%d" % (x, y))
-    #             cell.setPosition(x * cls.cellSize, y * cls.cellSize, 0)
-    #             cellRow.append(cell)
-    #     cls.assignNeighbours(cellMap)
-    #     return world
-
-    # @staticmethod
-    # def assignNeighbours(cellMap):
-    #     rows    = list(cellMap)
-    #     columns = zip(*rows)
-
-    #     # Cardinal directions: West and East
-    #     for row in rows:
-    #         for west, east in zip(*(row[n:] for n in xrange(2))):
-    #             west.setNeighbour("e", east)
-    #             east.setNeighbour("w", west)
-
-    #     # Cardinal directions: North and South
-    #     for col in columns:        
-    #         for north, south in zip(*(col[n:] for n in xrange(2))):
-    #             north.setNeighbour("s", south)
-    #             south.setNeighbour("n", north)
-
-    #     for offset in xrange(-len(columns), len(rows)):
-    #         diag = list(diagonal(rows, offset))
-    #         # Diagonals: Southeast and Northwest
-    #         for northwest, southeast in zip(*(diag[n:] for n in xrange(2))):
-    #             northwest.setNeighbour("se", southeast)
-    #             southeast.setNeighbour("nw", northwest)
-
-    #         # Diagonals: Southwest and Northeast
-    #         diag = list(diagonal(reversed(rows), offset))
-    #         for northeast, southwest in zip(*(diag[n:] for n in xrange(2))):
-    #             northeast.setNeighbour("sw", southwest)
-    #             southwest.setNeighbour("ne", northeast)
-
-
-
-# class Cell(PhysicsEntity):
-#     def __init__(self, world, name, model, tags=None, collisionModel=None, collisionTags=None, physGeom=None):
-#         self._world = world
-#         world.addCell(self)
-#         self.neighbours = {}
-#         self.entities   = {}
-#         PhysicsEntity.__init__(self, self, name, model, "cell static terrain" + tags, collisionModel, collisionTags or "!static", physGeom)
-#         # messenger.accept("change cell: [hero] '%s' [*]" % name, self.left)
-#         # messenger.accept("change cell: [hero] [*] '%s'" % name, self.entered)
-        
-#     def setNeighbour(self, key, obj):
-#         self.neighbours[key] = obj
-
-#     def addEntity(self, ent):
-#         if ent == self:
-#             return
-#         self._world.allEntities[ent.name] = ent
-#         self.entities[ent.name] = ent
-#         ent.model.reparentTo(self.model)
-    
-#     def simulate(self):
-#         for ent in self.entities.itervalues():
-#             ent.simulate()
-    
-#     # def show(self):
-#     #     self.model.setAlphaScale(1)
-#     #     for cell in self.neighbours.itervalues():
-#     #         cell.model.setAlphaScale(0.75)
-
-#     # def hide(self):
-#     #     self.model.setAlphaScale(0.25)
-#     #     for cell in self.neighbours.itervalues():
-#     #         cell.model.setAlphaScale(0.25)
-    
-#     # def entered(self, _, __, ___):
-#     #     self.show()
-        
-#     # def left(self, _, __, ___):
-#     #     self.hide()
+    def setFocus(self, entity):
+        """
+        Make entity, normally the hero, the one that cells are streamed around.
+        """
+        self.focus = entity
+        if self.cells is not None:
+            self.cells.setFocus(entity)
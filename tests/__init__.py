@@ -0,0 +1,5 @@
+"""
+Tests for supyrdupyr.
+
+    python -m unittest discover -s tests -t .
+"""
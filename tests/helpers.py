@@ -0,0 +1,58 @@
+"""
+A headless application for the tests, on the null stand-ins of
+supyrdupyr.headless. Its world holds only logic entities, so it needs no
+meshes, collision shapes or resources.cfg.
+"""
+
+import unittest
+
+try:
+    from supyrdupyr.headless import HeadlessApplication
+    from supyrdupyr.world import World
+    from supyrdupyr.entities import LogicEntity
+except ImportError:
+    # The world still makes a Bullet physics world, which comes with python-ogre.
+    HeadlessApplication = World = object
+    available = False
+else:
+    available = True
+
+requiresOgre = unittest.skipIf(not available, "python-ogre is not installed")
+
+DT = 1.0 / 60
+
+class LogicWorld(World):
+
+    """
+    A world of count logic entities, Logic0 to Logic<count - 1>, each
+    bound to the next one's FireUser1 through OnUser1.
+    """
+
+    def __init__(self, app, count=4):
+        self.count = count
+        super(LogicWorld, self).__init__(app)
+
+    def setupWorld(self):
+        self.logicEntities = [LogicEntity(self, "Logic%d" % i, "logic") for i in xrange(self.count)]
+        for i, entity in enumerate(self.logicEntities):
+            entity.bindOutput("OnUser1", self.logicEntities[(i + 1) % self.count], "FireUser1")
+
+class LogicApplication(HeadlessApplication):
+
+    def __init__(self, **worldParams):
+        super(LogicApplication, self).__init__()
+        self.worldParams = worldParams
+
+    def setupResources(self):
+        self.shapeCache = self.createShapeCache()
+
+    def createWorld(self):
+        self.world = LogicWorld(self, **self.worldParams)
+
+def makeApp(**worldParams):
+    """
+    Set up a LogicApplication, with worldParams for its LogicWorld.
+    """
+    app = LogicApplication(**worldParams)
+    app.setup()
+    return app
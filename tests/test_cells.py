@@ -0,0 +1,94 @@
+import unittest
+
+from supyrdupyr.cells import CellGrid
+
+class Node(object):
+    def __init__(self, parent=None):
+        self.parent, self.children = parent, []
+
+    def createChildSceneNode(self, name):
+        node = Node(self)
+        self.children.append(node)
+        return node
+
+    def addChild(self, node):
+        node.parent = self
+        self.children.append(node)
+
+    def removeChild(self, node):
+        node.parent = None
+        self.children.remove(node)
+
+    def getParent(self):
+        return self.parent
+
+class Resources(object):
+    def __init__(self):
+        self.active, self.prefetched = None, set()
+
+    def activate(self, groupNames):
+        self.active = set(groupNames)
+
+    def prefetch(self, groupNames):
+        self.prefetched.update(groupNames)
+
+class App(object):
+    def __init__(self):
+        self.resources = Resources()
+
+class World(object):
+    def __init__(self):
+        self.app = App()
+        self.worldNode = Node()
+        self.resourceGroups = ["Level"]
+        self.cellResourceGroups = {}
+        self.simulatedEntities = {}
+
+class Entity(object):
+    def __init__(self, world, name):
+        self.name = name
+        self.sceneNode = world.worldNode.createChildSceneNode(name)
+        self.calls = []
+
+    def freeze(self):
+        self.calls.append("freeze")
+
+    def thaw(self):
+        self.calls.append("thaw")
+
+class CellGridTest(unittest.TestCase):
+
+    def setUp(self):
+        self.world = World()
+        self.grid = CellGrid(self.world, 10.0)
+        # Stream around cell (0, 0) without a focus entity.
+        self.grid.focusKey = (0, 0)
+        self.entity = Entity(self.world, "crate")
+
+    def test_removing_a_frozen_entity_leaves_it_frozen(self):
+        self.grid.place(self.entity, self.grid.getCell((5, 0)))
+        self.grid.removeEntity(self.entity)
+        self.assertEqual(self.entity.calls, ["freeze"])
+        self.assertTrue(self.entity.sceneNode.getParent() is self.world.worldNode)
+
+    def test_moving_thaws_only_into_active_cells(self):
+        self.grid.place(self.entity, self.grid.getCell((5, 0)))
+        self.grid.place(self.entity, self.grid.getCell((6, 0)))
+        self.assertEqual(self.entity.calls, ["freeze"])
+        self.grid.place(self.entity, self.grid.getCell((0, 0)))
+        self.assertEqual(self.entity.calls, ["freeze", "thaw"])
+        self.grid.place(self.entity, self.grid.getCell((1, 0)))
+        self.assertEqual(self.entity.calls, ["freeze", "thaw"])
+
+    def test_stream_initialises_only_active_groups(self):
+        self.world.cellResourceGroups.update({(0, 0): ["Here", "Shared"], (2, 0): ["Near", "Shared", "Level"],
+                                              (5, 0): ["Far"]})
+        for key in self.world.cellResourceGroups:
+            self.grid.getCell(key)
+        self.grid.stream((0, 0))
+        resources = self.world.app.resources
+        self.assertEqual(resources.active, set(["Level", "Here", "Shared"]))
+        self.assertEqual(resources.prefetched, set(["Near"]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+
+from tests.helpers import makeApp, requiresOgre
+
+class Body(object):
+    def __init__(self, entity):
+        self.entity = entity
+
+    def getUserData(self):
+        return self.entity
+
+class Manifold(object):
+    def __init__(self, ent1, ent2):
+        self.bodies = Body(ent1), Body(ent2)
+
+    def getNumContacts(self):
+        return 1
+
+    def getBodyAsObject0(self):
+        return self.bodies[0]
+
+    def getBodyAsObject1(self):
+        return self.bodies[1]
+
+class Dispatcher(object):
+    def __init__(self):
+        self.manifolds = []
+
+    def getNumManifolds(self):
+        return len(self.manifolds)
+
+    def getManifoldByIndexInternal(self, i):
+        return self.manifolds[i]
+
+@requiresOgre
+class ContactOrderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = makeApp()
+        world = self.world = self.app.world
+        world.physDispatcher = Dispatcher()
+        self.events = []
+        world.contactStarted = lambda ent1, ent2: self.events.append(("start", ent1.name, ent2.name))
+        world.contactEnded = lambda ent1, ent2: self.events.append(("end", ent1.name, ent2.name))
+
+    def test_events_follow_names_and_manifold_order(self):
+        world = self.world
+        logic0, logic1, logic2, logic3 = world.logicEntities[:4]
+        world.physDispatcher.manifolds = [Manifold(logic2, logic1), Manifold(logic3, logic0), Manifold(logic1, logic2)]
+        world.updateContacts()
+        self.assertEqual(self.events, [("start", "Logic1", "Logic2"), ("start", "Logic0", "Logic3")])
+
+        del self.events[:]
+        world.physDispatcher.manifolds = []
+        world.updateContacts()
+        self.assertEqual(self.events, [("end", "Logic0", "Logic3"), ("end", "Logic1", "Logic2")])
+        self.assertEqual(world.contacts, {})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+from tests import helpers
+from tests.helpers import requiresOgre
+
+if helpers.available:
+    from supyrdupyr.entities.base import compileInputHandler, ignoreInput
+
+class Entity(object):
+    def __init__(self):
+        self.calls = []
+
+    def fireOutput(self, outputName, value=None):
+        self.calls.append((outputName, value))
+
+def handler(entity, args):
+    entity.calls.append(("handler", args))
+
+@requiresOgre
+class InputHandlerTest(unittest.TestCase):
+
+    def trigger(self, entry, value):
+        entity = Entity()
+        compileInputHandler(entry)(entity, value)
+        return entity.calls
+
+    def test_function(self):
+        self.assertEqual(self.trigger(handler, 5), [("handler", 5)])
+
+    def test_function_with_args(self):
+        self.assertEqual(self.trigger((handler, [1, 2]), 5), [("handler", [5, 1, 2])])
+        self.assertEqual(self.trigger((handler, (1,)), None), [("handler", [1])])
+
+    def test_output_alias_forwards_the_value(self):
+        self.assertEqual(self.trigger("OnTrigger", 5), [("OnTrigger", 5)])
+
+    def test_output_with_args(self):
+        self.assertEqual(self.trigger(("OnTrigger", [1, 2]), 5), [("OnTrigger", [1, 2])])
+
+    def test_spec_only_input(self):
+        self.assertEqual(self.trigger(ignoreInput, 5), [])
+
+if __name__ == "__main__":
+    unittest.main()
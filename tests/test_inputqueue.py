@@ -0,0 +1,41 @@
+import unittest
+
+from supyrdupyr.inputqueue import KEY_DOWN, BUTTON_DOWN, InputQueue
+
+class Axis(object):
+    def __init__(self, abs, rel=0):
+        self.abs, self.rel = abs, rel
+
+class MouseState(object):
+    def __init__(self, x, y):
+        self.X, self.Y, self.Z = Axis(x), Axis(y), Axis(0)
+        self.buttons = 1
+
+class KeyEvent(object):
+    def __init__(self, key, text):
+        self.key, self.text = key, text
+
+class MouseEvent(object):
+    def __init__(self, state):
+        self.state = state
+
+    def get_state(self):
+        return self.state
+
+class InputQueueTest(unittest.TestCase):
+
+    def test_events_are_copied_when_queued(self):
+        queue = InputQueue()
+        key, state = KeyEvent(30, 97), MouseState(120, 45)
+        queue.pushKey(KEY_DOWN, 30, "a", key)
+        queue.pushButton(BUTTON_DOWN, 0, "mouse-left", MouseEvent(state))
+        # OIS reuses its event objects once the listener returns.
+        key.key, key.text = 31, 115
+        state.X.abs, state.buttons = 0, 0
+
+        (_, _, _, keyInput), (_, _, _, buttonInput) = queue.drain()
+        self.assertEqual((keyInput.key, keyInput.text), (30, 97))
+        self.assertEqual((buttonInput.id, buttonInput.absX, buttonInput.absY, buttonInput.buttons), (0, 120, 45, 1))
+
+if __name__ == "__main__":
+    unittest.main()
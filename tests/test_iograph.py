@@ -0,0 +1,32 @@
+import unittest
+
+from tests import helpers
+from tests.helpers import makeApp, requiresOgre
+
+if helpers.available:
+    from supyrdupyr.entities.base import LogicEntity
+
+    class Relay(LogicEntity):
+        inputHandlers = {"Trigger": "OnTrigger"}
+        inputSpec     = {"Trigger": (None, "Fire OnTrigger.")}
+        outputSpec    = {"OnTrigger": (None, "Fired when triggered.")}
+
+@requiresOgre
+class EnabledTest(unittest.TestCase):
+
+    def test_setting_enabled_recompiles_plans(self):
+        app = makeApp()
+        source, relay = LogicEntity(app.world, "Source"), Relay(app.world, "Relay")
+        source.bindOutput("OnUser1", relay, "Trigger")
+        fired = []
+        app.world.ioGraph.addWaiter(relay, "OnTrigger", fired.append)
+
+        source.fireOutput("OnUser1", 1)
+        relay.enabled = False
+        source.fireOutput("OnUser1", 2)
+        relay.enabled = True
+        source.fireOutput("OnUser1", 3)
+        self.assertEqual(fired, [1, 3])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+from supyrdupyr.messenger import Messenger
+from supyrdupyr.tags import tagMask
+
+class App(object):
+    debugLogging = False
+
+class Entity(object):
+    def __init__(self, name, tags):
+        self.name, self.tagMask = name, tagMask(tags.split())
+
+class NoScan(dict):
+    """
+    A bucket dict that fails if the match walks all of it.
+    """
+    def __iter__(self):
+        raise AssertionError("walked every subscribed tag")
+    iteritems = itervalues = iterkeys = items = values = keys = __iter__
+
+class SendTest(unittest.TestCase):
+
+    def test_extra_arguments_follow_the_send_arguments(self):
+        messenger, calls = Messenger(App()), []
+        def listener(*args, **kwargs):
+            calls.append((args, kwargs))
+        messenger.accept("plain", listener)
+        messenger.accept("extra", listener, ["e"])
+        messenger.accept("keyword", listener, ["e"], {"k": 1})
+        messenger.send("plain", [1, 2])
+        messenger.send("extra", [1, 2])
+        messenger.send("keyword", (1,), {"k": 0, "s": 2})
+        messenger.send("keyword")
+        self.assertEqual(calls, [((1, 2), {}), ((1, 2, "e"), {}),
+                                 ((1, "e"), {"k": 1, "s": 2}), (("e",), {"k": 1})])
+
+class EntityEventTest(unittest.TestCase):
+
+    def setUp(self):
+        self.messenger = Messenger(App())
+        self.calls = []
+
+    def listen(self, pattern, label, priority=10):
+        self.messenger.accept(pattern, lambda *entities: self.calls.append(label), priority=priority)
+
+    def test_tag_slots_are_looked_up_by_the_entitys_tags(self):
+        self.listen("hit: [hero] [*]", "hero")
+        self.listen("hit: [*] [*]", "any", priority=5)
+        self.listen("hit: [crate] [*]", "crate")
+        self.listen("hit: [hero] 'Ground'", "ground")
+        for i in xrange(50):
+            self.listen("hit: [other%d] [*]" % i, "other")
+        index = self.messenger.entityIndex["hit"]
+        index.byTag = NoScan(index.byTag)
+
+        hero, ground = Entity("Hero", "hero physics"), Entity("Ground", "terrain")
+        self.messenger.sendEntityEvent("hit", (hero, ground))
+        self.assertEqual(self.calls, ["any", "hero", "ground"])
+
+        del self.calls[:]
+        self.messenger.sendEntityEvent("hit", (ground, hero))
+        self.assertEqual(self.calls, ["any"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+from StringIO import StringIO
+
+from supyrdupyr.inputqueue import (KEY_DOWN, BUTTON_DOWN, BUTTON_UP, MOTION, MOTION_EVENT, KeyInput, ButtonInput,
+                                   MouseMotion, dispatchInput)
+from supyrdupyr.replay import (HEADER, MAGIC, RECORD_END, RECORD_FRAME, RECORD_STRING, InputLog, InputRecorder,
+                               replay, worldDigest)
+from supyrdupyr.savegame import DOUBLE
+from tests import helpers
+from tests.helpers import DT, requiresOgre
+
+def makeApp():
+    app = helpers.makeApp(count=8)
+    # A key that changes the saved state, so replaying it matters.
+    app.messenger.accept("k", lambda source, evt: app.world.logicEntities[3].disable(None))
+    return app
+
+class Recording(StringIO):
+    """
+    Keeps its value when the recorder closes it.
+    """
+    def close(self):
+        pass
+
+class FrameFormatTest(unittest.TestCase):
+
+    def test_events_round_trip(self):
+        motion = MouseMotion()
+        motion.x, motion.y, motion.z, motion.absX, motion.absY, motion.absZ = -3, 4, 120, 317, 200, -120
+        stream = Recording()
+        recorder = InputRecorder(stream, 60.0)
+        recorder.writeFrame(DT, [(KEY_DOWN, 30, "a", KeyInput(30, 97)),
+                                 (BUTTON_DOWN, 0, "mouse1", ButtonInput(0, 320, 240, -5, 1)),
+                                 (MOTION, 0, MOTION_EVENT, motion),
+                                 (BUTTON_UP, 1, "mouse2", ButtonInput(1, 0, 7, 0, 5))])
+        recorder.close()
+        (frame,) = list(InputLog(StringIO(stream.getvalue())))
+        key, down, moved, up = frame.events
+        self.assertEqual((key[:3], key[3].key, key[3].text), ((KEY_DOWN, 30, "a"), 30, 97))
+        self.assertEqual(down[:3], (BUTTON_DOWN, 0, "mouse1"))
+        self.assertEqual((down[3].id, down[3].absX, down[3].absY, down[3].absZ, down[3].buttons), (0, 320, 240, -5, 1))
+        self.assertEqual((up[3].id, up[3].absX, up[3].absY, up[3].absZ, up[3].buttons), (1, 0, 7, 0, 5))
+        self.assertEqual((moved[3].x, moved[3].y, moved[3].z, moved[3].absX, moved[3].absY, moved[3].absZ),
+                         (-3, 4, 120, 317, 200, -120))
+
+    def test_format_1_buttons_still_load(self):
+        frame = DOUBLE.pack(DT) + "".join(map(chr, [1, BUTTON_DOWN, 0, 0, 0]))
+        data = (HEADER.pack(MAGIC, 1, 60.0) + chr(RECORD_STRING) + chr(6) + "mouse1" +
+                chr(RECORD_FRAME) + chr(len(frame)) + frame + chr(RECORD_END) + chr(0))
+        (frame,) = list(InputLog(StringIO(data)))
+        ((kind, code, name, evt),) = frame.events
+        self.assertEqual((kind, code, name, evt.id, evt.absX, evt.buttons), (BUTTON_DOWN, 0, "mouse1", 0, 0, 0))
+
+@requiresOgre
+class RecordReplayTest(unittest.TestCase):
+
+    def record(self, closeMidFrame):
+        app = makeApp()
+        stream = Recording()
+        recorder = InputRecorder(stream, app.world.tickRate)
+        for frame in xrange(30):
+            app.root.renderOneFrame(DT)
+            events = [(KEY_DOWN, 37, "k", KeyInput(37, 107))] if frame == 10 else []
+            recorder.writeFrame(app.world.frameTime, events)
+            dispatchInput(events, app.actions, app.messenger, self)
+        if closeMidFrame:
+            # The window closed after the world update, before input was dispatched.
+            app.root.renderOneFrame(DT)
+        recorder.close(app.world)
+        return app, stream.getvalue()
+
+    def replay(self, data):
+        log = InputLog(StringIO(data))
+        frames = list(log)
+        app = makeApp()
+        times = replay(app, frames)
+        return log, frames, app, times
+
+    def test_round_trip(self):
+        recorded, data = self.record(False)
+        log, frames, app, times = self.replay(data)
+        self.assertEqual(len(frames), 30)
+        self.assertEqual(len(times), 30)
+        self.assertEqual(log.digest, worldDigest(recorded.world))
+        self.assertEqual(worldDigest(app.world), log.digest)
+        self.assertFalse(app.world.logicEntities[3].enabled)
+
+    def test_round_trip_closed_mid_frame(self):
+        recorded, data = self.record(True)
+        log, frames, app, times = self.replay(data)
+        self.assertEqual(len(frames), 31)
+        self.assertEqual(frames[-1].events, [])
+        self.assertEqual(worldDigest(app.world), log.digest)
+
+if __name__ == "__main__":
+    unittest.main()
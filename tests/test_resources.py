@@ -0,0 +1,46 @@
+import unittest
+
+from tests import helpers
+from tests.helpers import requiresOgre
+
+if helpers.available:
+    from supyrdupyr.headless import NullResourceLoader
+
+LOCATIONS = [("Startup", "FileSystem", "media/startup"),
+             ("LevelA", "FileSystem", "media/a"),
+             ("LevelB", "FileSystem", "media/b")]
+
+@requiresOgre
+class ActivateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loader = NullResourceLoader(None, LOCATIONS)
+        self.loader.pin(["Startup"])
+
+    def test_dropped_group_is_released(self):
+        loader = self.loader
+        loader.activate(["LevelA"], load=True)
+        self.assertEqual(loader.initialised, set(["Startup", "LevelA"]))
+        self.assertEqual(loader.loaded, set(["LevelA"]))
+
+        loader.activate(["LevelB"])
+        self.assertEqual(loader.initialised, set(["Startup", "LevelB"]))
+        self.assertEqual(loader.loaded, set())
+
+    def test_initialised_but_unloaded_group_is_released(self):
+        loader = self.loader
+        loader.require(["LevelA"])
+        loader.activate([])
+        self.assertEqual(loader.initialised, set(["Startup"]))
+
+    def test_released_group_is_initialised_again(self):
+        initialising = []
+        loader = self.loader
+        loader.initialiseGroup = initialising.append
+        loader.activate(["LevelA"])
+        loader.activate(["LevelB"])
+        loader.activate(["LevelA"])
+        self.assertEqual(initialising, ["LevelA", "LevelB", "LevelA"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+
+from supyrdupyr.replay import worldDigest
+from supyrdupyr.savegame import EntityState, SaveGame, SaveGameError, restoreWorld
+from tests.helpers import makeApp, requiresOgre
+
+@requiresOgre
+class RestoreWorldTest(unittest.TestCase):
+
+    def test_spawned_entities_are_recreated(self):
+        from supyrdupyr.entities.logic import TimerEntity
+        app = makeApp()
+        timer = TimerEntity(app.world, "SpawnedTimer", 0.5, "spawned")
+        timer.bindOutput("OnTimer", app.world.logicEntities[0], "FireUser1")
+        timer.enable(None)
+        sg = SaveGame.fromWorld(app.world)
+
+        restored = makeApp()
+        sg.applyTo(restored.world)
+        timer = restored.world.entities["SpawnedTimer"]
+        self.assertTrue(isinstance(timer, TimerEntity))
+        self.assertEqual(timer.interval, 0.5)
+        self.assertTrue(timer.enabled)
+        self.assertTrue(timer.hasTag("spawned"))
+        self.assertTrue(timer.timerCall is not None)
+        self.assertEqual(worldDigest(restored.world), worldDigest(app.world))
+
+    def test_entity_without_factory_raises(self):
+        app = makeApp()
+        state = EntityState("supyrdupyr.entities.base.PhysicsEntity", "Crate", "all * physics")
+        self.assertRaises(SaveGameError, restoreWorld, app.world, [state])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import os.path
+import shutil
+import tempfile
+import unittest
+
+from supyrdupyr.savegame import BackgroundSaver, EntityState, SaveSlot
+
+class Counter(object):
+    captures = 0
+
+    def __init__(self, name):
+        self.name, self.value = name, 0
+
+    def getSaveState(self):
+        Counter.captures += 1
+        return EntityState("Counter", self.name, data=dict(value=self.value))
+
+class World(object):
+    def __init__(self, count):
+        self.time = 0.0
+        self.entities = dict(("counter%d" % i, Counter("counter%d" % i)) for i in xrange(count))
+        self.dirtyEntities = set()
+        self.saver = None
+
+    def markDirty(self, entity):
+        if self.saver is not None:
+            self.saver.entityChanging(entity.name)
+        self.dirtyEntities.add(entity.name)
+
+    def setValue(self, name, value):
+        entity = self.entities[name]
+        self.markDirty(entity)
+        entity.value = value
+
+class BackgroundSaverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def states(self, directory=None):
+        slot = SaveSlot(directory or self.directory)
+        return dict((state.name, state) for state in slot.load().entities)
+
+    def makeSaver(self, world, directory=None, **kwargs):
+        world.saver = BackgroundSaver(world, SaveSlot(directory or self.directory), **kwargs)
+        return world.saver
+
+    def test_capture_work_per_frame_is_bounded(self):
+        for count in (1000, 8000):
+            world = World(count)
+            directory = os.path.join(self.directory, str(count))
+            saver = self.makeSaver(world, directory, captureBudget=100)
+            Counter.captures = 0
+            saver.quicksave()
+            self.assertEqual(Counter.captures, 0)
+            frames = 0
+            while saver.capturing:
+                Counter.captures = 0
+                saver.update(1.0 / 60)
+                self.assertTrue(Counter.captures <= 100)
+                frames += 1
+            self.assertEqual(frames, count // 100)
+            saver.flush()
+            self.assertEqual(len(self.states(directory)), count)
+
+    def test_capture_keeps_the_state_the_save_started_with(self):
+        world = World(1200)
+        saver = self.makeSaver(world, captureBudget=100)
+        saver.quicksave()
+        frame = 0
+        while saver.capturing:
+            frame += 1
+            for i in xrange(0, 1200, 7):
+                world.setValue("counter%d" % i, frame)
+            saver.update(1.0 / 60)
+        self.assertTrue(frame > 1)
+        saver.flush()
+        self.assertEqual(set(state.data["value"] for state in self.states().itervalues()), set([0]))
+
+        saver.quicksave()
+        saver.flush()
+        states = self.states()
+        self.assertEqual(states["counter7"].data["value"], frame)
+        self.assertEqual(states["counter8"].data["value"], 0)
+
+    def test_delta_holds_dirty_entities(self):
+        world = World(10)
+        saver = self.makeSaver(world)
+        saver.quicksave()
+        saver.flush()
+        world.setValue("counter3", 7)
+        world.markDirty(world.entities["counter4"])
+        del world.entities["counter4"]
+        saver.quicksave()
+        saver.flush()
+        states = self.states()
+        self.assertEqual(states["counter3"].data["value"], 7)
+        self.assertTrue(states["counter4"].killed)
+        self.assertEqual(states["counter5"].data["value"], 0)
+        self.assertFalse(world.dirtyEntities)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+
+from supyrdupyr.scheduler import Scheduler
+from tests.helpers import DT, makeApp, requiresOgre
+
+class CancelWhileRunningTest(unittest.TestCase):
+
+    def test_cancel_compacting_during_run(self):
+        scheduler = Scheduler()
+        calls = []
+        later = [scheduler.scheduleAt(5.0, calls.append, "later%d" % i) for i in xrange(4)]
+
+        def cancelAll():
+            # Enough cancels to compact the heap while run() is popping from it.
+            for call in later:
+                scheduler.cancel(call)
+            scheduler.schedule(0.0, calls.append, "now")
+
+        scheduler.scheduleAt(1.0, cancelAll)
+        scheduler.run(1.0)
+        self.assertEqual(calls, ["now"])
+        self.assertEqual(scheduler.cancelledCount, 0)
+        self.assertEqual(len(scheduler), 0)
+        self.assertEqual(scheduler.nextTime(), None)
+
+        scheduler.run(10.0)
+        self.assertEqual(calls, ["now"])
+        self.assertEqual(len(scheduler), 0)
+
+    def test_cancel_call_that_already_ran(self):
+        scheduler = Scheduler()
+        call = scheduler.schedule(1.0, lambda: None)
+        scheduler.run(1.0)
+        scheduler.cancel(call)
+        self.assertEqual(scheduler.cancelledCount, 0)
+        self.assertEqual(len(scheduler), 0)
+
+@requiresOgre
+class WorldSchedulingTest(unittest.TestCase):
+
+    def test_delays_scheduled_mid_tick_start_from_this_tick(self):
+        world = makeApp().world
+        tickLength = world.tickLength
+        scheduled, fired = [], []
+        stepPhysics = world.stepPhysics
+
+        def step(dt):
+            # Schedule from the physics phase, before the scheduler runs.
+            stepPhysics(dt)
+            if not scheduled:
+                scheduled.append(world.time)
+                world.scheduler.schedule(3 * tickLength, lambda: fired.append(world.time))
+        world.stepPhysics = step
+
+        for frame in xrange(10):
+            world.app.root.renderOneFrame(DT)
+        self.assertEqual(len(fired), 1)
+        self.assertAlmostEqual(fired[0], scheduled[0] + 3 * tickLength)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+
+from supyrdupyr.savegame import EntityState, restoreWorld
+from supyrdupyr.scripts import wait, waitOutput
+from tests.helpers import makeApp, requiresOgre
+
+class Entity(object):
+    name, outputSpec = "entity", {"OnUser1": (None, "")}
+
+class WaitOutputTest(unittest.TestCase):
+
+    def test_waiting_for_a_missing_output_raises(self):
+        self.assertRaises(ValueError, waitOutput, Entity(), "OnMissing")
+
+@requiresOgre
+class ScriptTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = makeApp()
+        self.entity = self.app.world.logicEntities[0]
+
+    def test_killing_through_the_world_stops_scripts(self):
+        steps = []
+        def script():
+            yield wait(1.0)
+            steps.append("woke")
+        running = self.entity.runScript(script())
+        scheduled = len(self.app.world.scheduler)
+        restoreWorld(self.app.world, [EntityState(None, self.entity.name, enabled=False, killed=True)])
+        self.assertFalse(running.running)
+        self.assertEqual(len(self.app.world.scheduler), scheduled - 1)
+        self.assertEqual(steps, [])
+
+if __name__ == "__main__":
+    unittest.main()
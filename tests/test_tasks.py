@@ -0,0 +1,20 @@
+import unittest
+
+from tests.helpers import DT, makeApp, requiresOgre
+
+@requiresOgre
+class TaskOrderTest(unittest.TestCase):
+
+    def test_tasks_run_after_the_world_update(self):
+        app = makeApp()
+        seen = []
+        def record(task):
+            seen.append(app.world.frameCount)
+            return task.cont
+        app.taskMgr.add(record, "record")
+        for frame in xrange(3):
+            app.root.renderOneFrame(DT)
+        self.assertEqual(seen, [1, 2, 3])
+
+if __name__ == "__main__":
+    unittest.main()
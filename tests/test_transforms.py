@@ -0,0 +1,128 @@
+import unittest
+
+from supyrdupyr.transforms import TransformBuffer
+
+class Vector(object):
+    def __init__(self, *values):
+        self.values = values
+
+    def x(self):
+        return self.values[0]
+
+    def y(self):
+        return self.values[1]
+
+    def z(self):
+        return self.values[2]
+
+    def w(self):
+        return self.values[3]
+
+class Transform(object):
+    def __init__(self, position):
+        self.origin, self.rotation = Vector(*position), Vector(0.0, 0.0, 0.0, 1.0)
+
+    def getOrigin(self):
+        return self.origin
+
+    def getRotation(self):
+        return self.rotation
+
+class Body(object):
+    polls = 0
+
+    def __init__(self, position):
+        self.transform = Transform(position)
+        self.active = False
+
+    def getWorldTransform(self):
+        return self.transform
+
+    def isActive(self):
+        Body.polls += 1
+        return self.active
+
+class MotionState(object):
+    flagsMoves = True
+
+    def __init__(self, body):
+        self.body = body
+
+    def step(self, position):
+        # What Bullet does for an awake body.
+        self.body.transform = Transform(position)
+        if self.buffer is not None:
+            self.buffer.bodyMoved(self.slot, self.body.transform.origin, self.body.transform.rotation)
+
+class Node(object):
+    def setPosition(self, x, y, z):
+        self.position = (x, y, z)
+
+    def setOrientation(self, w, x, y, z):
+        pass
+
+class Entity(object):
+    def __init__(self, position, flagged=True):
+        self.physBody = Body(position)
+        self.sceneNode = Node()
+        if flagged:
+            self.motionState = MotionState(self.physBody)
+
+class TransformBufferTest(unittest.TestCase):
+
+    def test_sleeping_flagged_bodies_cost_nothing(self):
+        buffer = TransformBuffer()
+        entities = [Entity((i, 0.0, 0.0)) for i in xrange(1000)]
+        for entity in entities:
+            buffer.add(entity)
+        Body.polls = 0
+        self.assertEqual(buffer.capture(), [])
+        entities[10].motionState.step((10.0, 5.0, 0.0))
+        self.assertEqual(buffer.capture(), [entities[10]])
+        self.assertEqual(Body.polls, 0)
+        self.assertEqual(buffer.position(entities[10]), (10.0, 5.0, 0.0))
+
+    def test_polled_bodies(self):
+        buffer = TransformBuffer()
+        flagged, ghost = Entity((0.0, 0.0, 0.0)), Entity((1.0, 0.0, 0.0), flagged=False)
+        buffer.add(flagged)
+        buffer.add(ghost)
+        Body.polls = 0
+        ghost.physBody.active = True
+        ghost.physBody.transform = Transform((1.0, 2.0, 0.0))
+        self.assertEqual(buffer.capture(), [ghost])
+        self.assertEqual(Body.polls, 1)
+        self.assertEqual(buffer.position(ghost), (1.0, 2.0, 0.0))
+
+    def test_sync_interpolates_between_ticks(self):
+        buffer = TransformBuffer()
+        entity = Entity((0.0, 0.0, 0.0))
+        buffer.add(entity)
+        buffer.sync(0.0)
+        entity.motionState.step((2.0, 0.0, 0.0))
+        entity.motionState.step((4.0, 0.0, 0.0))
+        buffer.capture()
+        self.assertEqual(buffer.previousTransform(entity)[:3], (0.0, 0.0, 0.0))
+        buffer.sync(0.5)
+        self.assertEqual(entity.sceneNode.position, (2.0, 0.0, 0.0))
+        buffer.capture()
+        buffer.sync(0.5)
+        self.assertEqual(entity.sceneNode.position, (4.0, 0.0, 0.0))
+
+    def test_remove_moves_the_last_slot(self):
+        buffer = TransformBuffer()
+        entities = [Entity((i, 0.0, 0.0)) for i in xrange(3)]
+        for entity in entities:
+            buffer.add(entity)
+        entities[2].motionState.step((9.0, 0.0, 0.0))
+        buffer.remove(entities[0])
+        self.assertTrue(entities[0].motionState.buffer is None)
+        self.assertEqual(entities[2].motionState.slot, 0)
+        self.assertEqual(buffer.capture(), [entities[2]])
+        entities[2].motionState.step((8.0, 0.0, 0.0))
+        self.assertEqual(buffer.capture(), [entities[2]])
+        self.assertEqual(buffer.position(entities[2]), (8.0, 0.0, 0.0))
+        self.assertEqual(buffer.position(entities[1]), (1.0, 0.0, 0.0))
+
+if __name__ == "__main__":
+    unittest.main()